@@ -1,24 +1,126 @@
-from django.contrib import admin
+from decimal import Decimal
+
+from django import forms
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from django.utils.safestring import mark_safe
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.db import models
-from .models import Sweet
+from django.db import connection, models
+from django.db.models.functions import Greatest, Least, Round
+from .models import MAX_PRICE, InventorySummary, Sweet
+from .stats import LOW_STOCK_THRESHOLD, inventory_stats
+from .summary import summary_stats
+from .bulk import update_queryset
+
+
+class PriceAdjustmentForm(forms.Form):
+    """Intermediate form of the "Adjust price" action."""
+    mode = forms.ChoiceField(
+        choices=(('percent', 'By percentage'), ('amount', 'By fixed amount (₹)')),
+        initial='percent'
+    )
+    value = forms.DecimalField(
+        max_digits=10, decimal_places=2,
+        help_text='Use a negative value to lower prices, e.g. -5.'
+    )
+    
+    def clean(self):
+        data = super().clean()
+        value = data.get('value')
+        if value == 0:
+            raise forms.ValidationError('The change cannot be zero.')
+        if data.get('mode') == 'percent' and value is not None and not -100 < value <= 1000:
+            raise forms.ValidationError('The percentage must be above -100 and at most 1000.')
+        return data
+    
+    def updates(self):
+        """UPDATE values: computed and rounded to 2 places by the database."""
+        value = self.cleaned_data['value']
+        if self.cleaned_data['mode'] == 'percent':
+            price = Round(models.F('price') * models.Value((100 + value) / 100), 2)
+        else:
+            price = models.F('price') + models.Value(value)
+        # Keep prices within the column and the price_positive constraint
+        return {'price': Greatest(Least(price, models.Value(MAX_PRICE)), models.Value(Decimal('0.01')))}
+    
+    def describe(self):
+        value = self.cleaned_data['value']
+        if self.cleaned_data['mode'] == 'percent':
+            return f"Changed price by {value:+}%"
+        return f"Changed price by ₹{value:+}"
+
+
+class StockAdjustmentForm(forms.Form):
+    """Intermediate form of the "Adjust stock" action."""
+    mode = forms.ChoiceField(
+        choices=(('add', 'Add units'), ('remove', 'Remove units'), ('set', 'Set stock to')),
+        initial='add'
+    )
+    quantity = forms.IntegerField(min_value=0, max_value=10000)
+    
+    def updates(self):
+        quantity = self.cleaned_data['quantity']
+        mode = self.cleaned_data['mode']
+        if mode == 'add':
+            return {'quantity': models.F('quantity') + quantity}
+        if mode == 'remove':
+            return {'quantity': Greatest(models.F('quantity') - quantity, 0)}
+        return {'quantity': quantity}
+    
+    def describe(self):
+        quantity = self.cleaned_data['quantity']
+        return {
+            'add': f"Added {quantity} unit(s)",
+            'remove': f"Removed up to {quantity} unit(s)",
+            'set': f"Set stock to {quantity}",
+        }[self.cleaned_data['mode']]
+
+
+def summary_counts(request):
+    """
+    {category: {stock bucket: count}} for the filter sidebar, read once per
+    request from InventorySummary (at most eight rows) instead of COUNT
+    queries over Sweet.
+    """
+    if not hasattr(request, '_sweet_summary_counts'):
+        request._sweet_summary_counts = {
+            row['category']: row for row in InventorySummary.objects.filter(sweet_count__gt=0).values(
+                'category', 'sweet_count', 'in_stock', 'low_stock', 'out_of_stock'
+            )
+        }
+    return request._sweet_summary_counts
+
 
 class StockFilter(admin.SimpleListFilter):
     title = 'Stock Status'
     parameter_name = 'stock'
     
     def lookups(self, request, model_admin):
-        return (
-            ('in_stock', 'In Stock'),
-            ('low_stock', 'Low Stock (<10)'),
-            ('out_of_stock', 'Out of Stock'),
-        )
+        # Counts follow the selected category, if any
+        category = request.GET.get(CategoryFilter.parameter_name)
+        rows = [
+            row for name, row in summary_counts(request).items()
+            if not category or name == category
+        ]
+        return [
+            (value, f"{label} ({sum(row[value] for row in rows)})")
+            for value, label in (
+                ('in_stock', 'In Stock'),
+                ('low_stock', f'Low Stock (<={LOW_STOCK_THRESHOLD})'),
+                ('out_of_stock', 'Out of Stock'),
+            )
+        ]
     
     def queryset(self, request, queryset):
         if self.value() == 'in_stock':
-            return queryset.filter(quantity__gt=10)
+            return queryset.filter(quantity__gt=LOW_STOCK_THRESHOLD)
         if self.value() == 'low_stock':
-            return queryset.filter(quantity__range=(1, 10))
+            return queryset.filter(quantity__range=(1, LOW_STOCK_THRESHOLD))
         if self.value() == 'out_of_stock':
             return queryset.filter(quantity=0)
 
@@ -27,13 +129,86 @@ class CategoryFilter(admin.SimpleListFilter):
     parameter_name = 'category'
     
     def lookups(self, request, model_admin):
-        categories = Sweet.objects.values_list('category', flat=True).distinct()
-        return [(cat, cat.title()) for cat in categories]
+        # Counts follow the selected stock status, if any
+        stock = request.GET.get(StockFilter.parameter_name)
+        if stock not in ('in_stock', 'low_stock', 'out_of_stock'):
+            stock = 'sweet_count'
+        return [
+            (category, f"{category.title()} ({row[stock]})")
+            for category, row in sorted(summary_counts(request).items())
+        ]
     
     def queryset(self, request, queryset):
         if self.value():
             return queryset.filter(category=self.value())
 
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Change list paginator that avoids COUNT(*) over a large table.
+    
+    The unfiltered list takes its total from InventorySummary. Filtered
+    lists are counted while the table has at most ADMIN_EXACT_COUNT_LIMIT
+    sweets; above that PostgreSQL's planner estimate is used (other
+    backends keep counting).
+    """
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            if connection.vendor != 'postgresql' or \
+                    summary_total() <= getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return super().count
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+        return summary_total()
+
+
+def summary_total():
+    return InventorySummary.objects.aggregate(total=models.Sum('sweet_count'))['total'] or 0
+
+
+# Display HTML that does not depend on the row is built once
+CATEGORY_COLORS = {
+    'chocolate': 'purple',
+    'candy': 'pink',
+    'cake': 'orange',
+    'cookie': 'brown',
+    'dessert': 'blue',
+    'indian': 'red',
+}
+
+BADGE_HTML = (
+    '<span style="background-color: {}; color: white; padding: 3px 8px; '
+    'border-radius: 12px; font-size: 12px;">{}</span>'
+)
+
+CATEGORY_BADGES = {
+    category: format_html(BADGE_HTML, CATEGORY_COLORS.get(category, 'gray'), category.title())
+    for category in Sweet.Category.values
+}
+
+QUANTITY_BAR_HTML = (
+    '<div style="width: 100px; background-color: #e0e0e0; border-radius: 3px; height: 20px;">'
+    '<div style="width: {}%; background-color: {}; height: 100%; border-radius: 3px; '
+    'text-align: center; color: white; font-size: 12px; line-height: 20px;">{}</div></div>'
+)
+
+AVAILABLE_ICON = mark_safe('<span style="color: green; font-size: 18px;" title="In Stock">✓</span>')
+UNAVAILABLE_ICON = mark_safe('<span style="color: red; font-size: 18px;" title="Out of Stock">✗</span>')
+
+ACTIONS_HTML = (
+    '<div style="display: flex; gap: 5px;">'
+    '<a href="/admin/api/sweet/{0}/purchase/" style="background: #4CAF50; color: white; padding: 2px 8px; '
+    'border-radius: 3px; text-decoration: none; font-size: 12px;">Purchase</a>'
+    '<a href="/admin/api/sweet/{0}/restock/" style="background: #2196F3; color: white; padding: 2px 8px; '
+    'border-radius: 3px; text-decoration: none; font-size: 12px;">Restock</a>'
+    '</div>'
+)
+
 @admin.register(Sweet)
 class SweetAdmin(admin.ModelAdmin):
     # Display fields in list view
@@ -65,6 +240,10 @@ class SweetAdmin(admin.ModelAdmin):
     # Items per page
     list_per_page = 25
     
+    # No COUNT(*) over the whole table on every page (see EstimatedCountPaginator)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
     # Default ordering
     ordering = ('-created_at',)
     
@@ -100,93 +279,51 @@ class SweetAdmin(admin.ModelAdmin):
     name_with_link.admin_order_field = 'name'
     
     def category_badge(self, obj):
-        color_map = {
-            'chocolate': 'purple',
-            'candy': 'pink',
-            'cake': 'orange',
-            'cookie': 'brown',
-            'dessert': 'blue',
-            'indian': 'red',
-        }
-        color = color_map.get(obj.category, 'gray')
-        return format_html(
-            '<span style="background-color: {}; color: white; padding: 3px 8px; '
-            'border-radius: 12px; font-size: 12px;">{}</span>',
-            color, obj.category.title()
-        )
+        badge = CATEGORY_BADGES.get(obj.category)
+        if badge is None:
+            badge = format_html(BADGE_HTML, 'gray', obj.category.title())
+        return badge
     category_badge.short_description = 'Category'
+    category_badge.admin_order_field = 'category'
     
     def price_display(self, obj):
-        return format_html('<span style="font-weight: bold;">₹{:.2f}</span>', obj.price)
+        return format_html('<span style="font-weight: bold;">₹{}</span>', f'{obj.price:.2f}')
     price_display.short_description = 'Price'
     price_display.admin_order_field = 'price'
     
     def quantity_bar(self, obj):
-        max_quantity = 100  # Assuming 100 is max for visualization
-        percentage = min(100, (obj.quantity / max_quantity) * 100) if max_quantity > 0 else 0
-        
-        if obj.quantity == 0:
+        # 100 units fill the bar
+        quantity = obj.quantity
+        if quantity == 0:
             color = '#ff4444'
-        elif obj.quantity <= 10:
+        elif quantity <= LOW_STOCK_THRESHOLD:
             color = '#ffaa00'
         else:
             color = '#00c851'
-        
-        bar_html = f'''
-        <div style="width: 100px; background-color: #e0e0e0; border-radius: 3px; height: 20px;">
-            <div style="width: {percentage}%; background-color: {color}; height: 100%; 
-                      border-radius: 3px; text-align: center; color: white; font-size: 12px; 
-                      line-height: 20px;">
-                {obj.quantity}
-            </div>
-        </div>
-        '''
-        return format_html(bar_html)
+        return format_html(QUANTITY_BAR_HTML, min(100, quantity), color, quantity)
     quantity_bar.short_description = 'Quantity'
+    quantity_bar.admin_order_field = 'quantity'
     
     def is_available_icon(self, obj):
-        if obj.is_available():
-            return format_html(
-                '<span style="color: green; font-size: 18px;" title="In Stock">✓</span>'
-            )
-        else:
-            return format_html(
-                '<span style="color: red; font-size: 18px;" title="Out of Stock">✗</span>'
-            )
+        return AVAILABLE_ICON if obj.is_available else UNAVAILABLE_ICON
     is_available_icon.short_description = 'Stock'
     
     def total_value(self, obj):
-        total = obj.price * obj.quantity
+        # price * quantity annotated by get_queryset()
+        total = obj.total_value_calc
         if total > 1000:
-            color = 'green'
-            weight = 'bold'
-        else:
-            color = 'black'
-            weight = 'normal'
-        return format_html(
-            '<span style="color: {}; font-weight: {};">₹{:.2f}</span>',
-            color, weight, total
-        )
+            return format_html('<span style="color: green; font-weight: bold;">₹{}</span>', f'{total:.2f}')
+        return format_html('<span style="color: black; font-weight: normal;">₹{}</span>', f'{total:.2f}')
     total_value.short_description = 'Total Value'
+    total_value.admin_order_field = 'total_value_calc'
     
     def created_at_short(self, obj):
         return obj.created_at.strftime("%b %d, %Y")
     created_at_short.short_description = 'Added On'
+    created_at_short.admin_order_field = 'created_at'
     
     def actions_column(self, obj):
-        purchase_url = f"/admin/api/sweet/{obj.id}/purchase/"
-        restock_url = f"/admin/api/sweet/{obj.id}/restock/"
-        return format_html(
-            '''
-            <div style="display: flex; gap: 5px;">
-                <a href="{}" style="background: #4CAF50; color: white; padding: 2px 8px; 
-                   border-radius: 3px; text-decoration: none; font-size: 12px;">Purchase</a>
-                <a href="{}" style="background: #2196F3; color: white; padding: 2px 8px; 
-                   border-radius: 3px; text-decoration: none; font-size: 12px;">Restock</a>
-            </div>
-            ''',
-            purchase_url, restock_url
-        )
+        return format_html(ACTIONS_HTML, obj.id)
     actions_column.short_description = 'Actions'
     
     # Readonly field methods
@@ -209,55 +346,97 @@ class SweetAdmin(admin.ModelAdmin):
         return f"{days} days ago"
     days_since_created.short_description = 'Age'
     
-    # Custom actions
-    actions = ['restock_50', 'restock_100', 'clear_stock', 'increase_price_10_percent']
+    # Custom actions: each is one set-based UPDATE (api.bulk.update_queryset)
+    # with a single summary/alert event for the whole selection
+    actions = [
+        'adjust_price', 'adjust_stock', 'restock_50', 'restock_100',
+        'clear_stock', 'increase_price_10_percent',
+    ]
+    
+    def bulk_update(self, request, queryset, message, level=messages.SUCCESS, **updates):
+        changed = update_queryset(queryset, **updates)
+        self.message_user(request, f"{message} for {len(changed)} item(s).", level=level)
+    
+    def adjustment_action(self, request, queryset, form_class, title):
+        """
+        Ask for the adjustment on an intermediate page, then apply it to the
+        selection (every matching row with "select all").
+        """
+        form = form_class(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            self.bulk_update(request, queryset, form.describe(), **form.updates())
+            return None
+        
+        select_across = request.POST.get('select_across') == '1'
+        selected = request.POST.getlist(ACTION_CHECKBOX_NAME)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'action': request.POST.get('action'),
+            'select_across': select_across,
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            # With "select all" one id is enough to route the POST back here
+            'selected': selected[:1] if select_across else selected,
+            'count': queryset.count() if select_across else len(selected),
+        }
+        return TemplateResponse(request, 'admin/api/sweet/adjust_selected.html', context)
+    
+    def adjust_price(self, request, queryset):
+        return self.adjustment_action(request, queryset, PriceAdjustmentForm, 'Adjust price')
+    adjust_price.short_description = "💰 Adjust price…"
+    
+    def adjust_stock(self, request, queryset):
+        return self.adjustment_action(request, queryset, StockAdjustmentForm, 'Adjust stock')
+    adjust_stock.short_description = "📦 Adjust stock…"
     
     def restock_50(self, request, queryset):
-        updated = queryset.update(quantity=models.F('quantity') + 50)
-        self.message_user(
-            request, 
-            f"Successfully restocked {updated} item(s) by 50 units each.",
-            level='success'
-        )
+        self.bulk_update(request, queryset, "Restocked 50 units", quantity=models.F('quantity') + 50)
     restock_50.short_description = "➕ Restock 50 units"
     
     def restock_100(self, request, queryset):
-        updated = queryset.update(quantity=models.F('quantity') + 100)
-        self.message_user(
-            request, 
-            f"Successfully restocked {updated} item(s) by 100 units each.",
-            level='success'
-        )
+        self.bulk_update(request, queryset, "Restocked 100 units", quantity=models.F('quantity') + 100)
     restock_100.short_description = "➕➕ Restock 100 units"
     
     def clear_stock(self, request, queryset):
-        updated = queryset.update(quantity=0)
-        self.message_user(
-            request, 
-            f"Cleared stock for {updated} item(s).",
-            level='warning'
-        )
+        self.bulk_update(request, queryset, "Cleared stock", level=messages.WARNING, quantity=0)
     clear_stock.short_description = "🗑️ Clear stock"
     
     def increase_price_10_percent(self, request, queryset):
-        for sweet in queryset:
-            sweet.price = sweet.price * 1.10
-            sweet.save()
-        self.message_user(
-            request,
-            f"Increased price by 10% for {queryset.count()} item(s).",
-            level='success'
-        )
-    increase_price_10_percent.short_description = "💰 Increase price 10%"
+        price = Round(models.F('price') * models.Value(Decimal('1.10')), 2)
+        self.bulk_update(request, queryset, "Increased price by 10%",
+                         price=Least(price, models.Value(MAX_PRICE)))
+    increase_price_10_percent.short_description = "💰 Increase price 10%%"  # descriptions are %-formatted
     
     # Custom admin methods
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        # Add annotations for better sorting
+        # Value column and sort (same expression as the api_sweet_value_idx index)
         return qs.annotate(
-            total_value_calc=models.F('price') * models.F('quantity')
+            total_value_calc=models.ExpressionWrapper(
+                models.F('price') * models.F('quantity'),
+                output_field=models.DecimalField(max_digits=20, decimal_places=2)
+            )
         )
     
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # Summary for the change list: the maintained totals when the list is
+        # unfiltered or only filtered by category, otherwise aggregated over
+        # the filtered rows
+        if hasattr(response, 'context_data') and 'cl' in response.context_data:
+            cl = response.context_data['cl']
+            filters = set(cl.params) - {ORDER_VAR, PAGE_VAR}
+            if not filters:
+                stats = summary_stats(top_n=0, recent=False)
+            elif filters == {CategoryFilter.parameter_name}:
+                stats = summary_stats(top_n=0, recent=False, category=cl.params['category'])
+            else:
+                stats = inventory_stats(cl.queryset, top_n=0)
+            response.context_data['inventory_stats'] = stats
+        return response
+    
     # Change list template (optional)
     change_list_template = 'admin/api/sweet/change_list.html'
 
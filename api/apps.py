@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -6,4 +7,14 @@ class ApiConfig(AppConfig):
     
     def ready(self):
         # Import signals (if you create api/signals.py)
-        import api.signals  # Optional
\ No newline at end of file
+        import api.signals  # Optional
+        
+        post_migrate.connect(install_search_index, sender=self)
+
+
+def install_search_index(sender, using, **kwargs):
+    """Restore the full-text index if a table rebuild dropped it."""
+    from django.db import connections
+    from .search import install
+    
+    install(connections[using])
@@ -0,0 +1,403 @@
+"""
+In-memory trigram index for sweet name autocomplete.
+
+Names are kept in flat arrays (one UTF-8 buffer plus offsets, ids and
+category codes) and every trigram maps to an array('I') of slot numbers,
+so a million names costs tens of megabytes rather than millions of
+Python objects. Queries never touch the database.
+
+Trigrams follow pg_trgm: each word is padded with two leading spaces and
+one trailing space. The last word of a query is left open at the end, so
+a partially typed word scores like a full prefix match; one or two typos
+still leave most trigrams in common.
+
+Names that start with the query outrank every other match, so they are
+found by a binary search over the names in sorted order. Any other query
+counts the trigrams it shares with every name over whole posting lists:
+the result is the true top `limit`, however common the trigrams.
+
+Servers load the index while starting (preload(), called from
+sweet_shop.wsgi and sweet_shop.asgi), and it then follows Sweet
+post_save / post_delete. Other processes' writes are picked up by a
+background reload once the index is AUTOCOMPLETE_MAX_AGE seconds old.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Sweet
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = Sweet.Category.values
+
+MIN_SIMILARITY = 0.3
+
+
+def normalize(text):
+    """Lowercase, strip accents and reduce to space-separated words."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def padded(text):
+    """`text` (normalized) with every word padded as for trigrams."""
+    return ''.join(f'  {word} ' for word in text.split())
+
+
+def trigrams(text, open_end=False):
+    """Set of padded trigrams of `text` (normalized)."""
+    words = text.split()
+    result = set()
+    for i, word in enumerate(words):
+        last = open_end and i == len(words) - 1
+        padded = f'  {word}' if last else f'  {word} '
+        result.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """
+    Append-only slots with tombstones; compacted when a quarter is dead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.built_at = None
+        self._building = False
+        self._pending = None
+
+    def _reset(self):
+        # Display names and their padded normalized forms, back to back
+        self._text = bytearray()
+        self._offsets = array('Q', [0])
+        self._norm = bytearray()
+        self._norm_offsets = array('Q', [0])
+        self._ids = array('q')
+        self._categories = array('B')
+        self._alive = bytearray()
+        self._postings = {}
+        self._dead = 0
+        # Slots ordered by padded normalized name, for prefix lookups, and
+        # the slots appended since that order was last brought up to date
+        self._by_name = array('I')
+        self._unsorted = []
+
+    def __len__(self):
+        return len(self._ids) - self._dead
+
+    # Storage
+
+    def _name(self, slot):
+        return self._text[self._offsets[slot]:self._offsets[slot + 1]].decode()
+
+    def _padded(self, slot):
+        return self._norm[self._norm_offsets[slot]:self._norm_offsets[slot + 1]].decode()
+
+    def _sort_key(self, slot):
+        return self._norm[self._norm_offsets[slot]:self._norm_offsets[slot + 1]]
+
+    def _sort(self):
+        # Re-sorting is mostly merging two sorted runs; doing it once the
+        # tail reaches a sixteenth of the index keeps appends cheap
+        if self._unsorted:
+            self._by_name = array('I', sorted(self._by_name + array('I', self._unsorted), key=self._sort_key))
+            self._unsorted = []
+
+    def _append(self, pk, name, category):
+        slot = len(self._ids)
+        normalized = normalize(name)
+        self._text += name.encode()
+        self._offsets.append(len(self._text))
+        self._norm += padded(normalized).encode()
+        self._norm_offsets.append(len(self._norm))
+        self._ids.append(pk)
+        self._categories.append(CATEGORIES.index(category) if category in CATEGORIES else 0)
+        self._alive.append(1)
+        self._unsorted.append(slot)
+        if len(self._unsorted) > max(1000, len(self._by_name) // 16):
+            self._sort()
+        for gram in trigrams(normalized):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('I')
+            postings.append(slot)
+
+    def _remove(self, pk):
+        # Linear search over a C array: cheaper than a pk -> slot dict
+        # for a million names; batches go through _remove_many()
+        start = 0
+        while True:
+            try:
+                slot = self._ids.index(pk, start)
+            except ValueError:
+                return
+            if self._alive[slot]:
+                self._alive[slot] = 0
+                self._dead += 1
+                return
+            start = slot + 1
+
+    def _remove_many(self, pks):
+        if len(pks) <= 8:
+            for pk in pks:
+                self._remove(pk)
+            return
+        # One pass over the ids, whatever the number of rows
+        pks = set(pks)
+        alive = self._alive
+        for slot, pk in enumerate(self._ids):
+            if pk in pks and alive[slot]:
+                alive[slot] = 0
+                self._dead += 1
+
+    def _compact(self):
+        live = [
+            (self._ids[slot], self._name(slot), CATEGORIES[self._categories[slot]])
+            for slot in range(len(self._ids)) if self._alive[slot]
+        ]
+        self._reset()
+        for row in live:
+            self._append(*row)
+        self._sort()
+
+    # Maintenance
+
+    def load(self, rows):
+        """Replace the contents with (pk, name, category) rows."""
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._append(*row)
+            self._sort()
+            self.built_at = time.monotonic()
+
+    def build(self):
+        """(Re)load from the database, replaying changes made meanwhile."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._pending = []
+        try:
+            fresh = TrigramIndex()
+            fresh.load(
+                Sweet.objects.order_by().values_list('id', 'name', 'category').iterator(chunk_size=10000)
+            )
+            with self._lock:
+                self._text, self._offsets = fresh._text, fresh._offsets
+                self._norm, self._norm_offsets = fresh._norm, fresh._norm_offsets
+                self._ids, self._categories = fresh._ids, fresh._categories
+                self._alive, self._postings = fresh._alive, fresh._postings
+                self._by_name, self._unsorted = fresh._by_name, fresh._unsorted
+                self._dead = 0
+                self._apply_many(self._pending)
+                self.built_at = time.monotonic()
+            logger.info(f"Autocomplete index loaded with {len(self)} names")
+        finally:
+            with self._lock:
+                self._building = False
+                self._pending = None
+
+    def _apply_many(self, changes):
+        # The last change to a sweet wins
+        latest = {pk: (name, category) for pk, name, category in changes}
+        self._remove_many(list(latest))
+        for pk, (name, category) in latest.items():
+            if name is not None:
+                self._append(pk, name, category)
+
+    def _change(self, changes):
+        """Apply (pk, name, category) changes; a name of None removes the sweet."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            if self.built_at is None:
+                return
+            self._apply_many(changes)
+            if self._dead > max(1000, len(self._ids) // 4):
+                self._compact()
+
+    def upsert(self, pk, name, category):
+        self._change([(pk, name, category)])
+
+    def upsert_many(self, rows):
+        """Replace the entries of (pk, name, category) rows, in one pass over the index."""
+        if rows:
+            self._change(list(rows))
+
+    def add_many(self, rows):
+        """Add (pk, name, category) rows for sweets that are new to the index."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(rows)
+            if self.built_at is None:
+                return
+            # New pks have nothing to replace, so skip _remove()'s scan
+            for row in rows:
+                self._append(*row)
+
+    def remove(self, pk):
+        self._change([(pk, None, None)])
+
+    def remove_many(self, pks):
+        if pks:
+            self._change([(pk, None, None) for pk in pks])
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def warm(self):
+        """
+        Start a background (re)load if the index is missing or older than
+        AUTOCOMPLETE_MAX_AGE. Returns immediately.
+        """
+        if self._building:
+            return
+        max_age = getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300)
+        if self.built_at is None or (max_age and time.monotonic() - self.built_at > max_age):
+            threading.Thread(target=self.build, daemon=True).start()
+
+    def memory_usage(self):
+        """Approximate bytes held by the index buffers."""
+        arrays = (self._offsets, self._norm_offsets, self._ids, self._categories, self._by_name)
+        return (
+            len(self._text) + len(self._norm) + len(self._alive)
+            + sum(a.itemsize * len(a) for a in arrays)
+            + sum(4 * len(postings) + 100 for postings in self._postings.values())
+        )
+
+    # Queries
+
+    def suggest(self, query, limit=10):
+        """
+        Top `limit` (score, pk, name, category) for `query`, best first.
+        """
+        text = normalize(query)
+        grams = trigrams(text, open_end=True)
+        if not grams:
+            return []
+
+        # A name-wide prefix match adds 1.0 to the score, a word prefix 0.5
+        name_prefix = padded(text)[:-1].encode()
+        word_prefix = ('  ' + text.split()[-1]).encode()
+        needed = max(1, math.ceil(len(grams) * MIN_SIMILARITY))
+
+        with self._lock:
+            alive, norm, offsets = self._alive, self._norm, self._norm_offsets
+            # A name starting with the query has every trigram and the
+            # name-wide bonus, which no other name can reach: with `limit`
+            # such names, the shortest are the answer
+            slots = self._prefix_matches(name_prefix)
+            if len(slots) >= limit:
+                scored = [
+                    (-2.0, offsets[slot + 1] - offsets[slot], slot)
+                    for slot in slots
+                ]
+                return self._results(heapq.nsmallest(limit, scored))
+
+            # Otherwise, shared trigrams of every name, counted over whole
+            # posting lists, so no matching name is left out however common
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            levels = {}
+            for slot, count in shared.items():
+                if count >= needed:
+                    levels.setdefault(count, []).append(slot)
+
+            # Best levels first; a level whose names cannot beat the
+            # current top `limit` even with a prefix bonus ends the search
+            # (a name prefix implies every trigram, a word prefix does not)
+            scored = []
+            for count in sorted(levels, reverse=True):
+                base = count / len(grams)
+                bonus = 1.0 if count == len(grams) else 0.5
+                if len(scored) >= limit and base + bonus < -scored[limit - 1][0]:
+                    break
+                for slot in levels[count]:
+                    if not alive[slot]:
+                        continue
+                    start, end = offsets[slot], offsets[slot + 1]
+                    score = base
+                    if norm.startswith(name_prefix, start, end):
+                        score += 1.0
+                    elif norm.find(word_prefix, start, end) != -1:
+                        score += 0.5
+                    scored.append((-score, end - start, slot))
+                scored.sort()
+                del scored[limit:]
+
+            return self._results(scored)
+
+    def _prefix_matches(self, prefix):
+        """Live slots whose padded normalized name starts with `prefix` (bytes)."""
+        by_name, key = self._by_name, self._sort_key
+        start = bisect_left(by_name, prefix, key=key)
+        # No UTF-8 byte is 0xff, so this sorts after every name with the prefix
+        end = bisect_left(by_name, prefix + b'\xff', lo=start, key=key)
+        alive, norm, offsets = self._alive, self._norm, self._norm_offsets
+        slots = [slot for slot in by_name[start:end] if alive[slot]]
+        slots += [
+            slot for slot in self._unsorted
+            if alive[slot] and norm.startswith(prefix, offsets[slot], offsets[slot + 1])
+        ]
+        return slots
+
+    def _results(self, scored):
+        return [
+            (round(-negative, 4), self._ids[slot], self._name(slot),
+             CATEGORIES[self._categories[slot]])
+            for negative, _, slot in scored
+        ]
+
+
+def suggest_categories(query, limit=3):
+    """Category labels matching `query`, as (score, value, label)."""
+    text = normalize(query)
+    grams = trigrams(text, open_end=True)
+    if not grams:
+        return []
+    matches = []
+    for value, label in Sweet.Category.choices:
+        normalized = normalize(str(label))
+        score = len(grams & trigrams(normalized)) / len(grams)
+        if normalized.startswith(text) or value.startswith(text):
+            score += 1.0
+        if score >= MIN_SIMILARITY:
+            matches.append((round(score, 4), value, str(label)))
+    matches.sort(key=lambda match: -match[0])
+    return matches[:limit]
+
+
+index = TrigramIndex()
+
+
+def preload():
+    """
+    Load the index as the server starts, so that no request waits for it
+    or falls back to the database. Off with AUTOCOMPLETE_PRELOAD = False; if
+    the database is not ready (e.g. before migrate), warm() loads it on
+    first use instead.
+    """
+    if not getattr(settings, 'AUTOCOMPLETE_PRELOAD', True):
+        return
+    try:
+        index.build()
+    except DatabaseError as e:
+        logger.warning(f"Autocomplete index not preloaded, loading on first use: {str(e)}")
@@ -0,0 +1,1066 @@
+"""
+Performance benchmarks for the inventory hot paths.
+
+Run with ``python manage.py benchmark <scenario>``. Every scenario runs
+against a throwaway database so development data is never touched.
+"""
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.db.models import Avg, Count, F, Q, Sum
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from . import summary
+from .models import Sweet
+from .response_cache import bump_version
+from .search import search
+from .stats import inventory_stats
+
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark function under `name`."""
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def scratch_database():
+    """
+    Create a temporary database for the duration of a benchmark.
+
+    SQLite gets a file (not :memory:) so that worker threads share it.
+    Per-change log lines are silenced so they do not skew timings.
+    """
+    old_name = connection.settings_dict['NAME']
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='sweet_bench_')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(
+            tmpdir, 'bench.sqlite3'
+        )
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    logging.disable(logging.WARNING)
+    try:
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmpdir:
+            os.rmdir(tmpdir)
+
+
+def run_threads(worker, threads, total):
+    """
+    Split `total` calls of `worker()` across `threads` threads.
+
+    Returns (successes, elapsed_seconds, errors).
+    """
+    per_thread = [total // threads + (1 if i < total % threads else 0) for i in range(threads)]
+    lock = threading.Lock()
+    counts = {'ok': 0, 'errors': 0}
+
+    def loop(n):
+        ok = errors = 0
+        try:
+            for _ in range(n):
+                try:
+                    if worker():
+                        ok += 1
+                except Exception:
+                    errors += 1
+        finally:
+            connection.close()
+        with lock:
+            counts['ok'] += ok
+            counts['errors'] += errors
+
+    pool = [threading.Thread(target=loop, args=(n,)) for n in per_thread]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return counts['ok'], time.perf_counter() - started, counts['errors']
+
+
+def legacy_purchase(pk, quantity):
+    """The old read-modify-write purchase: SELECT, check in Python, save()."""
+    sweet = Sweet.objects.get(pk=pk)
+    if quantity > sweet.quantity:
+        return False
+    sweet.quantity -= quantity
+    sweet.save()
+    return True
+
+
+@scenario('purchase')
+def purchase_benchmark(stdout, threads=16, purchases=3000, stock=1000, **options):
+    """
+    Fire `purchases` single-unit purchases at one hot sweet from `threads`
+    threads, for the legacy path and the atomic path, and check oversell.
+    """
+    results = {}
+    with scratch_database():
+        for label, buy in (
+            ('legacy', legacy_purchase),
+            ('atomic', lambda pk, qty: Sweet.objects.take_stock(pk, qty) is not None),
+        ):
+            sweet = Sweet.objects.create(
+                name=f'Hot Sweet {label}', category=Sweet.Category.CANDY,
+                price=Decimal('1.00'), quantity=stock
+            )
+            ok, elapsed, errors = run_threads(
+                lambda: buy(sweet.pk, 1), threads, purchases
+            )
+            sweet.refresh_from_db()
+            oversold = ok - (stock - sweet.quantity)
+            results[label] = {
+                'sold': ok,
+                'remaining': sweet.quantity,
+                'oversold': oversold,
+                'errors': errors,
+                'seconds': elapsed,
+                'purchases_per_second': purchases / elapsed,
+            }
+            stdout.write(
+                f'{label:>7}: sold={ok} remaining={sweet.quantity} '
+                f'oversold={oversold} errors={errors} '
+                f'{purchases / elapsed:,.0f} purchases/s ({elapsed:.2f}s)'
+            )
+
+    speedup = results['atomic']['purchases_per_second'] / results['legacy']['purchases_per_second']
+    stdout.write(f'speedup: {speedup:.1f}x')
+    return results
+
+
+def populate_sweets(count, batch_size=10000, seed=42):
+    """Bulk-insert `count` random sweets (bypassing save() and signals)."""
+    rng = random.Random(seed)
+    categories = Sweet.Category.values
+    existing = Sweet.objects.count()
+    for start in range(existing, existing + count, batch_size):
+        Sweet.objects.bulk_create([
+            Sweet(
+                name=f'Sweet {i}',
+                description=f'Benchmark sweet number {i}',
+                category=categories[i % len(categories)],
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                quantity=rng.choice((0, rng.randint(1, 10), rng.randint(11, 500))),
+                is_featured=rng.random() < 0.05,
+            )
+            for i in range(start, min(start + batch_size, existing + count))
+        ])
+
+
+def measure(func, repeat=5):
+    """Run `func` `repeat` times; returns (median_seconds, queries_per_call)."""
+    timings = []
+    for _ in range(repeat):
+        reset_queries()  # the DEBUG query log is capped; start from empty
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(ctx.captured_queries)
+
+
+def legacy_stats():
+    """The statistics queries SweetStatsView used to issue one by one."""
+    Sweet.objects.count()
+    Sweet.objects.aggregate(total=Sum(F('price') * F('quantity')))
+    Sweet.objects.aggregate(avg=Avg('price'))
+    Sweet.objects.aggregate(total=Sum('quantity'))
+    Sweet.objects.filter(quantity=0).count()
+    Sweet.objects.filter(quantity__range=(1, 10)).count()
+    Sweet.objects.filter(quantity__gt=10).count()
+    list(Sweet.objects.values('category').annotate(
+        count=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_value=Sum(F('price') * F('quantity'))
+    ).order_by('-total_value'))
+    Sweet.objects.filter(created_at__gte=timezone.now() - timedelta(days=7)).count()
+    list(Sweet.objects.annotate(
+        item_value=F('price') * F('quantity')
+    ).order_by('-item_value')[:5])
+
+
+@scenario('stats')
+def stats_benchmark(stdout, sweets='100000,1000000', **options):
+    """
+    Compare the old one-query-per-figure statistics with the
+    single-pass engine at each catalogue size in `sweets`.
+    """
+    results = {}
+    with scratch_database():
+        for size in sorted(int(n) for n in str(sweets).split(',')):
+            populate_sweets(size - Sweet.objects.count())
+            for label, func in (
+                ('legacy', legacy_stats),
+                ('engine', lambda: inventory_stats(top_n=5)),
+            ):
+                seconds, queries = measure(func)
+                results[(size, label)] = {'seconds': seconds, 'queries': queries}
+                stdout.write(
+                    f'{size:>9,} sweets {label:>7}: {queries:>2} queries '
+                    f'{seconds * 1000:8.1f} ms'
+                )
+    return results
+
+
+@scenario('conditional')
+def conditional_get_benchmark(stdout, sweets='5000', requests=200, **options):
+    """
+    Bytes sent and CPU time per request for polling clients: a full
+    response built from the database, a full response from the response
+    cache, and a 304 for a client that sends back its ETag.
+    """
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import APIClient
+
+    endpoints = (
+        ('list', '/api/sweets/?page_size=100&ordering=name'),
+        ('featured', '/api/sweets/featured/'),
+        ('stats', '/api/stats/'),
+    )
+    results = {}
+    with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+        # First size only; bulk-inserted rows need the summary rebuilt
+        populate_sweets(int(str(sweets).split(',')[0]))
+        summary.rebuild()
+        user = get_user_model().objects.create_user(
+            email='bench@example.com', username='bench', password='bench-pass'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        for name, url in endpoints:
+            for label, prepare, conditional in (
+                ('uncached 200', bump_version, False),
+                ('cached 200', None, False),
+                ('304', None, True),
+            ):
+                headers = {'HTTP_IF_NONE_MATCH': client.get(url)['ETag']} if conditional else {}
+                sent = 0
+                cpu = time.process_time()
+                for _ in range(int(requests)):
+                    if prepare:
+                        prepare()
+                    response = client.get(url, **headers)
+                    sent += len(response.content)
+                cpu = (time.process_time() - cpu) / int(requests)
+                results[(name, label)] = {
+                    'status': response.status_code,
+                    'bytes_per_request': sent / int(requests),
+                    'cpu_ms_per_request': cpu * 1000,
+                }
+                stdout.write(
+                    f'{name:>9} {label:>13}: status={response.status_code} '
+                    f'{sent / int(requests):>9,.0f} bytes/request '
+                    f'{cpu * 1000:7.2f} ms CPU/request'
+                )
+    return results
+
+
+def legacy_search(text):
+    """The icontains OR scan SweetViewSet used for ?search=."""
+    return Sweet.objects.filter(
+        Q(name__icontains=text) |
+        Q(description__icontains=text) |
+        Q(category__icontains=text)
+    )
+
+
+@scenario('search')
+def search_benchmark(stdout, sweets='1000000', **options):
+    """
+    Time a ?search= request (count plus first page of 20) with the
+    icontains scan and with the full-text index, for a rare term, a
+    common prefix and a two-term query.
+    """
+    queries = ('12345', 'choc', 'sweet 99999')
+    results = {}
+    with scratch_database():
+        size = int(str(sweets).split(',')[0])
+        started = time.perf_counter()
+        populate_sweets(size)
+        stdout.write(f'{size:,} sweets inserted and indexed in {time.perf_counter() - started:.1f}s')
+        for text in queries:
+            for label, build in (
+                ('icontains', lambda: legacy_search(text).order_by('-created_at')),
+                ('full-text', lambda: search(Sweet.objects.all(), text)),
+            ):
+                def request():
+                    queryset = build()
+                    return queryset.count(), list(queryset[:20])
+
+                seconds, queries_run = measure(request, repeat=3)
+                count = request()[0]
+                results[(text, label)] = {'seconds': seconds, 'matches': count}
+                stdout.write(
+                    f'{text!r:>14} {label:>9}: {count:>9,} matches '
+                    f'{seconds * 1000:9.1f} ms'
+                )
+    return results
+
+
+@scenario('autocomplete')
+def autocomplete_benchmark(stdout, sweets='1000000', **options):
+    """
+    Load the autocomplete index with `sweets` generated names (no database)
+    and time suggestions for prefixes, typos and rare terms.
+    """
+    import resource
+
+    from .autocomplete import TrigramIndex
+
+    rng = random.Random(42)
+    words = (
+        'Chocolate Toffee Caramel Fudge Truffle Gulab Jamun Rasgulla Ladoo Barfi '
+        'Cookie Brownie Cupcake Macaron Nougat Praline Marzipan Lollipop Gummy Mint '
+        'Almond Pistachio Coconut Mango Strawberry Vanilla Honey Butterscotch Peanut Hazelnut'
+    ).split()
+    categories = Sweet.Category.values
+    size = int(str(sweets).split(',')[0])
+
+    index = TrigramIndex()
+    started = time.perf_counter()
+    index.load(
+        (i, f'{rng.choice(words)} {rng.choice(words)} {rng.choice(words)} {i}',
+         categories[i % len(categories)])
+        for i in range(size)
+    )
+    stdout.write(
+        f'{len(index):,} names loaded in {time.perf_counter() - started:.1f}s, '
+        f'index {index.memory_usage() / 1e6:.0f} MB, '
+        f'max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3:.0f} MB'
+    )
+
+    results = {}
+    for text in ('choc', 'chocolat tofe', 'pistachoi', 'gulab jamun 12', '12345', 'z'):
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            top = index.suggest(text, 10)
+            timings.append(time.perf_counter() - started)
+        seconds = statistics.median(timings)
+        results[text] = {'seconds': seconds, 'top': top[:1]}
+        stdout.write(
+            f'{text!r:>16}: {seconds * 1000:6.2f} ms  '
+            f'top={top[0][2] if top else None!r}'
+        )
+    return results
+
+
+@scenario('serializers')
+def serializer_benchmark(stdout, requests=200, **options):
+    """
+    CPU time to fetch and serialise 1,000 sweets with every field and
+    with ?fields=id,quantity, for SweetSerializer and SweetListSerializer.
+    """
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from .serializers import SweetListSerializer, SweetSerializer
+
+    factory = APIRequestFactory()
+    repeat = max(int(requests) // 20, 3)
+    results = {}
+    with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+        populate_sweets(1000)
+        Sweet.objects.update(image='sweets/bench.jpg')
+        for serializer_class in (SweetSerializer, SweetListSerializer):
+            for label, query in (('all fields', ''), ('sparse', '?fields=id,quantity')):
+                request = Request(factory.get('/api/sweets/' + query))
+                queryset = Sweet.objects.all()
+                columns = serializer_class.sparse_columns(request)
+                if columns:
+                    queryset = queryset.only(*columns)
+
+                timings = []
+                for _ in range(repeat):
+                    cpu = time.process_time()
+                    data = serializer_class(
+                        list(queryset), many=True, context={'request': request}
+                    ).data
+                    timings.append(time.process_time() - cpu)
+                seconds = statistics.median(timings)
+                results[(serializer_class.__name__, label)] = {
+                    'cpu_ms_per_1000': seconds * 1000,
+                    'fields': len(data[0]),
+                }
+                stdout.write(
+                    f'{serializer_class.__name__:>19} {label:>10}: {len(data[0]):>2} fields '
+                    f'{seconds * 1000:7.1f} ms CPU per 1,000 rows'
+                )
+    return results
+
+
+@scenario('listing')
+def listing_benchmark(stdout, requests=200, **options):
+    """
+    Microbenchmarks for a 100-row sweet listing page: fetching plus
+    serialising, JSON encoding alone, and whole GET /api/sweets/ requests
+    with the response cache bypassed, for the DRF serializer and the
+    values_list() fast path. Checks both give the same bytes.
+    """
+    from unittest import mock
+
+    from django.contrib.auth import get_user_model
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIClient, APIRequestFactory
+
+    from .renderers import FastJSONRenderer
+    from .serializers import FastSweetListSerializer, SweetListSerializer
+
+    def cpu_per_call(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            cpu = time.process_time()
+            func()
+            timings.append(time.process_time() - cpu)
+        return statistics.median(timings)
+
+    def report(name, label, seconds):
+        results[(name, label)] = {'cpu_ms': seconds * 1000}
+        stdout.write(f'{name:>10} {label:>8}: {seconds * 1000:8.3f} ms CPU')
+
+    repeat = int(requests)
+    results = {}
+    with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+        populate_sweets(1000)
+        Sweet.objects.filter(id__lte=500).update(image='sweet_images/bench.jpg')
+        summary.rebuild()
+        request = Request(APIRequestFactory().get('/api/sweets/?page_size=100'))
+        page = Sweet.objects.order_by('-created_at', 'id')[:100]
+
+        serialize = {
+            'drf': lambda: SweetListSerializer(list(page), many=True, context={'request': request}).data,
+            'fast': lambda: (lambda fast: fast.to_representation(fast.prepare(page)))(
+                FastSweetListSerializer(request)
+            ),
+        }
+        for label, func in serialize.items():
+            report('serialize', label, cpu_per_call(func, repeat))
+
+        data = serialize['fast']()
+        for label, renderer in (('drf', JSONRenderer()), ('fast', FastJSONRenderer())):
+            report('encode', label, cpu_per_call(lambda: renderer.render(data), repeat))
+
+        user = get_user_model().objects.create_user(
+            email='bench@example.com', username='bench', password='bench-pass'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        url = '/api/sweets/?page_size=100'
+
+        def get():
+            bump_version()
+            return client.get(url).content
+
+        report('request', 'fast', cpu_per_call(get, repeat))
+        fast_body = get()
+        with mock.patch.object(FastSweetListSerializer, 'supports', return_value=False), \
+                mock.patch('api.views.FastJSONRenderer', JSONRenderer):
+            report('request', 'drf', cpu_per_call(get, repeat))
+            drf_body = get()
+        stdout.write(f'identical response bytes: {fast_body == drf_body}')
+        results['identical'] = fast_body == drf_body
+    return results
+
+
+@scenario('export')
+def export_benchmark(stdout, sweets='1000000', **options):
+    """
+    Stream GET /api/sweets/export/ in each format over `sweets` rows and
+    report throughput and the process's peak RSS, which stays flat as the
+    row count grows.
+    """
+    import resource
+
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import APIClient
+
+    results = {}
+    with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+        size = int(str(sweets).split(',')[0])
+        populate_sweets(size)
+        user = get_user_model().objects.create_user(
+            email='bench@example.com', username='bench', password='bench-pass'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        for export_format in ('ndjson', 'csv', 'json'):
+            started = time.perf_counter()
+            response = client.get('/api/sweets/export/', {'format': export_format})
+            sent = 0
+            for chunk in response.streaming_content:
+                sent += len(chunk)
+            elapsed = time.perf_counter() - started
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            results[export_format] = {
+                'seconds': elapsed, 'bytes': sent, 'max_rss': peak,
+                'rows_per_second': size / elapsed,
+            }
+            stdout.write(
+                f'{export_format:>6}: {size:,} rows {sent / 1e6:8.1f} MB in {elapsed:6.1f}s '
+                f'({size / elapsed:,.0f} rows/s), max RSS {peak / 1e6:.0f} MB'
+            )
+    return results
+
+
+@scenario('import')
+def import_benchmark(stdout, sweets='100000', **options):
+    """
+    Import `sweets` CSV rows with the bulk importer, against creating 1,000
+    through SweetSerializer (one save() and signal round per row).
+    """
+    import io
+
+    from .importer import import_sweets
+    from .serializers import SweetSerializer
+
+    size = int(str(sweets).split(',')[0])
+    categories = Sweet.Category.values
+    lines = ['name,description,category,price,quantity,is_featured']
+    lines.extend(
+        f'Imported Sweet {i},Bulk import row {i},{categories[i % len(categories)]},'
+        f'{i % 400 + 1}.25,{i % 60},{"true" if i % 20 == 0 else ""}'
+        for i in range(size)
+    )
+    data = ('\n'.join(lines) + '\n').encode()
+
+    results = {}
+    with scratch_database():
+        sample = 1000
+        started = time.perf_counter()
+        for i in range(sample):
+            serializer = SweetSerializer(data={
+                'name': f'Serializer Sweet {i}', 'category': categories[i % len(categories)],
+                'price': f'{i % 400 + 1}.25', 'quantity': i % 60,
+            })
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        per_row = (time.perf_counter() - started) / sample
+        results['serializer'] = {'rows_per_second': 1 / per_row}
+        stdout.write(
+            f'serializer: {1 / per_row:10,.0f} rows/s '
+            f'(~{per_row * size:.0f}s for {size:,} rows)'
+        )
+
+        report = import_sweets(io.BytesIO(data), 'csv')
+        results['bulk'] = {
+            'seconds': report['seconds'], 'created': report['created'],
+            'rows_per_second': report['created'] / report['seconds'],
+        }
+        stdout.write(
+            f'bulk import: {report["created"] / report["seconds"]:9,.0f} rows/s '
+            f'({report["created"]:,} rows in {report["seconds"]:.1f}s, {report["failed"]} rejected)'
+        )
+        stdout.write(f'summary consistent: {not summary.find_discrepancies()}')
+    return results
+
+
+@scenario('bulk')
+def bulk_benchmark(stdout, sweets='100000', **options):
+    """
+    Bulk operations over 10,000 of `sweets` ids, against changing 1,000
+    sweets one save() at a time.
+    """
+    from .bulk import BulkOperation
+
+    size = int(str(sweets).split(',')[0])
+    results = {}
+    with scratch_database():
+        populate_sweets(size)
+        summary.rebuild()
+        ids = list(Sweet.objects.order_by('pk').values_list('pk', flat=True)[:10000])
+
+        sample = 1000
+        started = time.perf_counter()
+        for sweet in Sweet.objects.filter(pk__in=ids[:sample]):
+            sweet.update_price(sweet.price + 1)
+        per_row = (time.perf_counter() - started) / sample
+        results['save'] = {'rows_per_second': 1 / per_row}
+        stdout.write(f'save() loop: {1 / per_row:10,.0f} rows/s')
+
+        rng = random.Random(7)
+        operations = [
+            ('percent_price_change', {'percent': Decimal('-5')}),
+            ('set_featured', {'is_featured': True}),
+            ('adjust_quantity', {'quantities': {pk: rng.randint(-5, 20) or 1 for pk in ids}}),
+            ('move_category', {'category': 'other'}),
+        ]
+        for operation, params in operations:
+            started = time.perf_counter()
+            report = BulkOperation(operation, ids, **params).run()
+            elapsed = time.perf_counter() - started
+            results[operation] = {'seconds': elapsed, 'updated': report['updated_count']}
+            stdout.write(
+                f'{operation:>20}: {report["updated_count"]:6,} of {len(ids):,} rows in '
+                f'{elapsed * 1000:7.1f} ms ({len(ids) / elapsed:,.0f} rows/s)'
+            )
+        stdout.write(f'summary consistent: {not summary.find_discrepancies()}')
+    return results
+
+
+@scenario('admin')
+def admin_changelist_benchmark(stdout, sweets='1000000', **options):
+    """
+    Sweet admin change list pages at `sweets` rows: the default paginator
+    with COUNT(*) queries against the summary-backed counts.
+    """
+    from unittest import mock
+
+    from django.contrib.auth import get_user_model
+    from django.core.paginator import Paginator
+    from django.test import Client
+
+    from .admin import SweetAdmin
+
+    size = int(str(sweets).split(',')[0])
+    results = {}
+    with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+        populate_sweets(size)
+        summary.rebuild()
+        user = get_user_model().objects.create_superuser(
+            email='bench@example.com', username='bench', password='bench-pass'
+        )
+        client = Client()
+        client.force_login(user)
+        total_value = ['action_checkbox', *SweetAdmin.list_display].index('total_value')
+        pages = {
+            'unfiltered': '/admin/api/sweet/',
+            'category': '/admin/api/sweet/?category=chocolate',
+            'by value': f'/admin/api/sweet/?o=-{total_value}',
+        }
+        legacy = (
+            mock.patch.object(SweetAdmin, 'paginator', Paginator),
+            mock.patch.object(SweetAdmin, 'show_full_result_count', True),
+        )
+        for label in ('legacy', 'current'):
+            for patcher in legacy if label == 'legacy' else ():
+                patcher.start()
+            try:
+                for name, url in pages.items():
+                    seconds, queries = measure(lambda: client.get(url), repeat=3)
+                    results[(name, label)] = {'seconds': seconds, 'queries': queries}
+                    stdout.write(
+                        f'{name:>10} {label:>7}: {queries:>2} queries {seconds * 1000:8.1f} ms'
+                    )
+            finally:
+                for patcher in legacy if label == 'legacy' else ():
+                    patcher.stop()
+    return results
+
+
+def fanout_worker(path, clients, ready, done, results):
+    """
+    One ASGI worker process holding `clients` InventoryConsumer sockets,
+    driven in-process the way a server drives them. Reports when each
+    client received its k-th message.
+    """
+    import asyncio
+
+    from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+
+    from .channel_layer import BrokerChannelLayer
+    from .consumers import InventoryConsumer
+
+    channel_layers.set(DEFAULT_CHANNEL_LAYER, BrokerChannelLayer(path=path))
+    app = InventoryConsumer.as_asgi()
+    counts = [0] * clients
+    arrivals = {}  # message index -> time the last client received it
+    accepted = []
+
+    async def run():
+        tasks = []
+        for i in range(clients):
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+
+            async def send(event, i=i):
+                if event['type'] == 'websocket.send':
+                    arrivals[counts[i]] = time.time()
+                    counts[i] += 1
+                elif event['type'] == 'websocket.accept':
+                    accepted.append(i)
+
+            scope = {'type': 'websocket', 'path': '/ws/inventory/', 'headers': [],
+                     'query_string': b'', 'subprotocols': []}
+            tasks.append(asyncio.ensure_future(app(scope, inbox.get, send)))
+        while len(accepted) < clients:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)  # let the broker see the group subscription
+        ready.put(clients)
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+        # Drain: stop once nothing has arrived for a second
+        while time.time() - max(arrivals.values(), default=0) < 1:
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(run())
+    results.put({'counts': (min(counts), max(counts), sum(counts)), 'arrivals': arrivals})
+
+
+def run_broker(path):
+    import asyncio
+
+    from .channel_layer import Broker
+
+    asyncio.run(Broker(path).serve())
+
+
+@scenario('fanout')
+def fanout_benchmark(stdout, clients=10000, workers=4, threads=16, purchases=3000, **options):
+    """
+    Flash sale against `clients` WebSocket clients spread over `workers`
+    processes linked by the channel broker: `purchases` purchases of 20 hot
+    sweets while the publisher coalesces them into one message per tick.
+    """
+    import multiprocessing
+    from unittest import mock
+
+    from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+
+    from .broadcast import publisher
+    from .channel_layer import BrokerChannelLayer
+
+    context = multiprocessing.get_context('fork')
+    tmpdir = tempfile.mkdtemp(prefix='sweet_bench_')
+    path = os.path.join(tmpdir, 'broker.sock')
+    broker = context.Process(target=run_broker, args=(path,), daemon=True)
+    broker.start()
+    while not os.path.exists(path):
+        time.sleep(0.05)
+
+    ready, results, done = context.Queue(), context.Queue(), context.Event()
+    per_worker = [clients // workers + (1 if i < clients % workers else 0) for i in range(workers)]
+    processes = [
+        context.Process(target=fanout_worker, args=(path, n, ready, done, results), daemon=True)
+        for n in per_worker
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=300)
+    stdout.write(f'{clients:,} clients connected in {workers} processes '
+                 f'({time.perf_counter() - started:.1f}s)')
+
+    flushes = []  # (time, sweets) per tick
+    flush = publisher.flush
+
+    def timed_flush():
+        at = time.time()
+        sent = flush()
+        if sent:
+            flushes.append((at, sent))
+        return sent
+
+    old_layer = channel_layers.set(DEFAULT_CHANNEL_LAYER, BrokerChannelLayer(path=path))
+    try:
+        with scratch_database(), mock.patch.object(publisher, 'flush', timed_flush):
+            hot = [
+                Sweet.objects.create(
+                    name=f'Flash Sweet {i}', category=Sweet.Category.CANDY,
+                    price=Decimal('1.00'), quantity=purchases
+                ).pk
+                for i in range(20)
+            ]
+            time.sleep(1)
+            before_sale = len(flushes)  # the creations' tick
+            rng = random.Random(3)
+            sold, elapsed, errors = run_threads(
+                lambda: Sweet.objects.take_stock(rng.choice(hot), 1) is not None, threads, purchases
+            )
+            while len(publisher) or not flushes or time.time() - flushes[-1][0] < 0.5:
+                time.sleep(0.1)
+    finally:
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, old_layer)
+        done.set()
+
+    reports = [results.get(timeout=600) for _ in processes]
+    for process in processes + [broker]:
+        process.terminate()
+        process.join()
+    os.unlink(path)
+    os.rmdir(tmpdir)
+
+    ticks = len(flushes)
+    received = sum(report['counts'][2] for report in reports)
+    fewest = min(report['counts'][0] for report in reports)
+    stdout.write(
+        f'{sold:,} purchases in {elapsed:.2f}s ({errors} errors) -> {ticks - before_sale} ticks '
+        f'carrying {sum(sent for _, sent in flushes[before_sale:]):,} sweet updates '
+        f'(INVENTORY_PUBLISH_INTERVAL={settings.INVENTORY_PUBLISH_INTERVAL}s)'
+    )
+    stdout.write(
+        f'{received:,} WebSocket messages sent, {fewest} to {max(r["counts"][1] for r in reports)} '
+        f'per client; one message per purchase would be {sold * clients:,}'
+    )
+    complete = fewest == ticks
+    latencies = [0]
+    if complete:
+        latencies = sorted(
+            max(report['arrivals'][k] for report in reports) - at
+            for k, (at, _) in enumerate(flushes)
+        )
+        stdout.write(
+            f'tick -> last client latency: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+            f'max {latencies[-1] * 1000:.1f} ms'
+        )
+    else:
+        stdout.write('clients fell behind and full channels dropped ticks; try a longer interval')
+    return {
+        'ticks': ticks, 'received': received, 'complete': complete,
+        'latency_p50': latencies[len(latencies) // 2], 'latency_max': latencies[-1],
+    }
+
+
+@scenario('stream')
+def stream_benchmark(stdout, clients=10000, sweets='100000', **options):
+    """
+    Bytes and CPU per tick for `clients` in-process InventoryConsumer
+    sockets: full sweet objects to everyone (the previous format), deltas
+    to everyone, and deltas filtered by a mix of subscriptions.
+    """
+    import asyncio
+
+    from asgiref.sync import sync_to_async
+    from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+
+    from .broadcast import GROUP, STATE_FIELDS, InventoryPublisher, dumps, sweet_state
+    from .channel_layer import Broker, BrokerChannelLayer
+    from .consumers import InventoryConsumer
+
+    count = int(sweets.split(',')[0])
+    ticks, changed = 20, 200
+    rng = random.Random(5)
+    categories = Sweet.Category.values
+    publisher = InventoryPublisher()
+    handled = [0]
+
+    class CountingConsumer(InventoryConsumer):
+        async def inventory_update(self, event):
+            await super().inventory_update(event)
+            handled[0] += 1
+
+    def subscription(i):
+        kind = i % 20
+        if kind < 10:
+            return {'sweets': rng.sample(range(1, count + 1), 5)}
+        if kind < 15:
+            return {'categories': [categories[i % len(categories)]]}
+        if kind < 18:
+            return {'low_stock': True, 'categories': [categories[i % len(categories)]]}
+        return None  # everything
+
+    def tick(legacy):
+        pks = rng.sample(range(1, count + 1), changed)
+        Sweet.objects.filter(pk__in=pks, quantity__gt=0).update(quantity=F('quantity') - 1)
+        message = publisher.message(dict.fromkeys(pks, False))
+        if legacy:
+            rows = Sweet.objects.filter(pk__in=pks).values_list(*STATE_FIELDS)
+            message['text'] = dumps({'type': 'inventory_update',
+                                     'sweets': [sweet_state(row) for row in rows], 'deleted': []})
+        return message
+
+    async def run(mode, path):
+        app = CountingConsumer.as_asgi()
+        sent = [0, 0]  # bytes, frames
+        accepted, tasks, subscribed = [], [], 0
+
+        async def send(event):
+            if event['type'] == 'websocket.send':
+                sent[0] += len(event['text'])
+                sent[1] += 1
+            elif event['type'] == 'websocket.accept':
+                accepted.append(True)
+
+        for i in range(clients):
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+            wanted = subscription(i) if mode == 'filtered' else None
+            if wanted:
+                subscribed += 1
+                inbox.put_nowait({'type': 'websocket.receive',
+                                  'text': dumps({'action': 'subscribe', **wanted})})
+            scope = {'type': 'websocket', 'path': '/ws/inventory/', 'headers': [],
+                     'query_string': b'', 'subprotocols': []}
+            tasks.append(asyncio.ensure_future(app(scope, inbox.get, send)))
+        while len(accepted) < clients or sent[1] < subscribed:  # one snapshot each
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)  # let the broker see the group
+        layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+
+        sent[0], handled[0] = 0, 0
+        cpu = 0.0
+        for n in range(1, ticks + 1):
+            message = await sync_to_async(tick)(mode == 'broadcast')
+            started = time.process_time()
+            await layer.group_send(GROUP, message)
+            while handled[0] < clients * n:
+                await asyncio.sleep(0.001)
+            cpu += time.process_time() - started
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await layer.close()
+        return sent[0], cpu
+
+    async def main(mode, path):
+        started = asyncio.Event()
+        server = asyncio.ensure_future(Broker(path).serve(started))
+        await started.wait()
+        try:
+            return await run(mode, path)
+        finally:
+            server.cancel()
+
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='sweet_bench_')
+    path = os.path.join(tmpdir, 'broker.sock')
+    old_layer = channel_layers.set(DEFAULT_CHANNEL_LAYER, BrokerChannelLayer(path=path))
+    try:
+        with scratch_database():
+            populate_sweets(count)
+            stdout.write(f'{clients:,} clients, {ticks} ticks of {changed} changed sweets '
+                         f'out of {count:,}')
+            for mode in ('broadcast', 'delta', 'filtered'):
+                channel_layers.set(DEFAULT_CHANNEL_LAYER, BrokerChannelLayer(path=path))
+                sent, cpu = asyncio.run(main(mode, path))
+                results[mode] = {'bytes_per_tick': sent / ticks, 'cpu_per_tick': cpu / ticks}
+                stdout.write(
+                    f'{mode:>9}: {sent / ticks / 1024:10,.0f} KiB sent per tick '
+                    f'{cpu / ticks * 1000:8.1f} ms CPU per tick'
+                )
+    finally:
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, old_layer)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+
+@scenario('tape')
+def tape_benchmark(stdout, threads=16, purchases=3000, clients=10000, **options):
+    """
+    Flash sale watched on the admin sales tape by up to 100 dashboards, a
+    tenth of them stalled (never reading): messages per dashboard, and
+    what a stalled one holds at the end.
+    """
+    import asyncio
+    import json
+
+    from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+
+    from . import ledger
+    from .channel_layer import Broker, BrokerChannelLayer
+    from .consumers import PurchaseConsumer
+    from .tape import tape
+
+    dashboards = min(clients, 100)
+    admin = type('Admin', (), {'is_admin': True, 'pk': None})()
+    received = [0] * dashboards
+    consumers = []
+
+    class TrackedConsumer(PurchaseConsumer):
+        async def connect(self):
+            await super().connect()
+            consumers.append(self)
+
+    async def watch(path, sale):
+        started = asyncio.Event()
+        server = asyncio.ensure_future(Broker(path).serve(started))
+        await started.wait()
+        app = TrackedConsumer.as_asgi()
+        stalled = asyncio.Event()  # never set
+        tasks = []
+        for i in range(dashboards):
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+
+            async def send(event, i=i):
+                if event['type'] == 'websocket.send':
+                    if i % 10 == 0:
+                        await stalled.wait()
+                    received[i] += 1
+
+            scope = {'type': 'websocket', 'path': '/ws/purchases/', 'headers': [],
+                     'query_string': b'', 'subprotocols': [], 'user': admin}
+            tasks.append(asyncio.ensure_future(app(scope, inbox.get, send)))
+        while len(consumers) < dashboards:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.5)  # let the broker see the group
+        result = await asyncio.get_running_loop().run_in_executor(None, sale)
+        await asyncio.sleep(1)  # the last tick
+        held = max(
+            len(json.dumps(consumer.pending['batch'])) if consumer.pending else 0
+            for consumer in consumers
+        )
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.cancel()
+        return result, held
+
+    tmpdir = tempfile.mkdtemp(prefix='sweet_bench_')
+    path = os.path.join(tmpdir, 'broker.sock')
+    old_layer = channel_layers.set(DEFAULT_CHANNEL_LAYER, BrokerChannelLayer(path=path))
+    try:
+        with scratch_database():
+            hot = [
+                Sweet.objects.create(name=f'Flash Sweet {i}', category=Sweet.Category.CANDY,
+                                     price=Decimal('1.50'), quantity=purchases).pk
+                for i in range(20)
+            ]
+            rng = random.Random(9)
+
+            def purchase():
+                sweet = Sweet.objects.take_stock(rng.choice(hot), 1)
+                if sweet is not None:
+                    ledger.record_purchase(None, sweet, 1, sweet.price)
+                return sweet is not None
+
+            published = tape.published
+            (sold, elapsed, errors), held = asyncio.run(
+                watch(path, lambda: run_threads(purchase, threads, purchases))
+            )
+            ledger.flush()
+    finally:
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, old_layer)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    batches = tape.published - published
+    live = [count for i, count in enumerate(received) if i % 10]
+    stdout.write(
+        f'{sold:,} purchases in {elapsed:.2f}s ({errors} errors) -> {batches} tape batches '
+        f'(PURCHASE_TAPE_INTERVAL={settings.PURCHASE_TAPE_INTERVAL}s, '
+        f'at most {settings.PURCHASE_TAPE_MAX_EVENTS} purchases listed each)'
+    )
+    stdout.write(
+        f'{dashboards} dashboards: live ones got {min(live)}-{max(live)} messages; '
+        f'stalled ones hold one collapsed batch of at most {held:,} bytes'
+    )
+    return {'batches': batches, 'messages': sum(live), 'held': held}
@@ -0,0 +1,373 @@
+"""
+Inventory stream for WebSocket clients (the ``inventory_updates`` group).
+
+Receivers queue the ids of changed sweets, and a background thread
+publishes everything queued once per INVENTORY_PUBLISH_INTERVAL seconds.
+A flash sale therefore costs at most one update per sweet per tick,
+however many purchases hit it. Set INVENTORY_PUBLISH_INTERVAL to 0 to
+publish every change immediately.
+
+Each tick increments InventoryVersion and reads the current rows of the
+queued sweets in the same transaction, so a higher version never carries
+older stock. The group message holds the rows for consumers that filter by
+subscription (see Subscription), plus the delta every unfiltered client
+gets, encoded once per tick:
+
+    {"type": "delta", "version": 43, "changes": [[id, quantity], ...],
+     "sweets": [{...}], "deleted": [id, ...]}
+
+``changes`` covers stock moves; ``sweets`` (new sweets and price, name
+or category edits) and ``deleted`` are only present when not empty.
+
+A tick the channel broker does not get (it is down) reaches at most the
+sockets of its own process. Its sweets go out again with the first tick
+after the broker is back, which lists the missed versions as ``skipped``
+so that other processes' consumers do not take them for dropped messages.
+With neither a broker nor local sockets, a tick waits without spending a
+version.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import InventoryVersion, Sweet
+from .stats import LOW_STOCK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+GROUP = 'inventory_updates'
+
+# Columns read for every published or snapshotted sweet
+STATE_FIELDS = ('id', 'name', 'category', 'price', 'quantity')
+
+# Most sweet ids one client may subscribe to
+MAX_SUBSCRIBED_SWEETS = 1000
+
+# Versions the broker missed that a publisher remembers (consumers resync
+# anyway once a gap is that long)
+MAX_SKIPPED = 1000
+
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def sweet_state(row):
+    """What clients see of a sweet, from a row of STATE_FIELDS."""
+    pk, name, category, price, quantity = row
+    return {
+        'id': pk,
+        'name': name,
+        'category': category,
+        'price': str(price),
+        'quantity': quantity,
+        'is_available': quantity > 0,
+    }
+
+
+def next_version():
+    """Increment and return the inventory version (inside a transaction)."""
+    if not InventoryVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        InventoryVersion.objects.create(pk=1, version=1)
+    return InventoryVersion.objects.values_list('version', flat=True).get(pk=1)
+
+
+def current_version():
+    """
+    The inventory version, taken with the row locked so that no tick can
+    commit between it and the reads that follow in the same transaction.
+    """
+    version = InventoryVersion.objects.select_for_update().filter(pk=1).values_list(
+        'version', flat=True
+    ).first()
+    return version or 0
+
+
+class Subscription:
+    """
+    What one client wants: specific sweets and/or categories (neither means
+    every sweet), optionally only while low on stock.
+
+    A low-stock subscriber also gets the update that takes a sweet it was
+    shown back above LOW_STOCK_THRESHOLD, so it can drop it.
+    """
+
+    def __init__(self, sweets=None, categories=None, low_stock=False):
+        self.sweets = frozenset(sweets or ())
+        self.categories = frozenset(categories or ())
+        self.low_stock = low_stock
+        self.shown_low = set()
+
+    @property
+    def everything(self):
+        return not (self.sweets or self.categories or self.low_stock)
+
+    def queryset(self):
+        sweets = Sweet.objects.all()
+        if self.sweets or self.categories:
+            sweets = sweets.filter(Q(pk__in=self.sweets) | Q(category__in=self.categories))
+        if self.low_stock:
+            sweets = sweets.filter(quantity__lte=LOW_STOCK_THRESHOLD)
+        return sweets
+
+    def in_scope(self, pk, category):
+        if not (self.sweets or self.categories):
+            return True
+        return pk in self.sweets or category in self.categories
+
+    def wants(self, pk, category, quantity):
+        if not self.in_scope(pk, category):
+            return False
+        if not self.low_stock:
+            return True
+        if quantity <= LOW_STOCK_THRESHOLD:
+            self.shown_low.add(pk)
+            return True
+        if pk in self.shown_low:
+            self.shown_low.discard(pk)
+            return True
+        return False
+
+    def render(self, event):
+        """The delta text for this client from a tick's group message, or None."""
+        if self.everything:
+            return event['text']
+        if not (self.sweets or self.low_stock):
+            # Category-only subscriptions are shared by many clients
+            return encoded_for_categories(event, self.categories)
+        return self.encode(event)
+
+    def candidates(self, event):
+        """The tick's rows that may concern this client, in id order."""
+        index = tick_index(event)
+        if not (self.sweets or self.categories):
+            return event['rows']
+        rows = [index['ids'][pk] for pk in self.sweets if pk in index['ids']]
+        for category in self.categories:
+            rows.extend(row for row in index['categories'].get(category, ()) if row[0] not in self.sweets)
+        return sorted(rows)
+
+    def encode(self, event):
+        delta = {
+            'type': 'delta',
+            'version': event['version'],
+            'changes': [
+                [pk, quantity] for pk, category, quantity in self.candidates(event)
+                if self.wants(pk, category, quantity)
+            ],
+        }
+        sweets = [sweet for sweet in event['sweets'] if self.in_scope(sweet['id'], sweet['category'])]
+        if sweets:
+            delta['sweets'] = sweets
+        deleted = [pk for pk in event['deleted'] if not self.sweets or pk in self.sweets]
+        if deleted:
+            delta['deleted'] = deleted
+            self.shown_low.difference_update(deleted)
+        if not (delta['changes'] or sweets or deleted):
+            return None
+        return dumps(delta)
+
+
+# Per process, for the current tick only: its rows indexed by id and by
+# category, and its delta text for each set of categories. Every consumer
+# gets its own copy of the message, so these cannot live on it.
+_tick = {'version': None}
+
+
+def current_tick(event):
+    if _tick['version'] != event['version']:
+        _tick.clear()
+        _tick.update(version=event['version'], index=None, texts={})
+    return _tick
+
+
+def tick_index(event):
+    tick = current_tick(event)
+    if tick['index'] is None:
+        categories = {}
+        for row in event['rows']:
+            categories.setdefault(row[1], []).append(row)
+        tick['index'] = {'ids': {row[0]: row for row in event['rows']}, 'categories': categories}
+    return tick['index']
+
+
+def encoded_for_categories(event, categories):
+    texts = current_tick(event)['texts']
+    if categories not in texts:
+        texts[categories] = Subscription(categories=categories).encode(event)
+    return texts[categories]
+
+
+def snapshot(subscription, limit=None):
+    """
+    {"type": "snapshot", "version": n, "sweets": [...], "truncated": bool}
+    for `subscription`: the matching sweets as of version n.
+    """
+    limit = limit or getattr(settings, 'INVENTORY_SNAPSHOT_LIMIT', 1000)
+    with transaction.atomic():
+        version = current_version()
+        rows = list(subscription.queryset().order_by('pk').values_list(*STATE_FIELDS)[:limit + 1])
+    if subscription.low_stock:
+        subscription.shown_low = {row[0] for row in rows[:limit]}
+    return {
+        'type': 'snapshot',
+        'version': version,
+        'sweets': [sweet_state(row) for row in rows[:limit]],
+        'truncated': len(rows) > limit,
+    }
+
+
+class InventoryPublisher:
+    """
+    Thread-safe, per-sweet coalescing buffer of changed sweet ids.
+    """
+
+    def __init__(self, group=GROUP):
+        self.group = group
+        self._pending = {}  # sweet id -> whether more than its stock changed
+        self._undelivered = {}  # the same, for ticks the broker did not get
+        self._skipped = []  # versions of those ticks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._loop = None
+        self.published = 0  # group messages sent
+
+    def __len__(self):
+        return len(self._pending)
+
+    def queue(self, pks, full=False):
+        """
+        Queue changed sweets. `full` for anything beyond stock (a new
+        sweet, price or name edits); deleted sweets simply no longer exist
+        when the tick reads them.
+        """
+        if not pks:
+            return
+        with self._lock:
+            for pk in pks:
+                self._pending[pk] = full or self._pending.get(pk, False)
+        interval = getattr(settings, 'INVENTORY_PUBLISH_INTERVAL', 0.25)
+        if interval <= 0:
+            self.flush()
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='inventory-publisher', daemon=True
+                    )
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        # One loop for the thread's lifetime, so the channel layer keeps
+        # its connection instead of opening one per tick
+        self._loop = asyncio.new_event_loop()
+        while True:
+            self._wakeup.wait()
+            # Whatever arrives during the tick goes out with it
+            time.sleep(getattr(settings, 'INVENTORY_PUBLISH_INTERVAL', 0.25))
+            self._wakeup.clear()
+            self.flush()
+
+    def message(self, pending):
+        """Stamp a version and build the group message for `pending`."""
+        with transaction.atomic():
+            version = next_version()
+            rows = list(Sweet.objects.filter(pk__in=list(pending)).values_list(*STATE_FIELDS))
+
+        found = {row[0] for row in rows}
+        sweets = [sweet_state(row) for row in rows if pending[row[0]]]
+        deleted = [pk for pk in pending if pk not in found]
+        delta = {
+            'type': 'delta',
+            'version': version,
+            'changes': [[pk, quantity] for pk, _, _, _, quantity in rows],
+        }
+        if sweets:
+            delta['sweets'] = sweets
+        if deleted:
+            delta['deleted'] = deleted
+        return {
+            'type': 'inventory.update',
+            'version': version,
+            'rows': [[pk, category, quantity] for pk, _, category, _, quantity in rows],
+            'sweets': sweets,
+            'deleted': deleted,
+            'text': dumps(delta),
+        }
+
+    def run(self, awaitable):
+        if threading.current_thread() is self._thread:
+            return self._loop.run_until_complete(awaitable)
+
+        async def wait():
+            return await awaitable
+        return async_to_sync(wait)()
+
+    def hold(self, pending, version=None):
+        """
+        Keep sweets the broker did not get (and the version it missed) for
+        the first tick after it is back.
+        """
+        with self._lock:
+            for pk, full in pending.items():
+                self._undelivered[pk] = full or self._undelivered.get(pk, False)
+            if version is not None:
+                self._skipped.append(version)
+                del self._skipped[:-MAX_SKIPPED]
+
+    def flush(self):
+        """Publish everything queued as one message. Returns the number of sweets sent."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        layer = get_channel_layer()
+        if layer is None:
+            return 0
+        message = None
+        try:
+            # Layers without a broker (InMemoryChannelLayer) reach everyone
+            broker = self.run(layer.broker_reachable()) if hasattr(layer, 'broker_reachable') else True
+            if not broker and not layer.has_local_members(self.group):
+                # Nobody to tell: no version is spent that no socket would see
+                self.hold(pending)
+                return 0
+            skipped = []
+            if broker:
+                with self._lock:
+                    for pk, full in self._undelivered.items():
+                        pending[pk] = full or pending.get(pk, False)
+                    skipped, self._skipped, self._undelivered = self._skipped, [], {}
+
+            message = self.message(pending)
+            if skipped:
+                # Covered by this message's rows: not gaps to resync over
+                message['skipped'] = skipped
+            sent = self.run(layer.group_send(self.group, message))
+        except Exception as e:
+            logger.error(f"Failed to publish {len(pending)} inventory updates: {str(e)}")
+            sent = False
+            if message is None:
+                self.hold(pending)
+                return 0
+        if sent is False:
+            # Only this process's sockets may have it; other processes
+            # will get these sweets, and the version, once the broker is back
+            self.hold(pending, message['version'])
+        self.published += 1
+        return len(pending)
+
+
+publisher = InventoryPublisher()
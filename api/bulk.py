@@ -0,0 +1,369 @@
+"""
+Set-based bulk operations on sweets (BulkOperationsView).
+
+Requested ids are handled BULK_OPERATION_BATCH_SIZE at a time, each batch
+in its own transaction: the rows are locked and read, the new values are
+worked out per id (skipping ids the operation does not apply to, with a
+reason), and the batch is written with a single UPDATE or DELETE whose
+RETURNING rows say which sweets actually changed.
+
+update_queryset() is the same for an arbitrary queryset and F()
+expressions (the admin actions): one UPDATE over the whole selection.
+
+Per-row save/delete signals are not sent. Each batch instead sends one
+``sweets_bulk_updated`` or ``sweets_bulk_deleted`` signal with the returned
+rows, whose receivers update the inventory summary, the autocomplete
+index and the response cache version, and queue the stock-threshold
+(or deletion) alerts with one INSERT.
+"""
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import IntegrityError, NotSupportedError, connection, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .models import AUTO_FEATURE_VALUE, MAX_PRICE, Sweet, sweets_bulk_deleted, sweets_bulk_updated
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = (
+    'restock', 'clear_stock', 'adjust_quantity', 'set_price',
+    'percent_price_change', 'set_featured', 'move_category', 'delete',
+)
+
+# Columns locked before and returned after each statement
+COLUMNS = ('id', 'name', 'category', 'price', 'quantity', 'is_featured')
+
+# Columns an operation may change, in statement order
+CHANGED_FIELDS = ('category', 'price', 'quantity', 'is_featured')
+
+
+class BulkOperation:
+    """
+    One bulk operation over a list of sweet ids.
+
+        report = BulkOperation('set_price', [1, 2, 3], price=Decimal('99')).run()
+
+    `params` holds the operation's argument: quantity (restock),
+    quantities ({id: delta}, adjust_quantity), price, percent,
+    is_featured or category.
+    """
+
+    def __init__(self, operation, sweet_ids, batch_size=None, **params):
+        self.operation = operation
+        self.sweet_ids = list(dict.fromkeys(sweet_ids))
+        self.params = params
+        self.batch_size = batch_size or getattr(settings, 'BULK_OPERATION_BATCH_SIZE', 500)
+        self.results = {}
+
+    def run(self):
+        if not connection.features.can_return_columns_from_insert:
+            raise NotSupportedError('Bulk operations need UPDATE/DELETE ... RETURNING.')
+
+        for start in range(0, len(self.sweet_ids), self.batch_size):
+            batch = self.sweet_ids[start:start + self.batch_size]
+            with transaction.atomic():
+                if self.operation == 'delete':
+                    self.delete_batch(batch)
+                else:
+                    self.update_batch(batch)
+
+        results = [self.results[pk] for pk in self.sweet_ids]
+        changed = sum(result['status'] != 'skipped' for result in results)
+        key = 'deleted_count' if self.operation == 'delete' else 'updated_count'
+        return {
+            'operation': self.operation,
+            'message': self.message(changed),
+            key: changed,
+            'skipped_count': len(results) - changed,
+            'results': results,
+        }
+
+    def message(self, changed):
+        if self.operation == 'restock':
+            return f"Restocked {changed} sweet(s) by {self.params['quantity']} units each"
+        if self.operation == 'clear_stock':
+            return f'Cleared stock for {changed} sweet(s)'
+        if self.operation == 'delete':
+            return f'Deleted {changed} sweet(s) with zero stock'
+        return f'Updated {changed} sweet(s)'
+
+    def skip(self, pk, reason):
+        self.results[pk] = {'id': pk, 'status': 'skipped', 'reason': reason}
+
+    def locked_rows(self, batch):
+        """The batch's sweets, locked (in id order) until the transaction ends."""
+        return {
+            sweet.pk: sweet for sweet in
+            Sweet.objects.select_for_update().filter(pk__in=batch).only(*COLUMNS).order_by('pk')
+        }
+
+    # Updates
+
+    def plan(self, sweet):
+        """
+        {field: new value} for `sweet` (only fields that change), or the
+        reason the operation does not apply to it.
+        """
+        operation = self.operation
+        if operation == 'restock':
+            changes = {'quantity': sweet.quantity + self.params['quantity']}
+        elif operation == 'adjust_quantity':
+            changes = {'quantity': sweet.quantity + self.params['quantities'][sweet.pk]}
+            if changes['quantity'] < 0:
+                return 'insufficient_stock'
+        elif operation == 'clear_stock':
+            changes = {'quantity': 0}
+        elif operation == 'set_price':
+            changes = {'price': self.params['price']}
+        elif operation == 'percent_price_change':
+            price = (sweet.price * (100 + self.params['percent']) / 100).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+            )
+            if not 0 < price <= MAX_PRICE:
+                return 'invalid_price'
+            changes = {'price': price}
+        elif operation == 'set_featured':
+            changes = {'is_featured': self.params['is_featured']}
+        elif operation == 'move_category':
+            changes = {'category': self.params['category']}
+
+        # Same rule as sweet_pre_save
+        price = changes.get('price', sweet.price)
+        quantity = changes.get('quantity', sweet.quantity)
+        if price * quantity > AUTO_FEATURE_VALUE:
+            changes['is_featured'] = True
+
+        changes = {name: value for name, value in changes.items() if getattr(sweet, name) != value}
+        return changes or 'unchanged'
+
+    def taken_names(self, sweets):
+        """Lower-cased names already used in the target category."""
+        return set(
+            Sweet.objects.order_by().filter(category=self.params['category'])
+            .annotate(name_lower=Lower('name'))
+            .filter(name_lower__in={sweet.name.lower() for sweet in sweets})
+            .values_list('name_lower', flat=True)
+        )
+
+    def update_batch(self, batch):
+        before = self.locked_rows(batch)
+        taken = self.taken_names(before.values()) if self.operation == 'move_category' else None
+
+        plans = {}
+        for pk in batch:
+            sweet = before.get(pk)
+            if sweet is None:
+                self.skip(pk, 'not_found')
+                continue
+            changes = self.plan(sweet)
+            if isinstance(changes, str):
+                self.skip(pk, changes)
+                continue
+            if taken is not None and 'category' in changes:
+                # Unique (lower(name), category), also between moved rows
+                if sweet.name.lower() in taken:
+                    self.skip(pk, 'name_conflict')
+                    continue
+                taken.add(sweet.name.lower())
+            plans[pk] = changes
+
+        if not plans:
+            return
+
+        changed = []
+        alias = connection.alias
+        for row in self.apply(plans, before):
+            after = Sweet.from_db(alias, COLUMNS, row)
+            sweet = before[after.pk]
+            changed.append((sweet, after))
+            self.results[after.pk] = {
+                'id': after.pk,
+                'status': 'updated',
+                'changes': {
+                    name: {'old': getattr(sweet, name), 'new': getattr(after, name)}
+                    for name in CHANGED_FIELDS if getattr(sweet, name) != getattr(after, name)
+                },
+            }
+        # Only possible where rows are not locked (the guard is re-checked)
+        for pk in plans.keys() - self.results.keys():
+            self.skip(pk, 'insufficient_stock')
+
+        if changed:
+            sweets_bulk_updated.send(sender=Sweet, changes=changed)
+
+    def apply(self, plans, before):
+        """
+        update_rows(), except that a name taken in the target category by a
+        sweet created since taken_names() ran fails only its own row.
+        """
+        if self.operation != 'move_category':
+            return update_rows(plans, before)
+        try:
+            with transaction.atomic():
+                return update_rows(plans, before)
+        except IntegrityError:
+            pass
+        rows = []
+        for pk, changes in plans.items():
+            try:
+                with transaction.atomic():
+                    rows += update_rows({pk: changes}, before)
+            except IntegrityError:
+                self.skip(pk, 'name_conflict')
+        return rows
+
+    # Deletes
+
+    def delete_batch(self, batch):
+        before = self.locked_rows(batch)
+        deletable = []
+        for pk in batch:
+            sweet = before.get(pk)
+            if sweet is None:
+                self.skip(pk, 'not_found')
+            elif sweet.quantity > 0:
+                self.skip(pk, 'has_stock')
+            else:
+                deletable.append(pk)
+
+        if not deletable:
+            return
+
+        alias = connection.alias
+        deleted = [Sweet.from_db(alias, COLUMNS, row) for row in delete_rows(deletable)]
+        for sweet in deleted:
+            self.results[sweet.pk] = {'id': sweet.pk, 'status': 'deleted'}
+        for pk in set(deletable) - self.results.keys():
+            self.skip(pk, 'has_stock')
+
+        if deleted:
+            sweets_bulk_deleted.send(sender=Sweet, sweets=deleted)
+
+
+def returned_row(row):
+    """A RETURNING row of COLUMNS with the price as a 2-place Decimal."""
+    pk, name, category, price, quantity, is_featured = row
+    price = Sweet._meta.get_field('price').to_python(price).quantize(Decimal('0.01'))
+    return pk, name, category, price, quantity, bool(is_featured)
+
+
+def update_rows(plans, before):
+    """
+    Apply {pk: {field: new value}} with one UPDATE ... RETURNING COLUMNS.
+
+    Columns set to the same value for every row are plain assignments,
+    the others CASE expressions over the id. Quantity is written as a
+    delta guarded against going negative, like SweetQuerySet's stock
+    updates.
+    """
+    ops = connection.ops
+    qn = ops.quote_name
+    pks = list(plans)
+
+    assignments, params = [], []
+    guard, guard_params = None, []
+    for name in CHANGED_FIELDS:
+        values = {pk: plans[pk][name] for pk in pks if name in plans[pk]}
+        if not values:
+            continue
+        if name == 'quantity':
+            values = {pk: value - before[pk].quantity for pk, value in values.items()}
+        elif name == 'price':
+            values = {pk: ops.adapt_decimalfield_value(value, 10, 2) for pk, value in values.items()}
+
+        distinct = set(values.values())
+        if len(values) == len(pks) and len(distinct) == 1:
+            value, value_params = '%s', [distinct.pop()]
+        else:
+            otherwise = '0' if name == 'quantity' else qn(name)
+            value = f'CASE {qn("id")} ' + 'WHEN %s THEN %s ' * len(values) + f'ELSE {otherwise} END'
+            value_params = [item for pair in values.items() for item in pair]
+
+        if name == 'quantity':
+            value = f'{qn("quantity")} + {value}'
+            guard, guard_params = f'{value} >= 0', value_params
+        assignments.append(f'{qn(name)} = {value}')
+        params += value_params
+
+    assignments.append(f'{qn("updated_at")} = %s')
+    params.append(ops.adapt_datetimefield_value(timezone.now()))
+
+    sql = (
+        f'UPDATE {qn(Sweet._meta.db_table)} SET {", ".join(assignments)} '
+        f'WHERE {qn("id")} IN ({", ".join(["%s"] * len(pks))})'
+    )
+    params += pks
+    if guard:
+        sql += f' AND {guard}'
+        params += guard_params
+    sql += f' RETURNING {", ".join(qn(column) for column in COLUMNS)}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [returned_row(row) for row in cursor.fetchall()]
+
+
+def delete_rows(pks):
+    """DELETE the zero-stock sweets among `pks`, returning their COLUMNS."""
+    qn = connection.ops.quote_name
+    sql = (
+        f'DELETE FROM {qn(Sweet._meta.db_table)} '
+        f'WHERE {qn("id")} IN ({", ".join(["%s"] * len(pks))}) AND {qn("quantity")} = 0 '
+        f'RETURNING {", ".join(qn(column) for column in COLUMNS)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, pks)
+        return [returned_row(row) for row in cursor.fetchall()]
+
+
+def update_queryset(queryset, **updates):
+    """
+    queryset.update(**updates) as one set-based UPDATE, reported like a
+    BulkOperation batch.
+
+    The selected rows are locked and read, updated with a single statement
+    (values may be F() expressions, evaluated by the database) and read
+    back by id, all in one transaction; the auto-feature rule of
+    sweet_pre_save is part of the UPDATE. One ``sweets_bulk_updated`` signal
+    carries every changed row. Returns the (before, after) pairs.
+    """
+    selected = Sweet.objects.filter(pk__in=queryset.order_by().values('pk'))
+
+    price, quantity = (
+        value if hasattr(value, 'resolve_expression') else Value(value)
+        for value in (updates.get('price', F('price')), updates.get('quantity', F('quantity')))
+    )
+    value = ExpressionWrapper(price * quantity, output_field=DecimalField(max_digits=20, decimal_places=2))
+    updates['is_featured'] = Case(
+        When(GreaterThan(value, AUTO_FEATURE_VALUE), then=Value(True)),
+        default=updates.get('is_featured', F('is_featured')),
+    )
+    updates['updated_at'] = timezone.now()
+
+    batch_size = getattr(settings, 'BULK_OPERATION_BATCH_SIZE', 500)
+    with transaction.atomic():
+        before = {
+            sweet.pk: sweet for sweet in
+            selected.select_for_update().only(*COLUMNS).order_by('pk')
+        }
+        if not before:
+            return []
+        selected.update(**updates)
+
+        # Read back by id: the selection's filter may no longer match
+        changed = []
+        pks = list(before)
+        for start in range(0, len(pks), batch_size):
+            for after in Sweet.objects.filter(pk__in=pks[start:start + batch_size]).only(*COLUMNS):
+                sweet = before[after.pk]
+                if any(getattr(sweet, name) != getattr(after, name) for name in CHANGED_FIELDS):
+                    changed.append((sweet, after))
+
+        if changed:
+            sweets_bulk_updated.send(sender=Sweet, changes=changed)
+    return changed
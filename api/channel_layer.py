@@ -0,0 +1,510 @@
+"""
+Channel layer shared by the ASGI worker processes of one host.
+
+InMemoryChannelLayer only reaches consumers in its own process. This layer
+keeps each process's channels and group members in memory as well, and
+links the processes through a small broker (``manage.py channel_broker``)
+listening on a Unix socket:
+
+- a process subscribes to a group at the broker when its first local
+  channel joins and unsubscribes when the last one leaves;
+- group_send() delivers to local members directly and hands the broker a
+  single frame, which it forwards unchanged (the message is never decoded
+  there) to every other subscribed process; each of those decodes it once
+  for all of its members;
+- send() to another process's specific channel goes to that process only.
+  Named (non-specific) channels are handed to one listening process at a
+  time.
+
+The broker must run (``manage.py channel_broker``) whenever the site has
+more than one worker process, HTTP workers included: without it the layer
+works as an in-memory layer, messages for other processes are dropped
+(with a warning once per outage) and it reconnects when next used. That is
+also how tests and a single runserver process use it.
+
+The socket lives in a directory that only the site's user may enter
+(created with mode 0700 by the broker); both ends refuse anything else.
+
+    CHANNEL_LAYERS = {'default': {
+        'BACKEND': 'api.channel_layer.BrokerChannelLayer',
+        'CONFIG': {'path': '/run/sweet-shop/channels.sock'},
+    }}
+"""
+import asyncio
+import base64
+import collections
+import json
+import logging
+import os
+import secrets
+import struct
+import time
+import weakref
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# In a directory only this user can enter: a socket in a shared one such
+# as /tmp could be bound first by another local user, who would then
+# relay (read and inject) every group message
+DEFAULT_PATH = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'sweet-shop', 'channels.sock'
+)
+
+# Frame: header length, body length, JSON header, JSON message body
+FRAME_HEADER = struct.Struct('!II')
+
+# Seconds between connection attempts while the broker is unreachable
+RETRY_INTERVAL = 1.0
+
+# Frames queued for a process that stops reading before the broker drops them
+MAX_CLIENT_BUFFER = 64 * 1024 * 1024
+
+# Messages kept for a named channel nobody is listening on yet
+NAMED_CHANNEL_BACKLOG = 100
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    raise TypeError(f'{type(value).__name__} is not serializable in a channel message')
+
+
+def _decode_bytes(obj):
+    if len(obj) == 1 and '__bytes__' in obj:
+        return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def encode_message(message):
+    return json.dumps(message, default=_encode_bytes, separators=(',', ':')).encode()
+
+
+def decode_message(body):
+    return json.loads(body, object_hook=_decode_bytes)
+
+
+def encode_frame(header, body=b''):
+    head = json.dumps(header, separators=(',', ':')).encode()
+    return FRAME_HEADER.pack(len(head), len(body)) + head + body
+
+
+async def read_frame(reader):
+    """Returns (header, body, the raw frame)."""
+    sizes = await reader.readexactly(FRAME_HEADER.size)
+    head_length, body_length = FRAME_HEADER.unpack(sizes)
+    data = await reader.readexactly(head_length + body_length)
+    return json.loads(data[:head_length]), data[head_length:], sizes + data
+
+
+def check_private(path):
+    """
+    Raise PermissionError unless the directory of `path`, and the socket
+    itself if it exists, belong to this user and nobody else can use them.
+    """
+    for target in (os.path.dirname(path) or '.', path):
+        try:
+            info = os.stat(target)
+        except FileNotFoundError:
+            continue
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(
+                f"{target} must belong to this user and be closed to others (mode 0700/0600)"
+            )
+
+
+def owner(channel):
+    """Process id of a specific channel name ('specific.<process>!<local>')."""
+    return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+
+class Broker:
+    """
+    Relays frames between the layers of several processes.
+
+    The broker only keeps routing state: which processes have members in
+    which groups, and which listen on which named channels. Messages are
+    forwarded as the raw frames they arrived in.
+    """
+
+    def __init__(self, path, max_client_buffer=MAX_CLIENT_BUFFER):
+        self.path = path
+        self.max_client_buffer = max_client_buffer
+        self.clients = {}  # process id -> writer of its receiving connection
+        self.groups = collections.defaultdict(set)  # group -> process ids
+        self.listeners = collections.defaultdict(collections.deque)  # channel -> process ids
+        self.backlog = collections.defaultdict(
+            lambda: collections.deque(maxlen=NAMED_CHANNEL_BACKLOG)
+        )
+        self.dropped = collections.Counter()
+
+    async def serve(self, started=None):
+        os.makedirs(os.path.dirname(self.path) or '.', mode=0o700, exist_ok=True)
+        check_private(self.path)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a broker that did not shut down
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"Channel broker listening on {self.path}")
+        if started is not None:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        process = None
+        try:
+            while True:
+                header, body, raw = await read_frame(reader)
+                op = header['op']
+                if op == 'group_send':
+                    for other in self.groups.get(header['group'], ()):
+                        if other != process:
+                            self.forward(other, raw)
+                elif op == 'send':
+                    self.route(header['channel'], raw)
+                elif op == 'hello':
+                    process = header['process']
+                    if header.get('receive'):
+                        self.clients[process] = writer
+                elif op == 'group_add':
+                    self.groups[header['group']].add(process)
+                elif op == 'group_discard':
+                    self.leave(header['group'], process)
+                elif op == 'listen':
+                    self.listen(header['channel'], process)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass  # the broker is shutting down
+        finally:
+            if process is not None and self.clients.get(process) is writer:
+                self.disconnect(process)
+            writer.close()
+
+    def forward(self, process, raw):
+        writer = self.clients.get(process)
+        if writer is None:
+            return False
+        if writer.transport.get_write_buffer_size() > self.max_client_buffer:
+            # The process has stopped reading; dropping beats unbounded memory
+            if not self.dropped[process] % 1000:
+                logger.warning(f"Channel broker dropping frames for slow process {process}")
+            self.dropped[process] += 1
+            return False
+        writer.write(raw)
+        return True
+
+    def route(self, channel, raw):
+        if '!' in channel:
+            self.forward(owner(channel), raw)
+            return
+        listeners = self.listeners.get(channel, ())
+        for _ in range(len(listeners)):
+            # Round-robin between the processes receiving on the channel
+            listeners.rotate(-1)
+            if self.forward(listeners[-1], raw):
+                return
+        self.backlog[channel].append(raw)
+
+    def listen(self, channel, process):
+        if process not in self.listeners[channel]:
+            self.listeners[channel].append(process)
+        backlog = self.backlog.pop(channel, ())
+        for raw in backlog:
+            self.forward(process, raw)
+
+    def leave(self, group, process):
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(process)
+            if not members:
+                del self.groups[group]
+
+    def disconnect(self, process):
+        del self.clients[process]
+        self.dropped.pop(process, None)
+        for group in list(self.groups):
+            self.leave(group, process)
+        for channel, listeners in list(self.listeners.items()):
+            if process in listeners:
+                listeners.remove(process)
+            if not listeners:
+                del self.listeners[channel]
+
+
+class BrokerLink:
+    """
+    One connection to the broker, made from one event loop. Only the link
+    of the loop that owns the local channels receives frames.
+    """
+
+    def __init__(self, layer, receive):
+        self.layer = layer
+        self.receive = receive
+        self.writer = None
+        self.retry_at = 0
+        self.reader_task = None
+        self.warned = False
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        if self.connected:
+            return True
+        if time.monotonic() < self.retry_at:
+            return False
+        try:
+            check_private(self.layer.path)
+            reader, writer = await asyncio.open_unix_connection(self.layer.path)
+        except OSError as e:
+            self.retry_at = time.monotonic() + RETRY_INTERVAL
+            if not self.warned:
+                # Once per outage, not once per message
+                self.warned = True
+                logger.warning(
+                    f"No channel broker at {self.layer.path} ({e}): messages for other "
+                    f"processes are dropped until `manage.py channel_broker` runs there"
+                )
+            return False
+        self.warned = False
+
+        layer = self.layer
+        writer.write(encode_frame({'op': 'hello', 'process': layer.process, 'receive': self.receive}))
+        if self.receive:
+            # Subscriptions are (re)built from local state on every connect
+            for group in layer.groups:
+                writer.write(encode_frame({'op': 'group_add', 'group': group}))
+            for channel in layer.listening:
+                writer.write(encode_frame({'op': 'listen', 'channel': channel}))
+            self.reader_task = asyncio.ensure_future(self.read(reader))
+        self.writer = writer
+        return True
+
+    async def write(self, data):
+        if not await self.connect():
+            return False
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+        except ConnectionError:
+            self.close()
+            return False
+        return True
+
+    async def read(self, reader):
+        try:
+            while True:
+                header, body, _ = await read_frame(reader)
+                self.layer.deliver(header, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.close()
+        if self.layer.links.get(asyncio.get_running_loop()) is self:
+            # The broker went away: reconnect so other processes' messages
+            # reach this one again without waiting for local activity
+            logger.warning(f"Lost channel broker at {self.layer.path}; reconnecting")
+            while not await self.connect():
+                await asyncio.sleep(RETRY_INTERVAL)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class BrokerChannelLayer(BaseChannelLayer):
+    """
+    Channel layer for several worker processes on one host; see the module
+    docstring.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=DEFAULT_PATH, expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = path
+        self.group_expiry = group_expiry
+        self.process = secrets.token_hex(6)
+        self.home = None  # loop that owns the local channels
+        self.channels = {}  # channel -> asyncio.Queue of (expires, message)
+        self.groups = {}  # group -> {local channel: joined at}
+        self.listening = set()  # named channels received in this process
+        self.links = weakref.WeakKeyDictionary()  # loop -> BrokerLink
+
+    # Local state
+
+    def adopt_loop(self):
+        """
+        Make the running loop the owner of local channels, unless another
+        live loop already is (a loop that closed took its consumers with it).
+        """
+        loop = asyncio.get_running_loop()
+        if self.home is not loop and (self.home is None or self.home.is_closed()):
+            self.home = loop
+            self.channels = {}
+            self.groups = {}
+            self.listening = set()
+            old = self.links.pop(loop, None)
+            if old is not None:
+                old.close()
+
+    def link(self):
+        loop = asyncio.get_running_loop()
+        link = self.links.get(loop)
+        if link is None:
+            link = self.links[loop] = BrokerLink(self, receive=loop is self.home)
+        return link
+
+    def on_home_loop(self, callback, *args):
+        """Run `callback` on the loop owning local channels, now if that is this loop."""
+        if self.home is None or self.home is asyncio.get_running_loop() or self.home.is_closed():
+            callback(*args)
+        else:
+            self.home.call_soon_threadsafe(callback, *args)
+
+    def put(self, channel, expires, message):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        queue.put_nowait((expires, message))
+
+    def put_quietly(self, channel, expires, message):
+        try:
+            self.put(channel, expires, message)
+        except asyncio.QueueFull:
+            logger.warning(f"Channel {channel} is full; message dropped")
+
+    def deliver_group(self, group, expires, message):
+        members = self.groups.get(group)
+        if not members:
+            return
+        joined_after = time.time() - self.group_expiry
+        for channel, joined in list(members.items()):
+            if joined < joined_after:
+                del members[channel]
+                continue
+            try:
+                # A shallow copy each, instead of the deepcopy InMemoryChannelLayer makes
+                self.put(channel, expires, dict(message))
+            except asyncio.QueueFull:
+                pass  # group sends drop silently for full channels
+
+    def deliver(self, header, body):
+        """Handle a frame forwarded by the broker."""
+        message = decode_message(body)
+        if header['op'] == 'group_send':
+            self.deliver_group(header['group'], header['expires'], message)
+        else:
+            self.put_quietly(header['channel'], header['expires'], message)
+
+    async def publish(self, header, message):
+        return await self.link().write(encode_frame(header, encode_message(message)))
+
+    async def broker_reachable(self):
+        """True if this loop is connected to the broker, connecting when a retry is due."""
+        return await self.link().connect()
+
+    def has_local_members(self, group):
+        return bool(self.groups.get(group))
+
+    async def subscribe(self, header):
+        link = self.link()
+        if link.receive:
+            await link.write(encode_frame(header))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+
+        expires = time.time() + self.expiry
+        if '!' in channel and owner(channel) == self.process:
+            if self.home is asyncio.get_running_loop():
+                try:
+                    self.put(channel, expires, dict(message))
+                except asyncio.QueueFull:
+                    raise ChannelFull(channel)
+            else:
+                self.on_home_loop(self.put_quietly, channel, expires, dict(message))
+            return
+        if '!' not in channel and channel in self.listening and not self.link().connected:
+            # No broker: this process is the only listener it can reach
+            self.on_home_loop(self.put_quietly, channel, expires, dict(message))
+            return
+        await self.publish({'op': 'send', 'channel': channel, 'expires': expires}, message)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self.adopt_loop()
+        if '!' not in channel and channel not in self.listening:
+            self.listening.add(channel)
+            await self.subscribe({'op': 'listen', 'channel': channel})
+
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty() and self.channels.get(channel) is queue:
+                del self.channels[channel]
+
+    async def new_channel(self, prefix='specific.'):
+        return f'{prefix}{self.process}!{secrets.token_hex(6)}'
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.adopt_loop()
+        members = self.groups.setdefault(group, {})
+        members[channel] = time.time()
+        if len(members) == 1:
+            await self.subscribe({'op': 'group_add', 'group': group})
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        members = self.groups.get(group)
+        if members and members.pop(channel, None) is not None and not members:
+            del self.groups[group]
+            await self.subscribe({'op': 'group_discard', 'group': group})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+
+        expires = time.time() + self.expiry
+        if self.groups.get(group):
+            self.on_home_loop(self.deliver_group, group, expires, dict(message))
+        # False if the broker did not get it (local members still did)
+        return await self.publish({'op': 'group_send', 'group': group, 'expires': expires}, message)
+
+    # Flush extension
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+        self.listening = set()
+        await self.close()
+
+    async def close(self):
+        # Links belong to their loops; only this loop's can be closed here
+        link = self.links.pop(asyncio.get_running_loop(), None)
+        if link is not None:
+            link.close()
@@ -1,12 +1,19 @@
 """
 WebSocket consumers for real-time features.
 """
+import asyncio
 import json
+import time
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework_simplejwt.tokens import AccessToken
+from .broadcast import GROUP, MAX_SUBSCRIBED_SWEETS, Subscription, current_version, dumps, snapshot
 from .models import Sweet
+from .tape import GROUP as TAPE_GROUP, merge
 
 User = get_user_model()
 
@@ -58,9 +65,35 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
 
 class InventoryConsumer(AsyncWebsocketConsumer):
+    """
+    Inventory stream (see api.broadcast). A client may narrow it with
+
+        {"action": "subscribe", "sweets": [1, 2], "categories": ["candy"],
+         "low_stock": true, "version": 42}
+
+    (every key optional) and gets a snapshot of the matching sweets, then
+    only the deltas that touch them. ``version`` is the last one a
+    reconnecting client holds for the same subscription; if nothing has
+    changed since, it gets {"type": "up_to_date"} instead of a snapshot. {"action": "unsubscribe"} goes back to every
+    sweet, {"action": "resync"} asks for a fresh snapshot.
+
+    Deltas from different ASGI processes can arrive out of order: a client
+    applies a change only if its version is newer than the one it holds for
+    that sweet. A tick still missing after GAP_TIMEOUT seconds (or more than
+    MAX_GAP behind) was dropped by a full channel, and the consumer sends a
+    new snapshot, within the process's ResyncBudget. Versions a tick lists
+    as ``skipped`` are covered by it (see api.broadcast).
+    """
+    GAP_TIMEOUT = 2.0
+    MAX_GAP = 1000
+
     async def connect(self):
-        self.group_name = 'inventory_updates'
-        
+        self.group_name = GROUP
+        self.subscription = Subscription()
+        self.floor = 0  # ticks up to this version are in the last snapshot
+        self.latest = None
+        self.missing = {}  # version -> when it was found missing
+
         # Join inventory group
         await self.channel_layer.group_add(
             self.group_name,
@@ -75,6 +108,182 @@ class InventoryConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+    async def dispatch(self, message):
+        # Updates are only forwarded, never touch the database: skip the
+        # close_old_connections() thread hop Channels makes before every
+        # handler, which costs far more than the send itself
+        if message['type'] == 'inventory.update':
+            await self.inventory_update(message)
+        else:
+            await super().dispatch(message)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            request = json.loads(text_data or '')
+            action = request['action']
+            if action == 'subscribe':
+                subscription = self.parse_subscription(request)
+            elif action == 'unsubscribe':
+                subscription = Subscription()
+            elif action == 'resync':
+                subscription = self.subscription
+            else:
+                raise ValueError(f'unknown action {action!r}')
+        except (ValueError, TypeError, KeyError) as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': str(e)}))
+            return
+
+        self.subscription = subscription
+        await self.resync(since=request.get('version'))
+
+    def parse_subscription(self, request):
+        sweets = request.get('sweets') or []
+        categories = request.get('categories') or []
+        if not isinstance(sweets, list) or not all(isinstance(pk, int) for pk in sweets):
+            raise ValueError('sweets must be a list of ids')
+        if len(sweets) > MAX_SUBSCRIBED_SWEETS:
+            raise ValueError(f'at most {MAX_SUBSCRIBED_SWEETS} sweets per subscription')
+        if not isinstance(categories, list) or not set(categories) <= set(Sweet.Category.values):
+            raise ValueError(f'categories must be a list of {", ".join(Sweet.Category.values)}')
+        return Subscription(sweets, categories, bool(request.get('low_stock')))
+
+    async def resync(self, since=None):
+        if since is not None and since == await database_sync_to_async(self.version)():
+            # Nothing the client holds has changed
+            self.settle(since)
+            await self.send(text_data=json.dumps({'type': 'up_to_date', 'version': since}))
+            return
+        data = await database_sync_to_async(snapshot)(self.subscription)
+        self.settle(data['version'])
+        await self.send(text_data=json.dumps(data))
+
+    def version(self):
+        with transaction.atomic():
+            return current_version()
+
+    def settle(self, version):
+        self.floor = version
+        self.latest = max(version, self.latest or 0)
+        self.missing = {v: t for v, t in self.missing.items() if v > version}
+
+    def dropped(self, version, covered=()):
+        """
+        Note a tick's version, and the `covered` versions its rows stand in
+        for; True if an earlier one is overdue.
+        """
+        now = time.monotonic()
+        if self.latest is None:
+            self.latest = version
+        elif version > self.latest + self.MAX_GAP:
+            self.latest = version
+            return True
+        elif version > self.latest:
+            for missed in range(self.latest + 1, version):
+                self.missing[missed] = now
+            self.latest = version
+        else:
+            self.missing.pop(version, None)
+        for skipped in covered:
+            self.missing.pop(skipped, None)
+        return any(now - noticed > self.GAP_TIMEOUT for noticed in self.missing.values())
+
     async def inventory_update(self, event):
-        # Send inventory update to all connected clients
-        await self.send(text_data=json.dumps(event['data']))
\ No newline at end of file
+        if event['version'] <= self.floor:
+            return  # already in the snapshot
+        if self.dropped(event['version'], event.get('skipped', ())) and resync_budget.take():
+            await self.resync()
+            return
+        # Unfiltered clients share the text encoded once per tick; a client
+        # over the resync budget keeps its deltas until a later tick
+        text = self.subscription.render(event)
+        if text is not None:
+            await self.send(text_data=text)
+
+
+class ResyncBudget:
+    """
+    Snapshots the consumers of one process may take per second
+    (INVENTORY_RESYNC_RATE). A tick lost on its way to the process is
+    missing for all of its sockets at once; they resync over the next
+    seconds rather than all querying the database in the same instant.
+    """
+
+    def __init__(self):
+        self.tokens = None
+        self.updated = time.monotonic()
+
+    def take(self):
+        rate = getattr(settings, 'INVENTORY_RESYNC_RATE', 20)
+        now = time.monotonic()
+        if self.tokens is None:
+            self.tokens = rate
+        self.tokens = min(rate, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# Consumers of a process all run on its one event loop
+resync_budget = ResyncBudget()
+
+
+class PurchaseConsumer(AsyncWebsocketConsumer):
+    """
+    Live sales tape for admins (see api.tape), authenticated by
+    TokenAuthMiddleware.
+
+    Batches go out from a separate writer task. While a slow client is
+    still taking one, the batches that arrive meanwhile are collapsed into
+    a single pending one, so a stalled socket holds one batch of memory
+    rather than a growing queue, and its totals stay exact.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not getattr(user, 'is_admin', False):
+            await self.close()
+            return
+
+        self.group_name = TAPE_GROUP
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.writer = asyncio.ensure_future(self.write())
+
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            self.writer.cancel()
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+
+    async def dispatch(self, message):
+        # Batches never touch the database (see InventoryConsumer.dispatch)
+        if message['type'] == 'sales.batch':
+            await self.sales_batch(message)
+        else:
+            await super().dispatch(message)
+
+    async def sales_batch(self, event):
+        if self.pending is None:
+            self.pending = event
+        else:
+            self.pending = {'batch': merge(self.pending['batch'], event['batch']), 'text': None}
+        self.ready.set()
+
+    async def write(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            event, self.pending = self.pending, None
+            # Shared text unless batches were collapsed for this socket
+            await self.send(text_data=event['text'] or dumps(event['batch']))
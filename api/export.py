@@ -0,0 +1,149 @@
+"""
+Streaming export of the sweet catalogue as NDJSON, CSV or JSON.
+
+Rows are read with values_list().iterator(), which uses a server-side
+cursor on PostgreSQL and fetchmany() on SQLite, and are encoded into
+buffers of roughly EXPORT_BUFFER_SIZE bytes that StreamingHttpResponse
+sends as they are produced. Memory use depends on the chunk and buffer
+sizes, not on the number of rows exported.
+"""
+import csv
+import io
+import itertools
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from .renderers import orjson
+
+# Exported columns, in order
+EXPORT_FIELDS = (
+    'id', 'name', 'description', 'category', 'price', 'quantity',
+    'calories', 'is_featured', 'image', 'created_at', 'updated_at',
+)
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'json': ('application/json', 'json'),
+}
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def export_fields(request):
+    """EXPORT_FIELDS narrowed by ?fields= / ?exclude= (id is always kept)."""
+    wanted = {name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()}
+    excluded = {name.strip() for name in request.query_params.get('exclude', '').split(',')}
+    return tuple(
+        name for name in EXPORT_FIELDS
+        if name == 'id' or ((not wanted or name in wanted) and name not in excluded)
+    )
+
+
+def plain(value):
+    """Column value as a JSON/CSV-friendly scalar."""
+    if hasattr(value, 'isoformat'):
+        return timezone.localtime(value).isoformat()
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return '{:f}'.format(value)  # Decimal
+
+
+def iter_rows(queryset, fields):
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield [plain(value) for value in row]
+
+
+def buffered(pieces):
+    """Join string `pieces` into UTF-8 chunks of about EXPORT_BUFFER_SIZE bytes."""
+    limit = getattr(settings, 'EXPORT_BUFFER_SIZE', 64 * 1024)
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= limit:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def ndjson_lines(queryset, fields):
+    for row in iter_rows(queryset, fields):
+        yield dumps(dict(zip(fields, row))) + '\n'
+
+
+def json_array(queryset, fields):
+    separator = '['
+    for row in iter_rows(queryset, fields):
+        yield separator + dumps(dict(zip(fields, row)))
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def csv_lines(queryset, fields):
+    line = io.StringIO()
+    writer = csv.writer(line)
+    for values in itertools.chain([fields], iter_rows(queryset, fields)):
+        writer.writerow(values)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+ENCODERS = {'ndjson': ndjson_lines, 'csv': csv_lines, 'json': json_array}
+
+
+def export_response(queryset, request, export_format):
+    """StreamingHttpResponse with `queryset` in `export_format`."""
+    fields = export_fields(request)
+    content_type, extension = FORMATS[export_format]
+    response = StreamingHttpResponse(
+        buffered(ENCODERS[export_format](queryset, fields)),
+        content_type=content_type
+    )
+    filename = f"sweets-{timezone.localdate():%Y%m%d}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Lets content negotiation accept ?format=ndjson; the export streams its
+    own body, so this only renders error responses (one JSON line).
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (dumps(data) + '\n').encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """?format=csv counterpart of NDJSONRenderer: errors as a one-row CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(data.keys())
+        writer.writerow(str(value) for value in data.values())
+        return line.getvalue().encode()
@@ -0,0 +1,127 @@
+"""
+Facet counts for the advanced search sidebar.
+
+Counts per category, price bucket, stock status and featured flag come
+from one conditional-aggregation query over the sweets matching the name
+search. Each facet honours every active filter except its own, so with a
+category selected the other categories still show how many sweets they
+would add. Results are cached per filter signature and inventory version.
+"""
+import hashlib
+
+from django.db.models import Count, Q
+
+from .models import Sweet
+from .response_cache import current_version, get_cache
+from .search import search
+from .stats import LOW_STOCK_THRESHOLD
+
+# (value, min price inclusive, max price exclusive)
+PRICE_BUCKETS = (
+    ('under_50', None, 50),
+    ('50_100', 50, 100),
+    ('100_250', 100, 250),
+    ('250_500', 250, 500),
+    ('500_plus', 500, None),
+)
+
+STOCK_STATUSES = (
+    ('out_of_stock', Q(quantity=0)),
+    ('low_stock', Q(quantity__range=(1, LOW_STOCK_THRESHOLD))),
+    ('in_stock', Q(quantity__gt=LOW_STOCK_THRESHOLD)),
+)
+
+# Validated search parameters that change the counts
+SIGNATURE_FIELDS = ('name', 'category', 'min_price', 'max_price', 'available_only', 'is_featured')
+
+
+def search_filters(data):
+    """
+    One Q per facet for the filters in validated search `data`; a facet
+    with no active filter gets an empty Q.
+    """
+    filters = {'category': Q(), 'price': Q(), 'stock_status': Q(), 'is_featured': Q()}
+    if data.get('category'):
+        filters['category'] = Q(category=data['category'])
+    if data.get('min_price'):
+        filters['price'] &= Q(price__gte=data['min_price'])
+    if data.get('max_price'):
+        filters['price'] &= Q(price__lte=data['max_price'])
+    if data.get('available_only'):
+        filters['stock_status'] = Q(quantity__gt=0)
+    if data.get('is_featured'):
+        filters['is_featured'] = Q(is_featured=True)
+    return filters
+
+
+def price_bucket(low, high):
+    bucket = Q()
+    if low is not None:
+        bucket &= Q(price__gte=low)
+    if high is not None:
+        bucket &= Q(price__lt=high)
+    return bucket
+
+
+def compute_facets(queryset, filters):
+    """Facet counts for `queryset` under `filters` (from search_filters())."""
+    def excluding(facet):
+        return Q(*[q for name, q in filters.items() if name != facet])
+
+    aggregates = {}
+    for category in Sweet.Category.values:
+        aggregates[f'category__{category}'] = Count(
+            'id', filter=Q(category=category) & excluding('category')
+        )
+    for value, low, high in PRICE_BUCKETS:
+        aggregates[f'price__{value}'] = Count(
+            'id', filter=price_bucket(low, high) & excluding('price')
+        )
+    for value, condition in STOCK_STATUSES:
+        aggregates[f'stock_status__{value}'] = Count(
+            'id', filter=condition & excluding('stock_status')
+        )
+    for value in (True, False):
+        aggregates[f'is_featured__{value}'] = Count(
+            'id', filter=Q(is_featured=value) & excluding('is_featured')
+        )
+
+    row = queryset.order_by().aggregate(**aggregates)
+
+    return {
+        'category': [
+            {'value': value, 'label': str(label), 'count': row[f'category__{value}']}
+            for value, label in Sweet.Category.choices
+        ],
+        'price': [
+            {'value': value, 'min': low, 'max': high, 'count': row[f'price__{value}']}
+            for value, low, high in PRICE_BUCKETS
+        ],
+        'stock_status': [
+            {'value': value, 'count': row[f'stock_status__{value}']}
+            for value, _ in STOCK_STATUSES
+        ],
+        'is_featured': [
+            {'value': value, 'count': row[f'is_featured__{value}']}
+            for value in (True, False)
+        ],
+    }
+
+
+def search_facets(data):
+    """
+    Facets for validated search `data`, cached by filter signature until
+    the inventory changes.
+    """
+    signature = repr([(field, str(data.get(field))) for field in SIGNATURE_FIELDS])
+    key = f'facets:{current_version()}:{hashlib.sha1(signature.encode()).hexdigest()}'
+
+    cache = get_cache()
+    facets = cache.get(key)
+    if facets is None:
+        queryset = Sweet.objects.all()
+        if data.get('name'):
+            queryset = search(queryset, data['name'], name_only=True, rank=False)
+        facets = compute_facets(queryset, search_filters(data))
+        cache.set(key, facets)
+    return facets
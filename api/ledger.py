@@ -0,0 +1,171 @@
+"""
+Buffered writer for the purchase/restock ledger.
+
+Records are collected in memory and written with bulk_create once
+LEDGER_BATCH_SIZE entries are pending or the oldest pending entry is
+LEDGER_FLUSH_INTERVAL seconds old. The age check runs on every record and
+after every request, and anything left is flushed at interpreter exit.
+Set LEDGER_FLUSH_INTERVAL to 0 to write every record immediately.
+
+A batch that fails to write stays pending and is retried, after a delay
+that doubles with every failure in a row. After LEDGER_MAX_RETRIES failures
+the rows are logged and dropped, so that one bad row cannot block the
+ledger for good, and at most LEDGER_MAX_PENDING rows are kept for retries.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.dispatch import receiver
+
+from .models import PurchaseRecord, RestockRecord, purchase_recorded
+
+logger = logging.getLogger(__name__)
+
+# First wait before retrying a failed write, and the longest one
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class LedgerBuffer:
+    """
+    Thread-safe buffer of unsaved ledger rows for one model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._pending = []
+        self._oldest = None
+        self._failures = 0  # failed writes in a row
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, record):
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(record)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush when the batch is full or the oldest entry is too old."""
+        batch_size = getattr(settings, 'LEDGER_BATCH_SIZE', 200)
+        interval = getattr(settings, 'LEDGER_FLUSH_INTERVAL', 1.0)
+        with self._lock:
+            now = time.monotonic()
+            # A concurrent flush() may have emptied the buffer
+            if not self._pending or self._oldest is None or now < self._retry_at:
+                return 0
+            due = len(self._pending) >= batch_size or now - self._oldest >= interval
+        return self.flush() if due else 0
+
+    def flush(self):
+        """Write all pending rows. Returns the number written."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            oldest, self._oldest = self._oldest, None
+        if not pending:
+            return 0
+
+        try:
+            # All or nothing, so that a retry cannot write a batch twice
+            with transaction.atomic():
+                self.model.objects.bulk_create(
+                    pending,
+                    batch_size=getattr(settings, 'LEDGER_BATCH_SIZE', 200)
+                )
+        except DatabaseError as e:
+            self.retry(pending, oldest, e)
+            return 0
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+        return len(pending)
+
+    def retry(self, rows, oldest, error):
+        """Keep the rows of a failed write for a later flush, within limits."""
+        name = self.model._meta.verbose_name_plural
+        max_retries = getattr(settings, 'LEDGER_MAX_RETRIES', 10)
+        max_pending = getattr(settings, 'LEDGER_MAX_PENDING', 10000)
+        dropped = []
+        with self._lock:
+            self._failures += 1
+            failures = self._failures
+            if failures >= max_retries:
+                # Give up on this batch; rows queued since get a fresh start
+                dropped = rows
+                self._failures = 0
+                self._retry_at = 0.0
+            else:
+                # The stock is already gone: keep the rows
+                self._pending[:0] = rows
+                self._oldest = oldest
+                self._retry_at = time.monotonic() + min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+                if len(self._pending) > max_pending:
+                    dropped = self._pending[:-max_pending]
+                    del self._pending[:-max_pending]
+        if not dropped:
+            logger.error(
+                f"Failed to write {len(rows)} {name} (attempt {failures}), will retry: {str(error)}"
+            )
+            return
+        logger.error(
+            f"Dropped {len(dropped)} {name} after {failures} failed write(s): {str(error)}; "
+            f"rows: {[describe(row) for row in dropped]}"
+        )
+
+
+def describe(row):
+    """A ledger row's field values, for the log when it has to be dropped."""
+    return {
+        field.attname: getattr(row, field.attname)
+        for field in row._meta.concrete_fields if not field.primary_key
+    }
+
+
+purchases = LedgerBuffer(PurchaseRecord)
+restocks = LedgerBuffer(RestockRecord)
+
+
+def record_purchase(user, sweet, quantity, total_price):
+    """Queue a purchase for the ledger."""
+    record = PurchaseRecord(
+        user_id=user.pk if user else None,
+        sweet_id=sweet.pk,
+        quantity=quantity,
+        unit_price=sweet.price,
+        total_price=total_price,
+    )
+    purchases.add(record)
+    purchase_recorded.send(sender=PurchaseRecord, record=record, sweet=sweet)
+
+
+def record_restock(user, sweet, quantity, reason=''):
+    """Queue a restock for the ledger."""
+    restocks.add(RestockRecord(
+        user_id=user.pk if user else None,
+        sweet_id=sweet.pk,
+        quantity=quantity,
+        reason=reason,
+    ))
+
+
+def flush():
+    """Write everything pending (e.g. before reading ledger aggregates)."""
+    return purchases.flush() + restocks.flush()
+
+
+@receiver(request_finished)
+def flush_ledger_after_request(sender, **kwargs):
+    purchases.flush_if_due()
+    restocks.flush_if_due()
+
+
+atexit.register(flush)
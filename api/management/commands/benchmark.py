@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from api.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark against a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Concurrent worker threads')
+        parser.add_argument('--purchases', type=int, default=3000,
+                            help='Purchases to fire (purchase, fanout and tape scenarios)')
+        parser.add_argument('--stock', type=int, default=1000,
+                            help='Initial stock of the hot sweet (purchase scenario)')
+        parser.add_argument('--sweets', default='100000,1000000',
+                            help='Comma-separated catalogue sizes (stats scenario; '
+                                 'other scenarios use the first)')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint and variant (conditional scenario)')
+        parser.add_argument('--clients', type=int, default=10000,
+                            help='Concurrent WebSocket clients (fanout and stream scenarios; '
+                                 'tape uses at most 100)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='ASGI worker processes sharing the clients (fanout scenario)')
+
+    def handle(self, *args, **options):
+        scenario = SCENARIOS[options.pop('scenario')]
+        scenario(self.stdout, **options)
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,23 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.channel_layer import DEFAULT_PATH, Broker
+
+
+class Command(BaseCommand):
+    help = 'Run the broker linking the channel layers of the ASGI worker processes on this host'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+                            help='Unix socket to listen on (default: the path in CHANNEL_LAYERS)')
+
+    def handle(self, *args, **options):
+        config = settings.CHANNEL_LAYERS.get('default', {}).get('CONFIG', {})
+        path = options['path'] or config.get('path', DEFAULT_PATH)
+
+        self.stdout.write(f'Channel broker listening on {path}')
+        try:
+            asyncio.run(Broker(path).serve())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from api.importer import FORMATS, detect_format, import_sweets
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import sweets from a CSV or NDJSON file ("-" reads stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to a .csv or .ndjson/.jsonl file, or -')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows per batch (default: IMPORT_BATCH_SIZE)')
+        parser.add_argument('--show-errors', type=int, default=20,
+                            help='Rejected rows to print (default 20)')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or detect_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format')
+
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            report = import_sweets(stream, file_format, batch_size=options['batch_size'])
+        except UnicodeDecodeError:
+            raise CommandError('File must be UTF-8 encoded')
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        for error in report['errors'][:options['show_errors']]:
+            self.stdout.write(f"row {error['row']}: {error['errors']}")
+        if report['failed'] > options['show_errors']:
+            self.stdout.write(f"... {report['failed'] - options['show_errors']} more rejected row(s)")
+
+        style = self.style.SUCCESS if not report['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"Imported {report['created']} sweet(s), rejected {report['failed']} "
+            f"in {report['seconds']:.1f}s"
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.summary import find_discrepancies, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the inventory summary table from the sweets table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report differences; exit with an error if there are any')
+
+    def handle(self, *args, **options):
+        discrepancies = find_discrepancies()
+        for category, counter, found, expected in discrepancies:
+            self.stdout.write(f'{category}.{counter}: summary has {found}, sweets give {expected}')
+
+        if options['check']:
+            if discrepancies:
+                raise CommandError(f'Inventory summary is out of date ({len(discrepancies)} difference(s))')
+            self.stdout.write(self.style.SUCCESS('Inventory summary is consistent'))
+            return
+
+        totals = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt inventory summary for {len(totals)} categories '
+            f'({len(discrepancies)} difference(s) corrected)'
+        ))
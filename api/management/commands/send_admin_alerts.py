@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.notifications import due_alerts, send_admin_alerts
+
+
+class Command(BaseCommand):
+    help = 'Send queued admin alerts as per-sweet digest e-mails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60,
+                            help='Seconds of alerts per sweet coalesced into one e-mail')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Alerts claimed per batch')
+        parser.add_argument('--flush', action='store_true',
+                            help='Also send alerts from the current, still open window')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling every --interval seconds')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Polling interval with --loop')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Passes in a row that may send nothing (rows locked by another '
+                                 'worker, SMTP errors) before a drain gives up')
+
+    def drain(self, options):
+        """Send batches until no due alert is left. Returns the e-mails sent."""
+        total = idle = 0
+        while due_alerts(options['window'], options['flush']).exists():
+            sent = send_admin_alerts(
+                window=options['window'],
+                batch_size=options['batch_size'],
+                flush=options['flush'],
+            )
+            total += sent
+            idle = 0 if sent else idle + 1
+            if idle >= options['retries']:
+                break
+            if not sent:
+                time.sleep(1)
+        return total
+
+    def handle(self, *args, **options):
+        while True:
+            total = self.drain(options)
+            if total:
+                self.stdout.write(self.style.SUCCESS(f'Sent {total} alert e-mail(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
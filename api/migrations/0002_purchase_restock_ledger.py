@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 01:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='quantity')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='unit price')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='total price')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='purchased at')),
+                ('sweet', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='purchase_records', to='api.sweet', verbose_name='sweet')),
+                ('user', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='purchase_records', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'purchase record',
+                'verbose_name_plural': 'purchase records',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['sweet', 'created_at'], name='api_purchas_sweet_i_36c044_idx'), models.Index(fields=['user', 'created_at'], name='api_purchas_user_id_d6c51b_idx'), models.Index(fields=['created_at'], name='api_purchas_created_8052b7_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestockRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='quantity')),
+                ('reason', models.CharField(blank=True, max_length=200, verbose_name='reason')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='restocked at')),
+                ('sweet', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='restock_records', to='api.sweet', verbose_name='sweet')),
+                ('user', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='restock_records', to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'restock record',
+                'verbose_name_plural': 'restock records',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['sweet', 'created_at'], name='api_restock_sweet_i_357a1d_idx'), models.Index(fields=['user', 'created_at'], name='api_restock_user_id_266a1f_idx'), models.Index(fields=['created_at'], name='api_restock_created_dbc781_idx')],
+            },
+        ),
+    ]
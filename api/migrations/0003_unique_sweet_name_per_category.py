@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 01:43
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_purchase_restock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='sweet',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), models.F('category'), name='unique_sweet_name_per_category', violation_error_message='A sweet with this name already exists in this category.'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 01:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_unique_sweet_name_per_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low_stock', 'Low stock'), ('out_of_stock', 'Out of stock'), ('restocked', 'Restocked'), ('high_value', 'New high-value sweet'), ('deleted', 'Sweet deleted')], max_length=20, verbose_name='kind')),
+                ('sweet_id', models.BigIntegerField(verbose_name='sweet id')),
+                ('subject', models.CharField(max_length=255, verbose_name='subject')),
+                ('message', models.TextField(verbose_name='message')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='sent at')),
+            ],
+            options={
+                'verbose_name': 'admin alert',
+                'verbose_name_plural': 'admin alerts',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(condition=models.Q(('sent_at__isnull', True)), fields=['created_at'], name='api_adminalert_pending_idx')],
+            },
+        ),
+    ]
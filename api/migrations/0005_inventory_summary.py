@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 01:57
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+def populate_summary(apps, schema_editor):
+    Sweet = apps.get_model('api', 'Sweet')
+    InventorySummary = apps.get_model('api', 'InventorySummary')
+    value = models.ExpressionWrapper(
+        models.F('price') * models.F('quantity'),
+        output_field=models.DecimalField(max_digits=20, decimal_places=2)
+    )
+    rows = Sweet.objects.order_by().values('category').annotate(
+        sweet_count=models.Count('id'),
+        total_quantity=models.Sum('quantity'),
+        total_value=models.Sum(value),
+        price_sum=models.Sum('price'),
+        out_of_stock=models.Count('id', filter=models.Q(quantity=0)),
+        low_stock=models.Count('id', filter=models.Q(quantity__range=(1, 10))),
+        in_stock=models.Count('id', filter=models.Q(quantity__gt=10)),
+    )
+    InventorySummary.objects.bulk_create([
+        InventorySummary(**{name: row[name] or 0 for name in row if name != 'category'},
+                         category=row['category'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_admin_alert_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('chocolate', 'Chocolate'), ('candy', 'Candy'), ('cake', 'Cake'), ('cookie', 'Cookie'), ('dessert', 'Dessert'), ('indian', 'Indian Sweet'), ('bakery', 'Bakery Item'), ('other', 'Other')], max_length=50, unique=True, verbose_name='category')),
+                ('sweet_count', models.IntegerField(default=0, verbose_name='sweets')),
+                ('total_quantity', models.BigIntegerField(default=0, verbose_name='total quantity')),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='total value')),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='sum of prices')),
+                ('out_of_stock', models.IntegerField(default=0, verbose_name='out of stock')),
+                ('low_stock', models.IntegerField(default=0, verbose_name='low stock')),
+                ('in_stock', models.IntegerField(default=0, verbose_name='in stock')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'inventory summary',
+                'verbose_name_plural': 'inventory summaries',
+                'ordering': ['category'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.F('quantity')), name='api_sweet_value_idx'),
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_inventory_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sweet',
+            name='api_sweet_name_1c5f47_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sweet',
+            name='api_sweet_price_ab2afe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sweet',
+            name='api_sweet_created_beca83_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['name', 'id'], name='api_sweet_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['price', 'id'], name='api_sweet_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['created_at', 'id'], name='api_sweet_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sweet',
+            index=models.Index(fields=['quantity', 'id'], name='api_sweet_quantity_id_idx'),
+        ),
+    ]
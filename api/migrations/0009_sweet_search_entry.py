@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 04:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_inventory_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweetSearchEntry',
+            fields=[
+                ('sweet', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='api.sweet')),
+                ('document', models.TextField(db_column='api_sweet_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'api_sweet_fts',
+                'managed': False,
+            },
+        ),
+    ]
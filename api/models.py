@@ -1,8 +1,157 @@
-from django.db import models
+from decimal import Decimal
+from django.conf import settings
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models.functions import Lower
+from django.dispatch import Signal
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
+# Sent whenever stock moves outside of Model.save() (e.g. atomic purchases),
+# with `instance` (the sweet after the change) and `old_quantity`.
+stock_changed = Signal()
+
+# Sent once per bulk-imported batch (api.importer) instead of per-row
+# save signals, with `sweets` (the created instances, pks set).
+sweets_imported = Signal()
+
+# Sent once per batch of a bulk operation (api.bulk) instead of per-row
+# signals: sweets_bulk_updated with `changes` (a list of (before, after)
+# instances) and sweets_bulk_deleted with `sweets` (the deleted rows).
+sweets_bulk_updated = Signal()
+sweets_bulk_deleted = Signal()
+
+# Sent by api.ledger for every purchase it records, with `record` (the
+# unsaved PurchaseRecord) and `sweet`.
+purchase_recorded = Signal()
+
+
+class SweetQuerySet(models.QuerySet):
+    """
+    QuerySet with set-based inventory operations.
+    """
+    
+    # Columns read back from a stock update
+    STOCK_COLUMNS = ('id', 'name', 'category', 'price', 'quantity')
+    
+    def _subtract_stock(self, quantities, now):
+        """
+        Run one guarded UPDATE subtracting quantities[pk] from each sweet,
+        skipping any row that would go negative. Returns the updated rows;
+        fewer rows than `quantities` means at least one sweet was short.
+        """
+        pks = list(quantities)
+        
+        if connection.vendor in ('postgresql', 'sqlite') and \
+                connection.features.can_return_columns_from_insert:
+            qn = connection.ops.quote_name
+            if len(pks) == 1:
+                delta, delta_params = '%s', [quantities[pks[0]]]
+            else:
+                delta = f'CASE {qn("id")} ' + 'WHEN %s THEN %s ' * len(pks) + 'END'
+                delta_params = [value for item in quantities.items() for value in item]
+            sql = (
+                f'UPDATE {qn(self.model._meta.db_table)} '
+                f'SET {qn("quantity")} = {qn("quantity")} - {delta}, {qn("updated_at")} = %s '
+                f'WHERE {qn("id")} IN ({", ".join(["%s"] * len(pks))}) '
+                f'AND {qn("quantity")} >= {delta} '
+                f'RETURNING {", ".join(qn(c) for c in self.STOCK_COLUMNS)}'
+            )
+            params = (
+                delta_params + [connection.ops.adapt_datetimefield_value(now)]
+                + pks + delta_params
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        
+        # Backends without UPDATE ... RETURNING: same guard, read back in
+        # the same transaction.
+        delta = models.Case(
+            *[models.When(pk=pk, then=models.Value(n)) for pk, n in quantities.items()],
+            output_field=models.IntegerField(),
+        )
+        with transaction.atomic():
+            updated = self.filter(pk__in=pks, quantity__gte=delta).update(
+                quantity=models.F('quantity') - delta,
+                updated_at=now,
+            )
+            if updated != len(pks):
+                return []
+            return list(self.filter(pk__in=pks).values_list(*self.STOCK_COLUMNS))
+    
+    def _from_stock_row(self, row, now):
+        """Build an unsaved Sweet from a row of STOCK_COLUMNS."""
+        pk, name, category, price, quantity = row
+        price = self.model._meta.get_field('price').to_python(price).quantize(Decimal('0.01'))
+        sweet = self.model(
+            pk=pk, name=name, category=category, price=price,
+            quantity=quantity, updated_at=now
+        )
+        sweet._state.adding = False
+        sweet._state.db = self.db
+        return sweet
+    
+    def take_stock(self, pk, quantity):
+        """
+        Atomically remove `quantity` units from sweet `pk`.
+        
+        Runs a single guarded UPDATE (quantity >= n) so concurrent
+        purchases can never oversell. Returns an unsaved Sweet carrying
+        name, category, price and the new quantity, or None if the sweet
+        does not exist or does not have enough stock.
+        """
+        now = timezone.now()
+        rows = self._subtract_stock({pk: quantity}, now)
+        if not rows:
+            return None
+        
+        sweet = self._from_stock_row(rows[0], now)
+        stock_changed.send(
+            sender=self.model, instance=sweet, old_quantity=sweet.quantity + quantity
+        )
+        return sweet
+    
+    def take_stock_many(self, quantities):
+        """
+        Atomically remove stock from several sweets at once.
+        
+        `quantities` maps sweet pk -> units. All-or-nothing: one guarded
+        UPDATE inside a transaction that is rolled back unless every line
+        had enough stock. Returns {pk: Sweet} or None if nothing was taken.
+        """
+        from .summary import collect
+        
+        now = timezone.now()
+        with transaction.atomic():
+            rows = self._subtract_stock(quantities, now)
+            if len(rows) != len(quantities):
+                transaction.set_rollback(True)
+                return None
+            
+            # Receivers (e.g. queued alerts) write in the same transaction;
+            # summary deltas are merged into one UPDATE per category
+            sweets = {}
+            with collect():
+                for row in rows:
+                    sweet = self._from_stock_row(row, now)
+                    sweets[sweet.pk] = sweet
+                    stock_changed.send(
+                        sender=self.model, instance=sweet,
+                        old_quantity=sweet.quantity + quantities[sweet.pk]
+                    )
+        return sweets
+
+
+# Largest price DecimalField(max_digits=10, decimal_places=2) can store
+MAX_PRICE = Decimal('99999999.99')
+
+# Stock value (price * quantity) above which a sweet is rejected, and above
+# which it is featured automatically
+MAX_INVENTORY_VALUE = 100000
+AUTO_FEATURE_VALUE = 50000
+
+
 class Sweet(models.Model):
     """
     Model representing a sweet item in the shop.
@@ -93,15 +242,22 @@ class Sweet(models.Model):
         editable=False
     )
     
+    objects = SweetQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('sweet')
         verbose_name_plural = _('sweets')
         ordering = ['-created_at', 'name']
         indexes = [
-            models.Index(fields=['name']),
+            # Keyset pagination walks (ordering field, id); each index
+            # also serves plain lookups on its leading column
+            models.Index(fields=['name', 'id'], name='api_sweet_name_id_idx'),
             models.Index(fields=['category']),
-            models.Index(fields=['price']),
-            models.Index(fields=['created_at']),
+            models.Index(fields=['price', 'id'], name='api_sweet_price_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='api_sweet_created_id_idx'),
+            models.Index(fields=['quantity', 'id'], name='api_sweet_quantity_id_idx'),
+            # Serves the "most valuable sweets" top-N without a full scan
+            models.Index(models.F('price') * models.F('quantity'), name='api_sweet_value_idx'),
         ]
         # Django 5.0 compatible constraints
         constraints = [
@@ -113,12 +269,65 @@ class Sweet(models.Model):
                 condition=models.Q(quantity__gte=0),  # CHANGED: check to condition
                 name='quantity_non_negative'
             ),
+            # Case-insensitive name uniqueness within a category
+            models.UniqueConstraint(
+                Lower('name'), 'category',
+                name='unique_sweet_name_per_category',
+                violation_error_message=_('A sweet with this name already exists in this category.')
+            ),
         ]
     
     def __str__(self):
         """String representation of the sweet."""
         return f"{self.name} ({self.get_category_display()})"
     
+    # Change tracking (snapshot of the values last loaded from / saved to the DB)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values so changes can be diffed without a re-fetch."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+    
+    def _snapshot(self, fields=None):
+        """Record current values of `fields` (all concrete fields by default)."""
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if (fields is None or field.attname in fields or field.name in fields) \
+                    and field.attname in self.__dict__:
+                loaded[field.attname] = getattr(self, field.attname)
+    
+    def has_snapshot(self):
+        """True if this instance knows what is stored in the database."""
+        return bool(self.__dict__.get('_loaded_values'))
+    
+    def get_initial_value(self, field_name, default=None):
+        """Value of `field_name` as last loaded from / saved to the database."""
+        return self.__dict__.get('_loaded_values', {}).get(field_name, default)
+    
+    def get_dirty_fields(self):
+        """
+        Fields changed since the instance was loaded or last saved.
+        Returns: {field: {'old': value, 'new': value}}
+        """
+        loaded = self.__dict__.get('_loaded_values', {})
+        changes = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in loaded:
+                continue
+            old_value = loaded[field.attname]
+            new_value = getattr(self, field.attname)
+            if old_value != new_value:
+                changes[field.attname] = {'old': old_value, 'new': new_value}
+        return changes
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot(fields)
+    
     # Property methods for easy access
     @property
     def is_available(self):
@@ -157,8 +366,14 @@ class Sweet(models.Model):
         if quantity > self.quantity:
             return False, _('Insufficient stock available.')
         
-        self.quantity -= quantity
-        self.save()
+        # Decrement in the database rather than in Python so concurrent
+        # purchases cannot overwrite each other.
+        purchased = Sweet.objects.take_stock(self.pk, quantity)
+        if purchased is None:
+            return False, _('Insufficient stock available.')
+        
+        self.quantity = purchased.quantity
+        self.updated_at = purchased.updated_at
         return True, _('Purchase successful.')
     
     def restock(self, quantity):
@@ -170,7 +385,7 @@ class Sweet(models.Model):
             return False, _('Restock quantity must be positive.')
         
         self.quantity += quantity
-        self.save()
+        self.save(update_fields=['quantity', 'is_featured', 'updated_at'])
         return True, _('Restock successful.')
     
     def update_price(self, new_price):
@@ -182,7 +397,7 @@ class Sweet(models.Model):
             return False, _('Price must be positive.')
         
         self.price = new_price
-        self.save()
+        self.save(update_fields=['price', 'is_featured', 'updated_at'])
         return True, _('Price updated successfully.')
     
     # Display methods for admin
@@ -212,16 +427,280 @@ class Sweet(models.Model):
         if self.quantity < 0:
             raise ValidationError({'quantity': 'Quantity cannot be negative.'})
         
-        # Validate name uniqueness (case-insensitive within category)
-        if Sweet.objects.filter(
-            name__iexact=self.name,
-            category=self.category
-        ).exclude(pk=self.pk).exists():
+        # Name uniqueness (case-insensitive within category) is enforced by
+        # the unique_sweet_name_per_category index rather than a query here.
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save to run validation.
+        
+        With update_fields only those fields are validated (e.g. a restock
+        touching `quantity` never re-checks the name). Constraints are left
+        to the database; a duplicate name surfaces as a ValidationError.
+        """
+        from django.core.exceptions import ValidationError
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.full_clean(validate_constraints=False)  # Run validation
+        else:
+            self.clean_fields(exclude={
+                field.name for field in self._meta.concrete_fields
+                if field.name not in update_fields and field.attname not in update_fields
+            })
+        
+        # Only writes touching name/category can hit the unique index; those
+        # get a savepoint so a violation doesn't break an outer transaction.
+        writes_name = update_fields is None or bool(
+            {'name', 'category'}.intersection(update_fields)
+        )
+        try:
+            if writes_name:
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+            else:
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if 'unique_sweet_name_per_category' not in str(e):
+                raise
             raise ValidationError(
                 f'A sweet with name "{self.name}" already exists in {self.get_category_display()} category.'
             )
+        
+        # Signals have seen the dirty fields; saved values are the new baseline
+        self._snapshot(kwargs.get('update_fields'))
+
+class PurchaseRecord(models.Model):
+    """
+    Append-only ledger entry for a purchase.
     
-    def save(self, *args, **kwargs):
-        """Override save to run validation and handle image."""
-        self.full_clean()  # Run validation
-        super().save(*args, **kwargs)
\ No newline at end of file
+    Rows are written in batches by api.ledger, so foreign keys carry no
+    database constraint: history survives sweet deletion and inserts
+    never wait on referential checks.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='purchase_records',
+        verbose_name=_('user')
+    )
+    
+    sweet = models.ForeignKey(
+        Sweet,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='purchase_records',
+        verbose_name=_('sweet')
+    )
+    
+    quantity = models.PositiveIntegerField(_('quantity'))
+    
+    unit_price = models.DecimalField(
+        _('unit price'),
+        max_digits=10,
+        decimal_places=2
+    )
+    
+    total_price = models.DecimalField(
+        _('total price'),
+        max_digits=12,
+        decimal_places=2
+    )
+    
+    # Set when the purchase happens, not when the batch is flushed
+    created_at = models.DateTimeField(_('purchased at'), default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('purchase record')
+        verbose_name_plural = _('purchase records')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['sweet', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} × sweet {self.sweet_id} at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class RestockRecord(models.Model):
+    """
+    Append-only ledger entry for a restock.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='restock_records',
+        verbose_name=_('user')
+    )
+    
+    sweet = models.ForeignKey(
+        Sweet,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='restock_records',
+        verbose_name=_('sweet')
+    )
+    
+    quantity = models.PositiveIntegerField(_('quantity'))
+    
+    reason = models.CharField(_('reason'), max_length=200, blank=True)
+    
+    created_at = models.DateTimeField(_('restocked at'), default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('restock record')
+        verbose_name_plural = _('restock records')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['sweet', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"+{self.quantity} × sweet {self.sweet_id} at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class AdminAlert(models.Model):
+    """
+    Outbox of admin e-mail alerts.
+    
+    Signal handlers only INSERT here (inside the transaction that caused
+    the alert); `manage.py send_admin_alerts` drains the table and sends
+    one digest per sweet per time window over a single SMTP connection.
+    """
+    
+    class Kind(models.TextChoices):
+        LOW_STOCK = 'low_stock', _('Low stock')
+        OUT_OF_STOCK = 'out_of_stock', _('Out of stock')
+        RESTOCKED = 'restocked', _('Restocked')
+        HIGH_VALUE = 'high_value', _('New high-value sweet')
+        DELETED = 'deleted', _('Sweet deleted')
+    
+    kind = models.CharField(_('kind'), max_length=20, choices=Kind.choices)
+    
+    # Plain id, not a foreign key: deletion alerts outlive their sweet
+    sweet_id = models.BigIntegerField(_('sweet id'))
+    
+    subject = models.CharField(_('subject'), max_length=255)
+    
+    message = models.TextField(_('message'))
+    
+    created_at = models.DateTimeField(_('created at'), default=timezone.now)
+    
+    sent_at = models.DateTimeField(_('sent at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('admin alert')
+        verbose_name_plural = _('admin alerts')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(sent_at__isnull=True),
+                name='api_adminalert_pending_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return self.subject
+
+
+class InventorySummary(models.Model):
+    """
+    Running inventory totals for one category.
+    
+    Kept current with delta updates by api.summary whenever stock, price
+    or category changes, so statistics never need to scan Sweet. The
+    global figures are the sum of the (at most eight) category rows.
+    """
+    category = models.CharField(
+        _('category'),
+        max_length=50,
+        choices=Sweet.Category.choices,
+        unique=True
+    )
+    
+    sweet_count = models.IntegerField(_('sweets'), default=0)
+    
+    total_quantity = models.BigIntegerField(_('total quantity'), default=0)
+    
+    total_value = models.DecimalField(
+        _('total value'),
+        max_digits=20,
+        decimal_places=2,
+        default=0
+    )
+    
+    # Sum of unit prices, for the average price
+    price_sum = models.DecimalField(
+        _('sum of prices'),
+        max_digits=20,
+        decimal_places=2,
+        default=0
+    )
+    
+    out_of_stock = models.IntegerField(_('out of stock'), default=0)
+    
+    low_stock = models.IntegerField(_('low stock'), default=0)
+    
+    in_stock = models.IntegerField(_('in stock'), default=0)
+    
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('inventory summary')
+        verbose_name_plural = _('inventory summaries')
+        ordering = ['category']
+    
+    def __str__(self):
+        return f"{self.get_category_display()}: {self.sweet_count} sweets, {self.total_quantity} units"
+
+
+class SweetSearchEntry(models.Model):
+    """
+    Row of the SQLite full-text index on sweets (api.search).
+    
+    The table is an FTS5 virtual table created and kept in sync by
+    api.search, not by migrations, so the model is unmanaged. It exists so
+    that searches can join to it and read its bm25 `rank`.
+    """
+    sweet = models.OneToOneField(
+        Sweet,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_entry'
+    )
+    # FTS5's hidden column named after the table: the target of MATCH
+    document = models.TextField(db_column='api_sweet_fts')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'api_sweet_fts'
+
+
+class InventoryVersion(models.Model):
+    """
+    Version of the inventory as streamed to WebSocket clients.
+    
+    A single row, incremented once per publish tick by api.broadcast in
+    the transaction that reads the quantities it sends, so a higher
+    version never carries older stock. Snapshots read it the same way.
+    """
+    version = models.BigIntegerField(_('version'), default=0)
+    
+    class Meta:
+        verbose_name = _('inventory version')
+        verbose_name_plural = _('inventory version')
+    
+    def __str__(self):
+        return f"Inventory version {self.version}"
@@ -0,0 +1,141 @@
+"""
+Out-of-band delivery of admin alerts.
+
+Signal handlers call queue_admin_alert(), which is a single INSERT into
+the AdminAlert outbox. send_admin_alerts() (run by
+``manage.py send_admin_alerts``) drains the outbox, coalescing alerts per
+sweet per time window into digest e-mails sent over one SMTP connection.
+Inside collect() the INSERTs are deferred and written with one bulk_create.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AdminAlert
+
+logger = logging.getLogger(__name__)
+
+
+_collecting = threading.local()
+
+
+@contextmanager
+def collect():
+    """
+    Queue every alert raised inside the block with one INSERT on exit, so
+    a batch of changes costs one write however many thresholds it crosses.
+    """
+    if getattr(_collecting, 'alerts', None) is not None:
+        yield
+        return
+    _collecting.alerts = alerts = []
+    try:
+        yield
+    finally:
+        _collecting.alerts = None
+    if alerts:
+        AdminAlert.objects.bulk_create(alerts)
+
+
+def queue_admin_alert(kind, sweet, subject, message):
+    """Store an alert for the worker to send."""
+    alert = AdminAlert(
+        kind=kind,
+        sweet_id=sweet.pk,
+        subject=subject,
+        message=message,
+    )
+    pending = getattr(_collecting, 'alerts', None)
+    if pending is None:
+        alert.save()
+    else:
+        pending.append(alert)
+
+
+def window_start(moment, window):
+    """Start of the `window`-second bucket containing `moment`."""
+    seconds = int(moment.timestamp()) // window * window
+    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+def build_digest(alerts):
+    """Turn one sweet's alerts for one window into (subject, body)."""
+    if len(alerts) == 1:
+        return alerts[0].subject, alerts[0].message
+
+    latest = alerts[-1]
+    subject = f'{latest.subject} (+{len(alerts) - 1} earlier alert(s))'
+    body = '\n'.join(
+        f"[{timezone.localtime(alert.created_at):%H:%M:%S}] {alert.subject}\n{alert.message}"
+        for alert in reversed(alerts)
+    )
+    return subject, body
+
+
+def due_alerts(window=60, flush=False):
+    """Unsent alerts that send_admin_alerts() would pick up now."""
+    pending = AdminAlert.objects.filter(sent_at__isnull=True)
+    if not flush:
+        pending = pending.filter(created_at__lt=window_start(timezone.now(), window))
+    return pending
+
+
+def send_admin_alerts(window=60, batch_size=500, flush=False):
+    """
+    Send pending alerts as one digest per sweet per `window` seconds.
+
+    Alerts in the current (still open) window are left for a later run so
+    that a burst keeps coalescing, unless `flush` is set. Without ADMINS
+    nothing is claimed, so the alerts wait until recipients are configured.
+    Returns the number of e-mails sent.
+    """
+    recipients = [email for _, email in settings.ADMINS]
+    if not recipients:
+        logger.warning("No ADMINS configured; admin alerts stay queued")
+        return 0
+
+    now = timezone.now()
+    pending = due_alerts(window, flush)
+
+    # Claim a batch; skip_locked lets several workers run side by side
+    with transaction.atomic():
+        alerts = list(
+            pending.select_for_update(skip_locked=True).order_by('created_at')[:batch_size]
+        )
+        if not alerts:
+            return 0
+        claimed = [alert.pk for alert in alerts]
+        AdminAlert.objects.filter(pk__in=claimed).update(sent_at=now)
+
+    groups = defaultdict(list)
+    for alert in alerts:
+        groups[(alert.sweet_id, window_start(alert.created_at, window))].append(alert)
+
+    emails = []
+    for group in groups.values():
+        subject, body = build_digest(group)
+        emails.append(EmailMessage(
+            subject=f'{settings.EMAIL_SUBJECT_PREFIX}{subject}',
+            body=body,
+            from_email=settings.SERVER_EMAIL,
+            to=recipients,
+        ))
+
+    try:
+        with get_connection() as mail_connection:
+            sent = mail_connection.send_messages(emails) or 0
+    except Exception as e:
+        # Release the batch so the next run retries it
+        AdminAlert.objects.filter(pk__in=claimed).update(sent_at=None)
+        logger.error(f"Failed to send admin alerts: {str(e)}")
+        return 0
+
+    logger.info(f"Sent {sent} admin alert e-mail(s) for {len(alerts)} alert(s)")
+    return sent
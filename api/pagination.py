@@ -0,0 +1,182 @@
+"""
+Keyset (cursor) pagination for sweet listings.
+
+Opt-in alternative to page numbers: ``?pagination=cursor`` starts at the
+first page, and the returned ``next`` / ``previous`` links carry an opaque
+``cursor``. Each page is one indexed range scan on (ordering field, id), so
+deep pages cost the same as the first; no COUNT(*) runs unless
+``?count=true`` is passed, and that count is cached per inventory version.
+
+Search results ranked by relevance have no keyset to resume from, so a
+cursor on them is rejected (400) unless an explicit ordering is passed.
+"""
+import base64
+import hashlib
+import json
+from decimal import InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, Sum
+from rest_framework.exceptions import NotFound, ValidationError as DRFValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import InventorySummary
+from .response_cache import current_version, get_cache
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over one ordering field with an id tiebreak.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    # Query parameter holding the ordering (search_sweets uses 'sort_by')
+    ordering_param = 'ordering'
+    ordering_fields = ('created_at', 'price', 'name', 'quantity')
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+    ranked_message = 'Cursor pagination cannot follow search relevance; pass {param} or use page numbers'
+
+    @classmethod
+    def requested(cls, request):
+        """True if the client asked for cursor pagination."""
+        return cls.cursor_query_param in request.query_params or \
+            request.query_params.get('pagination') == 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        """(field, descending) from the ordering parameter, first field only."""
+        ordering = request.query_params.get(self.ordering_param) or self.default_ordering
+        ordering = ordering.split(',')[0].strip()
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields:
+            ordering = self.default_ordering
+            field = ordering.lstrip('-')
+        return field, ordering.startswith('-')
+
+    def decode_cursor(self, request):
+        """(value, pk, reverse) from the cursor parameter, or None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            # The value is filtered on as-is: it must suit the current
+            # ordering field (a cursor may outlive a change of sort)
+            value = self.model._meta.get_field(self.field).to_python(value)
+            if value is None:
+                raise ValueError('Empty cursor value')
+            return value, int(pk), bool(reverse)
+        except (TypeError, ValueError, ValidationError, InvalidOperation):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        value = getattr(row, self.field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif not isinstance(value, (int, str)):
+            value = str(value)
+        payload = json.dumps([value, row.pk, int(reverse)], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if 'search_rank' in queryset.query.annotations:
+            raise DRFValidationError({self.cursor_query_param: self.ranked_message.format(param=self.ordering_param)})
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.field, descending = self.get_ordering(request)
+        self.count = self.get_count(queryset) if self.count_requested(request) else None
+
+        # Cursors read the ordering field, so keep it in a narrowed .only()
+        loading, deferred = queryset.query.deferred_loading
+        if not deferred:
+            queryset = queryset.only(*loading, self.field)
+        
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        # Walk backwards for "previous" pages, then flip the rows back
+        descending_scan = descending != reverse
+        lookup = 'lt' if descending_scan else 'gt'
+        queryset = queryset.order_by(*(
+            f'-{name}' if descending_scan else name for name in (self.field, 'id')
+        ))
+        if cursor:
+            # (field, id) past the cursor row; the inclusive bound on its
+            # own lets the database seek into the index
+            value, pk = cursor[:2]
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}e': value}),
+                Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'id__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_count(self, queryset):
+        """
+        Row count for `queryset`: read from InventorySummary when it is
+        unfiltered, otherwise counted once per inventory version.
+        """
+        if not queryset.query.where:
+            return InventorySummary.objects.aggregate(total=Sum('sweet_count'))['total'] or 0
+
+        cache = get_cache()
+        digest = hashlib.sha1(str(queryset.order_by().query).encode()).hexdigest()
+        key = f'count:{current_version()}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count)
+        return count
+
+    def get_link(self, row, reverse):
+        url = remove_query_param(self.base_url, 'pagination')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'page_size': self.page_size,
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
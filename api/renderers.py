@@ -0,0 +1,33 @@
+"""
+Renderers for high-volume sweet endpoints.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional; JSONRenderer's encoder is used instead
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+    
+    The bytes match JSONRenderer with the default settings (compact,
+    UTF-8, U+2028/U+2029 escaped) for strings, ints, bools, None, lists
+    and dicts. Data orjson refuses (Decimal, lazy translations, non-string
+    keys) is handed to JSONRenderer. orjson writes some floats differently
+    (1e16 rather than 1e+16), so only use this for float-free payloads such
+    as the sweet listing.
+    """
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for JavaScript (JSONP) embedding
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
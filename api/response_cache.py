@@ -0,0 +1,198 @@
+"""
+Versioned response cache for read-heavy sweet endpoints.
+
+Responses are cached under the view name, the request's scheme and host
+(bodies hold absolute links), the normalised query string and the
+current inventory version. Any change to sweets bumps the version
+(from signals and summary.tracked_update()), which orphans every older
+entry at once; orphans age out through the backend's TTL and LRU culling.
+
+The same version drives conditional GET: conditional_get() derives a
+strong ETag from it and Last-Modified from the time of the last bump, so
+If-None-Match / If-Modified-Since are answered with 304 before any query
+or serialisation.
+
+Responses live in the ``responses`` alias in CACHES (locmem or file
+based, see RESPONSE_CACHE_BACKEND in settings). The version lives in the
+file based ``response_versions`` alias whatever that backend is: every
+worker process must see a bump, or the others would keep serving and
+304-ing what they cached before it.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+VERSION_KEY = 'inventory-version'
+MODIFIED_KEY = 'inventory-modified'
+
+
+def get_cache():
+    return caches['responses']
+
+
+def get_version_cache():
+    # Shared by every worker process, even when responses are cached per process
+    return caches['response_versions']
+
+
+def current_version():
+    """The inventory version, starting from a fresh value if evicted."""
+    cache = get_version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Never reuse a number an older (evicted) counter may have had
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def last_modified():
+    """When the inventory version last changed (second precision)."""
+    cache = get_version_cache()
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        if not cache.add(MODIFIED_KEY, modified, timeout=None):
+            modified = cache.get(MODIFIED_KEY, modified)
+    return datetime.fromtimestamp(modified, tz=dt_timezone.utc)
+
+
+def _bump():
+    cache = get_version_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY, int(time.time()), timeout=None)
+
+
+def bump_version():
+    """
+    Invalidate all cached responses.
+
+    Bumped now, for readers on this connection, and again on commit, so a
+    response built from pre-commit data cannot stay cached.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+class CacheMetrics:
+    """Per-endpoint hit/miss counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counts[name]['hits' if hit else 'misses'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {name: dict(counts) for name, counts in self._counts.items()}
+        for counts in endpoints.values():
+            total = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = round(counts['hits'] / total, 4) if total else 0.0
+        return endpoints
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+metrics = CacheMetrics()
+
+
+def params_digest(request):
+    """Hash of the query parameters, independent of their order."""
+    params = sorted(request.GET.lists())
+    return hashlib.sha1(repr(params).encode()).hexdigest()
+
+
+def origin(request):
+    """Scheme and host: cached bodies hold absolute links (next, image_url) built from them."""
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def cache_key(name, request, version):
+    digest = hashlib.sha1(f'{origin(request)}:{params_digest(request)}'.encode()).hexdigest()
+    return f'response:{name}:{version}:{digest}'
+
+
+def inventory_etag(request, *args, **kwargs):
+    """Strong ETag for this origin, path and query under the current inventory version."""
+    return hashlib.sha1(
+        f'{current_version()}:{origin(request)}{request.path}:{params_digest(request)}'.encode()
+    ).hexdigest()
+
+
+def inventory_last_modified(request, *args, **kwargs):
+    return last_modified()
+
+
+_inventory_condition = condition(
+    etag_func=inventory_etag,
+    last_modified_func=inventory_last_modified
+)
+
+
+def conditional_get(view):
+    """
+    Decorator for GET handlers (after authentication): answers 304 when the
+    client's validators still match and sets ETag / Last-Modified on 200s.
+
+    Errors (400, 404, ...) go out without validators, so a client can never
+    revalidate a cached error body into a 304.
+    """
+    conditional = _inventory_condition(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            del response['ETag']
+            del response['Last-Modified']
+        return response
+    return wrapper
+
+
+def _plain(data):
+    """Copy serializer output into plain dicts/lists (ReturnDict keeps a serializer reference)."""
+    if isinstance(data, dict):
+        return {key: _plain(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_plain(value) for value in data]
+    return data
+
+
+def cached_response(name, request, build):
+    """
+    Return the cached response for `name` and this request's query
+    parameters, or call `build()` and cache its data if it is a 200.
+    """
+    cache = get_cache()
+    key = cache_key(name, request, current_version())
+
+    data = cache.get(key)
+    if data is not None:
+        metrics.record(name, hit=True)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    metrics.record(name, hit=False)
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, _plain(response.data))
+    response['X-Cache'] = 'MISS'
+    return response
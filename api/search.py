@@ -0,0 +1,185 @@
+"""
+Full-text search over sweet name, description and category.
+
+PostgreSQL: a GIN index on a weighted tsvector expression (name A,
+description B, category C), matched with to_tsquery and ranked by ts_rank.
+
+SQLite: an FTS5 table (external content on api_sweet) kept in sync by
+triggers, matched with MATCH and ranked by weighted bm25. Django rebuilds
+SQLite tables on some schema changes, which drops their triggers, so
+install() also runs after every migrate and restores anything missing.
+
+Every search term is a prefix query ("choc" finds "chocolate"); all terms
+must match. Other database backends fall back to icontains.
+"""
+import logging
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Lookup, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from .models import SweetSearchEntry
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = SweetSearchEntry._meta.db_table
+PG_INDEX = 'api_sweet_search_idx'
+
+# Weighted document; the query repeats it so the planner uses the index
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({t}name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({t}description, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce({t}category, '')), 'C')"
+)
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, category,
+        content='api_sweet', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_sweet BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_sweet BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END""",
+    # Stock and price updates do not touch the index
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF name, description, category ON api_sweet BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+]
+
+SQLITE_TRIGGERS = {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'}
+
+
+def install(using=None):
+    """
+    Create the search index for `using` (a connection) if it is missing.
+    Returns True if anything was (re)created.
+    """
+    using = using or connection
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON api_sweet "
+                f"USING gin (({PG_VECTOR.format(t='')}))"
+            )
+            return False
+
+        if using.vendor != 'sqlite':
+            return False
+
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+            [f'{FTS_TABLE}%']
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE in existing and SQLITE_TRIGGERS <= existing:
+            return False
+
+        for statement in SQLITE_SETUP:
+            cursor.execute(statement)
+        # Name matches count most, then description, then category
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')"
+        )
+        # Rows written while the triggers were missing are re-indexed too
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    logger.info(f"Installed full-text search index on {using.alias}")
+    return True
+
+
+class Match(Lookup):
+    """`document__match=query`: an FTS5 MATCH on SweetSearchEntry."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+SweetSearchEntry._meta.get_field('document').register_lookup(Match)
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text or '')
+
+
+def search(queryset, text, name_only=False, rank=True):
+    """
+    Filter `queryset` to sweets matching every term of `text` as a prefix.
+
+    With `rank`, annotates `search_rank` (higher is better) and orders by it.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return queryset
+
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        # ":*" makes a prefix match, "A" restricts it to the name weight
+        suffix = ':*A' if name_only else ':*'
+        query = ' & '.join(f'{term}{suffix}' for term in terms)
+        vector = PG_VECTOR.format(t=f'"{queryset.model._meta.db_table}".')
+        queryset = queryset.filter(RawSQL(
+            f"({vector}) @@ to_tsquery('simple', %s)", [query], output_field=BooleanField()
+        ))
+        if rank:
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f"ts_rank(({vector}), to_tsquery('simple', %s))", [query],
+                output_field=FloatField()
+            )).order_by('-search_rank', 'id')
+        return queryset
+
+    if vendor == 'sqlite':
+        match = ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+        if name_only:
+            match = f'name : ({match})'
+        if not rank:
+            return queryset.filter(
+                pk__in=SweetSearchEntry.objects.filter(document__match=match).values('sweet')
+            )
+        # The rank column is only readable from a join with the FTS table
+        # (a correlated subquery re-runs the match per row). It is bm25
+        # with the weights set in install(): lower is better, so negate
+        # it to sort descending like ts_rank.
+        return queryset.filter(search_entry__document__match=match).annotate(
+            search_rank=-F('search_entry__rank')
+        ).order_by('-search_rank', 'id')
+
+    for term in terms:
+        if name_only:
+            queryset = queryset.filter(name__icontains=term)
+        else:
+            queryset = queryset.filter(
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(category__icontains=term)
+            )
+    return queryset
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    `?search=` filter backend using the full-text index.
+
+    Results are ranked by relevance unless the client passed an explicit
+    ordering, so it must come after OrderingFilter in filter_backends.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        ordering_param = getattr(view, 'ordering_param', 'ordering')
+        rank = not request.query_params.get(ordering_param)
+        return search(queryset, text, rank=rank)
@@ -1,10 +1,73 @@
 from rest_framework import serializers
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from django.core.validators import MinValueValidator, MaxValueValidator
-from .models import Sweet
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+from .models import MAX_INVENTORY_VALUE, Sweet
+from .bulk import OPERATIONS as BULK_OPERATIONS
 from decimal import Decimal, ROUND_HALF_UP
 
 
-class SweetSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """
+    (fields, exclude) from ?fields= / ?exclude= on a GET request; `fields`
+    is None when every field is wanted.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None, set()
+    
+    def names(param):
+        value = request.query_params.get(param, '')
+        return {name.strip() for name in value.split(',') if name.strip()}
+    
+    return names('fields') or None, names('exclude')
+
+
+class SparseFieldsMixin:
+    """
+    Response shaping for read requests: ?fields=id,quantity keeps only
+    those fields and ?exclude=description drops fields. Unwanted fields
+    are never built, so their (often computed) values are never worked out.
+    
+    sparse_columns() gives the model columns the remaining fields read, for
+    narrowing the query with QuerySet.only().
+    """
+    # Model columns read by fields that are not plain model fields
+    field_columns = {
+        'category_display': ('category',),
+        'is_available': ('quantity',),
+        'stock_status': ('quantity',),
+        'total_value': ('price', 'quantity'),
+        'days_since_created': ('created_at',),
+        'image_url': ('image',),
+    }
+    
+    @classmethod
+    def selected_fields(cls, field_names, request):
+        fields, exclude = requested_fields(request)
+        return [
+            name for name in field_names
+            if (fields is None or name in fields) and name not in exclude
+        ]
+    
+    @classmethod
+    def sparse_columns(cls, request):
+        """Model columns needed for this request, or None if all fields are wanted."""
+        fields, exclude = requested_fields(request)
+        if fields is None and not exclude:
+            return None
+        columns = {'id'}
+        for name in cls.selected_fields(cls.Meta.fields, request):
+            columns.update(cls.field_columns.get(name, (name,)))
+        return columns
+    
+    def get_field_names(self, declared_fields, info):
+        field_names = super().get_field_names(declared_fields, info)
+        return self.selected_fields(field_names, self.context.get('request'))
+
+
+class SweetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Sweet model (full details).
     """
@@ -158,19 +221,19 @@ class SweetSerializer(serializers.ModelSerializer):
                 })
         
         # Validate price-quantity ratio (business rule example)
-        price = data.get('price')
-        quantity = data.get('quantity')
+        self.validate_inventory_value(data.get('price'), data.get('quantity'))
         
+        return data
+    
+    def validate_inventory_value(self, price, quantity):
+        """Validate that the stock is worth at most MAX_INVENTORY_VALUE."""
         if price and quantity:
             total_value = price * quantity
             
-            # Example business rule: Inventory value shouldn't exceed 1,00,000
-            if total_value > 100000:
+            if total_value > MAX_INVENTORY_VALUE:
                 raise serializers.ValidationError({
                     'quantity': f"Total inventory value (₹{total_value:,.2f}) exceeds maximum limit of ₹1,00,000."
                 })
-        
-        return data
     
     def create(self, validated_data):
         """Create a new sweet."""
@@ -189,17 +252,13 @@ class SweetSerializer(serializers.ModelSerializer):
     
     def update(self, instance, validated_data):
         """Update an existing sweet."""
-        # Track changes
-        changes = {}
-        for field, value in validated_data.items():
-            old_value = getattr(instance, field)
-            if old_value != value:
-                changes[field] = {'old': old_value, 'new': value}
-        
         # Update instance
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
+        # Track changes against the values loaded from the database
+        changes = instance.get_dirty_fields()
+        
         # Save if there are changes
         if changes:
             instance.save()
@@ -212,7 +271,7 @@ class SweetSerializer(serializers.ModelSerializer):
         return instance
 
 
-class SweetListSerializer(serializers.ModelSerializer):
+class SweetListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Simplified serializer for sweet listing.
     """
@@ -241,6 +300,103 @@ class SweetListSerializer(serializers.ModelSerializer):
         return None
 
 
+class FastSweetListSerializer:
+    """
+    Read-only stand-in for SweetListSerializer(many=True) on listings.
+    
+    Rows are fetched with values_list() and turned into dicts by one
+    closure over the requested fields, so no DRF field objects or model
+    instances are involved. The output is exactly what
+    SweetListSerializer produces for the same sweets.
+    """
+    columns = ('id', 'name', 'category', 'price', 'quantity', 'image', 'is_featured')
+    # SweetListSerializer field -> (column it is read from, name of the
+    # method converting that column's value, or None to copy it)
+    sources = {
+        'id': ('id', None),
+        'name': ('name', None),
+        'category': ('category', None),
+        'category_display': ('category', 'category_label'),
+        'price': ('price', 'decimal'),
+        'quantity': ('quantity', None),
+        'is_available': ('quantity', 'is_available'),
+        'image_url': ('image', 'optional_image_url'),
+        'is_featured': ('is_featured', None),
+    }
+    
+    def __init__(self, request=None):
+        self.request = request
+        self.storage = Sweet._meta.get_field('image').storage
+        self.image_base = self.get_image_base()
+        # Labels are resolved once, in the active language
+        self.labels = {value: str(label) for value, label in Sweet.Category.choices}
+        
+        # Only the columns ?fields= / ?exclude= leave in use
+        needed = SweetListSerializer.sparse_columns(request)
+        if needed is not None:
+            self.columns = tuple(column for column in self.columns if column in needed)
+        positions = {column: index for index, column in enumerate(self.columns)}
+        names = SweetListSerializer.selected_fields(SweetListSerializer.Meta.fields, request)
+        fields = []
+        for name in names:
+            column, converter = self.sources[name]
+            fields.append((name, positions[column], converter and getattr(self, converter)))
+        fields = tuple(fields)
+        
+        def to_dict(row):
+            return {
+                name: row[index] if convert is None else convert(row[index])
+                for name, index, convert in fields
+            }
+        self.to_dict = to_dict
+    
+    @classmethod
+    def supports(cls):
+        """False if SweetListSerializer has grown a field this class cannot build."""
+        return set(SweetListSerializer.Meta.fields) <= set(cls.sources)
+    
+    def get_image_base(self):
+        """
+        Absolute URL prefix for images when FileSystemStorage.url() plus
+        build_absolute_uri() amount to plain concatenation, else None.
+        """
+        base_url = getattr(self.storage, 'base_url', None)
+        if self.request is None or getattr(self.storage.url, '__func__', None) is not FileSystemStorage.url \
+                or not base_url or not base_url.startswith('/') or base_url.startswith('//') \
+                or '/./' in base_url or '/../' in base_url:
+            return None
+        return self.request.build_absolute_uri(base_url)
+    
+    def category_label(self, value):
+        return self.labels.get(value, value)
+    
+    decimal = staticmethod('{:f}'.format)
+    
+    @staticmethod
+    def is_available(quantity):
+        return quantity > 0
+    
+    def optional_image_url(self, name):
+        return self.image_url(name) if name else None
+    
+    def image_url(self, name):
+        if self.image_base is not None:
+            path = filepath_to_uri(name).lstrip('/')
+            # urljoin() would resolve dot segments
+            if not {'.', '..'} & set(path.split('/')):
+                return self.image_base + path
+        url = self.storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+    
+    def prepare(self, queryset):
+        return queryset.values_list(*self.columns)
+    
+    def to_representation(self, rows):
+        return list(map(self.to_dict, rows))
+
+
 class PurchaseSerializer(serializers.Serializer):
     """
     Serializer for purchasing sweets.
@@ -256,8 +412,11 @@ class PurchaseSerializer(serializers.Serializer):
         """Validate purchase quantity."""
         sweet = self.context.get('sweet')
         
-        if not sweet:
-            raise serializers.ValidationError("Sweet not found.")
+        # Without a loaded sweet the stock check happens atomically in create()
+        if sweet is None:
+            if self.context.get('sweet_id') is None:
+                raise serializers.ValidationError("Sweet not found.")
+            return value
         
         if value > sweet.quantity:
             raise serializers.ValidationError(
@@ -269,20 +428,113 @@ class PurchaseSerializer(serializers.Serializer):
     def create(self, validated_data):
         """Process purchase."""
         sweet = self.context.get('sweet')
+        sweet_id = sweet.pk if sweet is not None else self.context['sweet_id']
         quantity = validated_data['quantity']
         
-        # Perform purchase
-        success, message = sweet.purchase(quantity)
+        # Single guarded UPDATE; never reads stock into Python first
+        purchased = Sweet.objects.take_stock(sweet_id, quantity)
         
-        if not success:
-            raise serializers.ValidationError(message)
+        if purchased is None:
+            available = Sweet.objects.filter(pk=sweet_id).values_list(
+                'quantity', flat=True
+            ).first()
+            if available is None:
+                raise Http404('Sweet not found.')
+            if available == 0:
+                raise serializers.ValidationError({'error': 'This sweet is out of stock'})
+            raise serializers.ValidationError({
+                'quantity': [f"Only {available} item(s) available in stock."]
+            })
+        
+        if sweet is not None:
+            sweet.quantity = purchased.quantity
         
         return {
-            'sweet': sweet,
+            'sweet': purchased,
             'quantity': quantity,
-            'total_price': sweet.price * quantity,
-            'remaining_stock': sweet.quantity,
-            'message': message
+            'total_price': purchased.price * quantity,
+            'remaining_stock': purchased.quantity,
+            'message': _('Purchase successful.')
+        }
+
+
+class CheckoutLineSerializer(PurchaseSerializer):
+    """
+    One cart line: a sweet and the quantity to purchase.
+    """
+    sweet_id = serializers.IntegerField(required=True, min_value=1)
+    
+    def validate_quantity(self, value):
+        """Range is checked by the field; stock is checked in bulk at checkout."""
+        return value
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """
+    Serializer for purchasing several sweets in one all-or-nothing checkout.
+    """
+    items = CheckoutLineSerializer(many=True, allow_empty=False)
+    
+    MAX_LINES = 50
+    
+    def validate_items(self, value):
+        """Limit cart size and merge repeated sweets into one line."""
+        if len(value) > self.MAX_LINES:
+            raise serializers.ValidationError(
+                f"A checkout can contain at most {self.MAX_LINES} lines."
+            )
+        
+        merged = {}
+        for line in value:
+            merged[line['sweet_id']] = merged.get(line['sweet_id'], 0) + line['quantity']
+        
+        for sweet_id, quantity in merged.items():
+            if quantity > 100:
+                raise serializers.ValidationError(
+                    f"Cannot purchase more than 100 units of sweet {sweet_id}."
+                )
+        
+        return [{'sweet_id': k, 'quantity': v} for k, v in merged.items()]
+    
+    def create(self, validated_data):
+        """
+        Reserve every line with a single guarded UPDATE.
+        Returns per-line results with `success` False if nothing was bought.
+        """
+        lines = validated_data['items']
+        quantities = {line['sweet_id']: line['quantity'] for line in lines}
+        
+        purchased = Sweet.objects.take_stock_many(quantities)
+        
+        if purchased is None:
+            available = dict(
+                Sweet.objects.filter(pk__in=quantities).values_list('id', 'quantity')
+            )
+            results = []
+            for sweet_id, quantity in quantities.items():
+                line = {'sweet_id': sweet_id, 'quantity': quantity}
+                if sweet_id not in available:
+                    line['error'] = 'Sweet not found.'
+                elif quantity > available[sweet_id]:
+                    line['available'] = available[sweet_id]
+                    line['error'] = f"Only {available[sweet_id]} item(s) available in stock."
+                results.append(line)
+            return {'success': False, 'lines': results}
+        
+        results = []
+        for sweet_id, quantity in quantities.items():
+            sweet = purchased[sweet_id]
+            results.append({
+                'sweet': sweet,
+                'quantity': quantity,
+                'total_price': sweet.price * quantity,
+                'remaining_stock': sweet.quantity,
+            })
+        
+        return {
+            'success': True,
+            'lines': results,
+            'total_price': sum(line['total_price'] for line in results),
         }
 
 
@@ -325,6 +577,99 @@ class RestockSerializer(serializers.Serializer):
         }
 
 
+class BulkOperationSerializer(serializers.Serializer):
+    """
+    Serializer for bulk operations (see api.bulk.BulkOperation).
+    """
+    operation = serializers.ChoiceField(choices=BULK_OPERATIONS)
+    
+    sweet_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        help_text="Sweets to change (every operation but adjust_quantity)."
+    )
+    
+    quantity = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=10000,
+        help_text="Units added to each sweet (restock)."
+    )
+    
+    quantities = serializers.DictField(
+        child=serializers.IntegerField(min_value=-10000, max_value=10000),
+        required=False,
+        help_text="Quantity change per sweet id (adjust_quantity)."
+    )
+    
+    price = serializers.DecimalField(
+        required=False,
+        max_digits=10,
+        decimal_places=2,
+        min_value=Decimal('0.01'),
+        help_text="New price (set_price)."
+    )
+    
+    percent = serializers.DecimalField(
+        required=False,
+        max_digits=6,
+        decimal_places=2,
+        min_value=Decimal('-99.99'),
+        max_value=Decimal('1000'),
+        help_text="Price change in percent, e.g. -10 (percent_price_change)."
+    )
+    
+    is_featured = serializers.BooleanField(required=False, help_text="Featured flag (set_featured).")
+    
+    category = serializers.ChoiceField(
+        required=False,
+        choices=Sweet.Category.choices,
+        help_text="Target category (move_category)."
+    )
+    
+    # Argument each operation needs besides the ids
+    ARGUMENTS = {
+        'restock': 'quantity',
+        'adjust_quantity': 'quantities',
+        'set_price': 'price',
+        'percent_price_change': 'percent',
+        'set_featured': 'is_featured',
+        'move_category': 'category',
+    }
+    
+    def validate_quantities(self, value):
+        """Sweet ids (JSON object keys) as integers; zero changes dropped."""
+        quantities = {}
+        for key, delta in value.items():
+            try:
+                sweet_id = int(key)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(f'"{key}" is not a valid sweet id.')
+            if delta:
+                quantities[sweet_id] = delta
+        if not quantities:
+            raise serializers.ValidationError("At least one non-zero quantity change is required.")
+        return quantities
+    
+    def validate(self, data):
+        operation = data['operation']
+        argument = self.ARGUMENTS.get(operation)
+        if argument and argument not in data:
+            raise serializers.ValidationError({argument: f"This field is required for {operation}."})
+        
+        if operation == 'adjust_quantity':
+            data['sweet_ids'] = list(data['quantities'])
+        elif not data.get('sweet_ids'):
+            raise serializers.ValidationError({'sweet_ids': "This field is required."})
+        
+        if operation == 'percent_price_change' and not data['percent']:
+            raise serializers.ValidationError({'percent': "Percent change cannot be zero."})
+        
+        # Only the selected operation's argument is passed on
+        params = {argument: data[argument]} if argument else {}
+        return {'operation': operation, 'sweet_ids': data['sweet_ids'], **params}
+
+
 class SweetSearchSerializer(serializers.Serializer):
     """
     Serializer for sweet search parameters.
@@ -345,6 +690,7 @@ class SweetSearchSerializer(serializers.Serializer):
     )
     available_only = serializers.BooleanField(required=False, default=False)
     is_featured = serializers.BooleanField(required=False, default=False)
+    facets = serializers.BooleanField(required=False, default=False)
     sort_by = serializers.ChoiceField(
         required=False,
         choices=[
@@ -375,13 +721,17 @@ class SweetSearchSerializer(serializers.Serializer):
 
 class SweetStatsSerializer(serializers.Serializer):
     """
-    Serializer for sweet statistics.
+    Serializer for sweet statistics (see api.stats.inventory_stats).
     """
     total_sweets = serializers.IntegerField()
-    total_value = serializers.DecimalField(max_digits=12, decimal_places=2)
-    average_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_value = serializers.FloatField()
+    average_price = serializers.FloatField()
     total_quantity = serializers.IntegerField()
-    out_of_stock = serializers.IntegerField()
-    low_stock = serializers.IntegerField()
-    in_stock = serializers.IntegerField()
-    by_category = serializers.DictField()
\ No newline at end of file
+    total_available = serializers.IntegerField()
+    stock_status = serializers.DictField(child=serializers.IntegerField())
+    by_category = serializers.ListField(child=serializers.DictField())
+    recent_additions_7_days = serializers.IntegerField()
+    most_valuable_sweets = serializers.ListField(
+        child=serializers.DictField(),
+        required=False
+    )
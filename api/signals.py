@@ -1,10 +1,19 @@
 from django.db.models.signals import post_save, pre_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
-from django.core.mail import mail_admins
+from django.db import transaction
 from django.utils import timezone
 import logging
-from .models import Sweet
+from .models import (
+    AUTO_FEATURE_VALUE, Sweet, AdminAlert, PurchaseRecord, stock_changed, sweets_imported, sweets_bulk_updated,
+    sweets_bulk_deleted, purchase_recorded
+)
+from .notifications import queue_admin_alert
+from . import notifications, summary
+from .response_cache import bump_version
+from .autocomplete import index as autocomplete_index
+from .broadcast import publisher
+from .tape import tape
 
 logger = logging.getLogger(__name__)
 
@@ -14,15 +23,11 @@ def sweet_pre_save(sender, instance, **kwargs):
     """
     Signal triggered before a Sweet is saved.
     """
-    # Track changes for audit
-    if instance.pk:
-        try:
-            old_instance = Sweet.objects.get(pk=instance.pk)
-            instance._old_quantity = old_instance.quantity
-            instance._old_price = old_instance.price
-        except Sweet.DoesNotExist:
-            instance._old_quantity = None
-            instance._old_price = None
+    # Track changes for audit, from the values snapshotted at load time
+    # (instances built by hand rather than loaded have nothing to diff against)
+    if instance.pk and instance.has_snapshot():
+        instance._old_quantity = instance.get_initial_value('quantity')
+        instance._old_price = instance.get_initial_value('price')
     else:
         instance._old_quantity = None
         instance._old_price = None
@@ -35,7 +40,7 @@ def sweet_pre_save(sender, instance, **kwargs):
         instance.description = instance.description.strip()
     
     # Auto-feature high-value sweets
-    if instance.price * instance.quantity > 50000:  # If inventory value > 50k
+    if instance.price * instance.quantity > AUTO_FEATURE_VALUE:
         instance.is_featured = True
 
 
@@ -59,14 +64,6 @@ def sweet_post_save(sender, instance, created, **kwargs):
         if hasattr(instance, '_old_quantity') and instance._old_quantity != instance.quantity:
             change = f"Quantity: {instance._old_quantity} → {instance.quantity}"
             changes.append(change)
-            
-            # Check if stock is critically low
-            if instance.quantity <= 10 and instance._old_quantity > 10:
-                send_low_stock_alert(instance)
-            
-            # Check if restocked from zero
-            if instance.quantity > 0 and instance._old_quantity == 0:
-                send_restock_notification(instance)
         
         if hasattr(instance, '_old_price') and instance._old_price != instance.price:
             change = f"Price: {instance._old_price} → {instance.price}"
@@ -75,9 +72,234 @@ def sweet_post_save(sender, instance, created, **kwargs):
         if changes:
             logger.info(f"Sweet updated: {instance.name} - {', '.join(changes)}")
         
-        # Check if sweet went out of stock
-        if instance.quantity == 0 and hasattr(instance, '_old_quantity') and instance._old_quantity > 0:
-            send_out_of_stock_alert(instance)
+        if getattr(instance, '_old_quantity', None) is not None:
+            check_stock_thresholds(instance, instance._old_quantity)
+
+
+@receiver(stock_changed, sender=Sweet)
+def sweet_stock_changed(sender, instance, old_quantity, **kwargs):
+    """
+    Signal triggered when stock moves without a save() (atomic purchases).
+    """
+    logger.info(f"Sweet updated: {instance.name} - Quantity: {old_quantity} → {instance.quantity}")
+    check_stock_thresholds(instance, old_quantity)
+
+
+@receiver(sweets_imported, sender=Sweet)
+def sweets_imported_batch(sender, sweets, **kwargs):
+    """
+    One event per imported batch, in place of per-row post_save handling.
+    """
+    logger.info(f"Imported {len(sweets)} sweets (IDs {sweets[0].pk}-{sweets[-1].pk})")
+    
+    high_value = [sweet for sweet in sweets if sweet.price * sweet.quantity > 10000]
+    if high_value:
+        send_imported_high_value_notification(high_value)
+
+
+@receiver(sweets_bulk_updated, sender=Sweet)
+def sweets_bulk_updated_batch(sender, changes, **kwargs):
+    """
+    One event per bulk-updated batch: the stock-threshold alerts of all its
+    rows are queued with one INSERT.
+    """
+    logger.info(f"Bulk update changed {len(changes)} sweets")
+    
+    with notifications.collect():
+        for before, after in changes:
+            check_stock_thresholds(after, before.quantity)
+
+
+@receiver(sweets_bulk_deleted, sender=Sweet)
+def sweets_bulk_deleted_batch(sender, sweets, **kwargs):
+    """
+    One event per bulk-deleted batch, in place of per-row post_delete handling.
+    """
+    logger.warning(f"Bulk deleted {len(sweets)} sweets")
+    
+    send_bulk_deletion_notification(sweets)
+
+
+@receiver(post_save, sender=Sweet)
+@receiver(post_delete, sender=Sweet)
+@receiver(stock_changed, sender=Sweet)
+@receiver(sweets_imported, sender=Sweet)
+@receiver(sweets_bulk_updated, sender=Sweet)
+@receiver(sweets_bulk_deleted, sender=Sweet)
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Any change to a sweet orphans every cached list/stats response.
+    """
+    bump_version()
+
+
+@receiver(post_save, sender=Sweet)
+def update_autocomplete_on_save(sender, instance, created, **kwargs):
+    """
+    Keep the in-memory autocomplete index in step with names and categories.
+    """
+    if created or instance.get_initial_value('name') != instance.name \
+            or instance.get_initial_value('category') != instance.category:
+        autocomplete_index.upsert(instance.pk, instance.name, instance.category)
+
+
+@receiver(post_delete, sender=Sweet)
+def update_autocomplete_on_delete(sender, instance, **kwargs):
+    autocomplete_index.remove(instance.pk)
+
+
+@receiver(sweets_imported, sender=Sweet)
+def update_autocomplete_on_import(sender, sweets, **kwargs):
+    autocomplete_index.add_many([(sweet.pk, sweet.name, sweet.category) for sweet in sweets])
+
+
+@receiver(sweets_bulk_updated, sender=Sweet)
+def update_autocomplete_on_bulk_update(sender, changes, **kwargs):
+    autocomplete_index.upsert_many([
+        (after.pk, after.name, after.category)
+        for before, after in changes if before.category != after.category
+    ])
+
+
+@receiver(sweets_bulk_deleted, sender=Sweet)
+def update_autocomplete_on_bulk_delete(sender, sweets, **kwargs):
+    autocomplete_index.remove_many([sweet.pk for sweet in sweets])
+
+
+@receiver(post_save, sender=Sweet)
+def publish_saved_sweet(sender, instance, created, **kwargs):
+    """
+    Publish new sweets and saved stock/price changes (restocks, edits) to
+    WebSocket clients once the transaction commits.
+    """
+    pk = instance.pk
+    if created or instance._old_price != instance.price:
+        transaction.on_commit(lambda: publisher.queue([pk], full=True))
+    elif instance._old_quantity != instance.quantity:
+        transaction.on_commit(lambda: publisher.queue([pk]))
+
+
+@receiver(stock_changed, sender=Sweet)
+def publish_stock_change(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: publisher.queue([pk]))
+
+
+@receiver(sweets_imported, sender=Sweet)
+def publish_imported_sweets(sender, sweets, **kwargs):
+    pks = [sweet.pk for sweet in sweets]
+    transaction.on_commit(lambda: publisher.queue(pks, full=True))
+
+
+@receiver(sweets_bulk_updated, sender=Sweet)
+def publish_bulk_update(sender, changes, **kwargs):
+    # Price, name or category edits resend the whole sweet; stock moves
+    # only the quantity
+    stock, full = [], []
+    for before, after in changes:
+        same = (before.price, before.name, before.category) == (after.price, after.name, after.category)
+        (stock if same else full).append(after.pk)
+
+    def queue():
+        publisher.queue(stock)
+        publisher.queue(full, full=True)
+    transaction.on_commit(queue)
+
+
+@receiver(post_delete, sender=Sweet)
+def publish_deleted_sweet(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: publisher.queue([pk]))
+
+
+@receiver(sweets_bulk_deleted, sender=Sweet)
+def publish_bulk_delete(sender, sweets, **kwargs):
+    pks = [sweet.pk for sweet in sweets]
+    transaction.on_commit(lambda: publisher.queue(pks))
+
+
+@receiver(purchase_recorded, sender=PurchaseRecord)
+def publish_purchase(sender, record, sweet, **kwargs):
+    """Put recorded purchases on the admins' live sales tape."""
+    transaction.on_commit(lambda: tape.queue(record, sweet))
+
+
+SUMMARY_FIELDS = ('category', 'price', 'quantity')
+
+
+@receiver(post_save, sender=Sweet)
+def update_inventory_summary_on_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Apply the saved change to InventorySummary.
+    """
+    after = tuple(
+        getattr(instance, name)
+        if update_fields is None or name in update_fields
+        else instance.get_initial_value(name)
+        for name in SUMMARY_FIELDS
+    )
+    if created:
+        summary.record_change(None, after)
+        return
+    
+    before = tuple(instance.get_initial_value(name) for name in SUMMARY_FIELDS)
+    if None in before or None in after:
+        # Hand-built or partially loaded instance: nothing to diff against
+        logger.warning(f"Inventory summary not updated for sweet {instance.pk}; run rebuild_inventory_summary")
+        return
+    if before != after:
+        summary.record_change(before, after)
+
+
+@receiver(stock_changed, sender=Sweet)
+def update_inventory_summary_on_stock_change(sender, instance, old_quantity, **kwargs):
+    summary.record_change(
+        (instance.category, instance.price, old_quantity),
+        (instance.category, instance.price, instance.quantity)
+    )
+
+
+@receiver(post_delete, sender=Sweet)
+def update_inventory_summary_on_delete(sender, instance, **kwargs):
+    summary.record_change((instance.category, instance.price, instance.quantity), None)
+
+
+@receiver(sweets_imported, sender=Sweet)
+def update_inventory_summary_on_import(sender, sweets, **kwargs):
+    summary.record_rows([], [(sweet.category, sweet.price, sweet.quantity) for sweet in sweets])
+
+
+@receiver(sweets_bulk_updated, sender=Sweet)
+def update_inventory_summary_on_bulk_update(sender, changes, **kwargs):
+    summary.record_rows(
+        [(before.category, before.price, before.quantity) for before, _ in changes],
+        [(after.category, after.price, after.quantity) for _, after in changes]
+    )
+
+
+@receiver(sweets_bulk_deleted, sender=Sweet)
+def update_inventory_summary_on_bulk_delete(sender, sweets, **kwargs):
+    summary.record_rows([(sweet.category, sweet.price, sweet.quantity) for sweet in sweets], [])
+
+
+def check_stock_thresholds(sweet, old_quantity):
+    """
+    Send alerts when a quantity change crosses a stock threshold.
+    """
+    if old_quantity == sweet.quantity:
+        return
+    
+    # Check if stock is critically low
+    if sweet.quantity <= 10 and old_quantity > 10:
+        send_low_stock_alert(sweet)
+    
+    # Check if restocked from zero
+    if sweet.quantity > 0 and old_quantity == 0:
+        send_restock_notification(sweet)
+    
+    # Check if sweet went out of stock
+    if sweet.quantity == 0 and old_quantity > 0:
+        send_out_of_stock_alert(sweet)
 
 
 @receiver(post_delete, sender=Sweet)
@@ -112,14 +334,10 @@ def send_low_stock_alert(sweet):
         Sweet Shop Management System
         """
         
-        # Send to admins
-        mail_admins(
-            subject=subject,
-            message=message,
-            fail_silently=True,
-        )
+        # Queue for the alert worker (manage.py send_admin_alerts)
+        queue_admin_alert(AdminAlert.Kind.LOW_STOCK, sweet, subject, message)
         
-        logger.info(f"Low stock alert sent for {sweet.name}")
+        logger.info(f"Low stock alert queued for {sweet.name}")
         
     except Exception as e:
         logger.error(f"Failed to send low stock alert: {str(e)}")
@@ -145,13 +363,10 @@ def send_out_of_stock_alert(sweet):
         Sweet Shop Management System
         """
         
-        mail_admins(
-            subject=subject,
-            message=message,
-            fail_silently=True,
-        )
+        # Queue for the alert worker (manage.py send_admin_alerts)
+        queue_admin_alert(AdminAlert.Kind.OUT_OF_STOCK, sweet, subject, message)
         
-        logger.warning(f"Out of stock alert sent for {sweet.name}")
+        logger.warning(f"Out of stock alert queued for {sweet.name}")
         
     except Exception as e:
         logger.error(f"Failed to send out of stock alert: {str(e)}")
@@ -178,13 +393,10 @@ def send_restock_notification(sweet):
         Sweet Shop Management System
         """
         
-        mail_admins(
-            subject=subject,
-            message=message,
-            fail_silently=True,
-        )
+        # Queue for the alert worker (manage.py send_admin_alerts)
+        queue_admin_alert(AdminAlert.Kind.RESTOCKED, sweet, subject, message)
         
-        logger.info(f"Restock notification sent for {sweet.name}")
+        logger.info(f"Restock notification queued for {sweet.name}")
         
     except Exception as e:
         logger.error(f"Failed to send restock notification: {str(e)}")
@@ -214,18 +426,80 @@ def send_new_high_value_sweet_notification(sweet):
         Sweet Shop Management System
         """
         
-        mail_admins(
-            subject=subject,
-            message=message,
-            fail_silently=True,
-        )
+        # Queue for the alert worker (manage.py send_admin_alerts)
+        queue_admin_alert(AdminAlert.Kind.HIGH_VALUE, sweet, subject, message)
         
-        logger.info(f"High-value sweet notification sent for {sweet.name}")
+        logger.info(f"High-value sweet notification queued for {sweet.name}")
         
     except Exception as e:
         logger.error(f"Failed to send high-value sweet notification: {str(e)}")
 
 
+def send_imported_high_value_notification(sweets):
+    """
+    Send one notification for the high-value sweets of an imported batch.
+    """
+    try:
+        subject = f'💰 {len(sweets)} New High-Value Sweet(s) Imported'
+        
+        lines = '\n'.join(
+            f"        - {sweet.name} ({sweet.get_category_display()}): "
+            f"{sweet.quantity} x ₹{sweet.price} = ₹{sweet.price * sweet.quantity:,.2f}"
+            for sweet in sweets[:50]
+        )
+        more = f"\n        ... and {len(sweets) - 50} more" if len(sweets) > 50 else ""
+        
+        message = f"""
+        New High-Value Sweets Imported!
+        
+{lines}{more}
+        
+        ---
+        Sweet Shop Management System
+        """
+        
+        # Queued against the first sweet of the batch
+        queue_admin_alert(AdminAlert.Kind.HIGH_VALUE, sweets[0], subject, message)
+        
+        logger.info(f"High-value import notification queued for {len(sweets)} sweets")
+        
+    except Exception as e:
+        logger.error(f"Failed to send high-value import notification: {str(e)}")
+
+
+def send_bulk_deletion_notification(sweets):
+    """
+    Send one notification for the sweets of a bulk-deleted batch.
+    """
+    try:
+        subject = f'🗑️ {len(sweets)} Sweet(s) Deleted'
+        
+        lines = '\n'.join(
+            f"        - {sweet.name} ({sweet.get_category_display()}), ₹{sweet.price}"
+            for sweet in sweets[:50]
+        )
+        more = f"\n        ... and {len(sweets) - 50} more" if len(sweets) > 50 else ""
+        
+        message = f"""
+        Sweets Deleted!
+        
+{lines}{more}
+        
+        These sweets have been permanently deleted from the system.
+        
+        ---
+        Sweet Shop Management System
+        """
+        
+        # Queued against the first sweet of the batch
+        queue_admin_alert(AdminAlert.Kind.DELETED, sweets[0], subject, message)
+        
+        logger.warning(f"Bulk deletion notification queued for {len(sweets)} sweets")
+        
+    except Exception as e:
+        logger.error(f"Failed to send bulk deletion notification: {str(e)}")
+
+
 def send_deletion_notification(sweet):
     """
     Send notification when sweet is deleted.
@@ -247,13 +521,10 @@ def send_deletion_notification(sweet):
         Sweet Shop Management System
         """
         
-        mail_admins(
-            subject=subject,
-            message=message,
-            fail_silently=True,
-        )
+        # Queue for the alert worker (manage.py send_admin_alerts)
+        queue_admin_alert(AdminAlert.Kind.DELETED, sweet, subject, message)
         
-        logger.warning(f"Deletion notification sent for {sweet.name}")
+        logger.warning(f"Deletion notification queued for {sweet.name}")
         
     except Exception as e:
         logger.error(f"Failed to send deletion notification: {str(e)}")
@@ -267,17 +538,26 @@ def create_inventory_audit_log(sender, instance, created, **kwargs):
     (Optional - if you have an AuditLog model)
     """
     try:
+        if created:
+            return
+        
+        # Dirty fields are still available here; save() resets them afterwards
+        changes = instance.get_dirty_fields()
+        if not changes:
+            return
+        
+        logger.debug(f"Audit: sweet {instance.pk} changed {changes}")
+        
         # If you have an AuditLog model, implement here
         # from .models import AuditLog
-        # if not created and hasattr(instance, '_old_quantity') and instance._old_quantity != instance.quantity:
+        # if 'quantity' in changes:
         #     AuditLog.objects.create(
         #         sweet=instance,
         #         user=instance.last_modified_by,  # Need to track this
         #         change_type='QUANTITY_CHANGE',
-        #         old_value=instance._old_quantity,
-        #         new_value=instance.quantity,
-        #         notes=f'Quantity changed from {instance._old_quantity} to {instance.quantity}'
+        #         old_value=changes['quantity']['old'],
+        #         new_value=changes['quantity']['new'],
+        #         notes=f"Quantity changed from {changes['quantity']['old']} to {changes['quantity']['new']}"
         #     )
-        pass
     except Exception as e:
-        logger.error(f"Failed to create audit log: {str(e)}")
\ No newline at end of file
+        logger.error(f"Failed to create audit log: {str(e)}")
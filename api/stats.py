@@ -0,0 +1,105 @@
+"""
+Inventory statistics engine.
+
+All counts, totals, stock buckets and per-category figures come from one
+conditional-aggregation query; the most valuable sweets are a second,
+optional query. Used by SweetStatsView, DashboardView and the admin.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Avg, Count, DecimalField, ExpressionWrapper, F, Q, Sum
+)
+from django.utils import timezone
+
+from .models import Sweet
+
+LOW_STOCK_THRESHOLD = 10
+
+
+def item_value():
+    """price * quantity as a Decimal expression."""
+    return ExpressionWrapper(
+        F('price') * F('quantity'),
+        output_field=DecimalField(max_digits=20, decimal_places=2)
+    )
+
+
+def inventory_stats(queryset=None, top_n=5):
+    """
+    Compute inventory statistics for `queryset` (all sweets by default).
+
+    Returns a dict of totals, stock buckets, per-category figures and,
+    if `top_n` is set, the `top_n` sweets by inventory value.
+    """
+    if queryset is None:
+        queryset = Sweet.objects.all()
+
+    week_ago = timezone.now() - timedelta(days=7)
+    value = item_value()
+
+    aggregates = {
+        'total_sweets': Count('id'),
+        'total_value': Sum(value),
+        'average_price': Avg('price'),
+        'total_quantity': Sum('quantity'),
+        'out_of_stock': Count('id', filter=Q(quantity=0)),
+        'low_stock': Count('id', filter=Q(quantity__range=(1, LOW_STOCK_THRESHOLD))),
+        'in_stock': Count('id', filter=Q(quantity__gt=LOW_STOCK_THRESHOLD)),
+        'recent_additions_7_days': Count('id', filter=Q(created_at__gte=week_ago)),
+    }
+    for category in Sweet.Category.values:
+        in_category = Q(category=category)
+        aggregates[f'{category}__count'] = Count('id', filter=in_category)
+        aggregates[f'{category}__quantity'] = Sum('quantity', filter=in_category)
+        aggregates[f'{category}__value'] = Sum(value, filter=in_category)
+
+    row = queryset.order_by().aggregate(**aggregates)
+
+    by_category = [
+        {
+            'category': category,
+            'count': row[f'{category}__count'],
+            'total_quantity': row[f'{category}__quantity'] or 0,
+            'total_value': row[f'{category}__value'] or Decimal('0'),
+        }
+        for category in Sweet.Category.values
+        if row[f'{category}__count']
+    ]
+    by_category.sort(key=lambda entry: entry['total_value'], reverse=True)
+
+    stats = {
+        'total_sweets': row['total_sweets'],
+        'total_value': row['total_value'] or Decimal('0'),
+        'average_price': row['average_price'] or Decimal('0'),
+        'total_quantity': row['total_quantity'] or 0,
+        'total_available': row['total_sweets'] - row['out_of_stock'],
+        'stock_status': {
+            'out_of_stock': row['out_of_stock'],
+            'low_stock': row['low_stock'],
+            'in_stock': row['in_stock'],
+        },
+        'by_category': by_category,
+        'recent_additions_7_days': row['recent_additions_7_days'],
+    }
+
+    if top_n:
+        stats['most_valuable_sweets'] = most_valuable_sweets(queryset, top_n)
+
+    return stats
+
+
+def most_valuable_sweets(queryset, limit=5):
+    """The `limit` sweets with the highest price * quantity."""
+    return [
+        {
+            'id': sweet['id'],
+            'name': sweet['name'],
+            'category': sweet['category'],
+            'value': sweet['item_value'],
+        }
+        for sweet in queryset.annotate(item_value=item_value())
+        .order_by('-item_value')
+        .values('id', 'name', 'category', 'item_value')[:limit]
+    ]
@@ -0,0 +1,252 @@
+"""
+Incrementally maintained inventory totals (InventorySummary).
+
+Every change to a sweet's category, price or quantity is turned into a
+per-category delta (count, units, value, price sum, stock bucket) and
+applied with one ``UPDATE ... SET x = x + delta`` per touched category.
+Reading the statistics is then a read of at most eight rows.
+
+Saves and deletes are picked up from signals, guarded stock updates from
+``stock_changed`` and bulk imports and operations from their per-batch
+signals; other ``QuerySet.update()`` calls must go through
+tracked_update(). rebuild() recomputes everything from the Sweet table
+and find_discrepancies() reports drift without fixing it.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import InventorySummary, Sweet
+from .response_cache import bump_version
+from .stats import LOW_STOCK_THRESHOLD, item_value, most_valuable_sweets
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    'sweet_count', 'total_quantity', 'total_value', 'price_sum',
+    'out_of_stock', 'low_stock', 'in_stock',
+)
+
+
+def stock_bucket(quantity):
+    if quantity == 0:
+        return 'out_of_stock'
+    if quantity <= LOW_STOCK_THRESHOLD:
+        return 'low_stock'
+    return 'in_stock'
+
+
+def add_contribution(deltas, category, price, quantity, sign):
+    """Add (sign=1) or remove (sign=-1) one sweet's share of the totals."""
+    price = Decimal(str(price))
+    delta = deltas[category]
+    delta['sweet_count'] += sign
+    delta['total_quantity'] += sign * quantity
+    delta['total_value'] += sign * price * quantity
+    delta['price_sum'] += sign * price
+    delta[stock_bucket(quantity)] += sign
+
+
+def new_deltas():
+    return defaultdict(lambda: defaultdict(int))
+
+
+_collecting = threading.local()
+
+
+@contextmanager
+def collect():
+    """
+    Merge every change recorded inside the block and apply it once on
+    exit, so a many-line operation costs one UPDATE per category.
+    """
+    if getattr(_collecting, 'deltas', None) is not None:
+        yield
+        return
+    _collecting.deltas = deltas = new_deltas()
+    try:
+        yield
+    finally:
+        _collecting.deltas = None
+    apply_deltas(deltas)
+
+
+def apply_deltas(deltas):
+    """Apply {category: {counter: delta}} with one UPDATE per category."""
+    # Categories in a fixed order, so that two transactions touching the
+    # same ones lock their rows in the same order and cannot deadlock
+    for category, delta in sorted(deltas.items()):
+        changes = {name: value for name, value in delta.items() if value}
+        if not changes:
+            continue
+        updates = {name: F(name) + value for name, value in changes.items()}
+        updates['updated_at'] = timezone.now()
+        if InventorySummary.objects.filter(category=category).update(**updates):
+            continue
+        # First sweet in this category
+        try:
+            with transaction.atomic():
+                InventorySummary.objects.create(category=category, **changes)
+        except IntegrityError:
+            InventorySummary.objects.filter(category=category).update(**updates)
+
+
+def record_change(before, after):
+    """
+    Apply the change of one sweet from `before` to `after`, each a
+    (category, price, quantity) tuple or None for "did not exist".
+    """
+    record_rows([before] if before else [], [after] if after else [])
+
+
+def record_rows(before, after):
+    """Apply the change of a set of sweets from the `before` rows to the `after` rows."""
+    pending = getattr(_collecting, 'deltas', None)
+    deltas = new_deltas() if pending is None else pending
+    for category, price, quantity in before:
+        add_contribution(deltas, category, price, quantity, -1)
+    for category, price, quantity in after:
+        add_contribution(deltas, category, price, quantity, 1)
+    if pending is None:
+        apply_deltas(deltas)
+
+
+def tracked_update(queryset, **updates):
+    """
+    queryset.update(**updates) keeping InventorySummary in step and
+    invalidating cached responses.
+
+    The affected rows are locked and read before the update and read again
+    after it, all in one transaction. Returns the number of rows updated.
+    """
+    columns = ('pk', 'category', 'price', 'quantity')
+    with transaction.atomic():
+        before = {
+            pk: (category, price, quantity)
+            for pk, category, price, quantity in
+            queryset.select_for_update().order_by().values_list(*columns)
+        }
+        if not before:
+            return 0
+        affected = Sweet.objects.filter(pk__in=before)
+        updated = affected.update(**updates)
+        after = [row[1:] for row in affected.values_list(*columns)]
+        record_rows(before.values(), after)
+        bump_version()
+    return updated
+
+
+def actual_totals():
+    """Per-category totals computed from the Sweet table (one grouped query)."""
+    rows = (
+        Sweet.objects.order_by().values('category').annotate(
+            sweet_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_value=Sum(item_value()),
+            price_sum=Sum('price'),
+            out_of_stock=Count('id', filter=Q(quantity=0)),
+            low_stock=Count('id', filter=Q(quantity__range=(1, LOW_STOCK_THRESHOLD))),
+            in_stock=Count('id', filter=Q(quantity__gt=LOW_STOCK_THRESHOLD)),
+        )
+    )
+    # SQLite sums decimals as floats; round back to the stored 2 places
+    return {
+        row.pop('category'): {
+            name: round(row[name], 2) if isinstance(row[name], Decimal) else row[name] or 0
+            for name in COUNTERS
+        }
+        for row in rows
+    }
+
+
+def rebuild():
+    """Replace the summary rows with totals recomputed from scratch."""
+    with transaction.atomic():
+        InventorySummary.objects.all().delete()
+        totals = actual_totals()
+        InventorySummary.objects.bulk_create([
+            InventorySummary(category=category, **values)
+            for category, values in totals.items()
+        ])
+    logger.info(f"Rebuilt inventory summary for {len(totals)} categories")
+    return totals
+
+
+def find_discrepancies():
+    """
+    Compare the summary with the Sweet table.
+
+    Returns a list of (category, counter, summary value, actual value).
+    """
+    actual = actual_totals()
+    stored = {
+        row.pop('category'): row
+        for row in InventorySummary.objects.values('category', *COUNTERS)
+    }
+    discrepancies = []
+    for category in sorted(set(actual) | set(stored)):
+        for name in COUNTERS:
+            expected = actual.get(category, {}).get(name, 0)
+            found = stored.get(category, {}).get(name, 0)
+            if expected != found:
+                discrepancies.append((category, name, found, expected))
+    return discrepancies
+
+
+def summary_stats(top_n=5, recent=True, category=None):
+    """
+    Same result as stats.inventory_stats() for the whole inventory (or one
+    `category`), with the totals read from InventorySummary instead of
+    aggregated.
+
+    recent_additions_7_days (skipped unless `recent`) and the top-N list
+    are not maintained incrementally; they use the created_at and item
+    value indexes.
+    """
+    rows = InventorySummary.objects.filter(sweet_count__gt=0)
+    sweets = Sweet.objects.all()
+    if category is not None:
+        rows = rows.filter(category=category)
+        sweets = sweets.filter(category=category)
+    rows = list(rows)
+    totals = {name: sum((getattr(row, name) for row in rows), 0) for name in COUNTERS}
+    count = totals['sweet_count']
+
+    by_category = [
+        {
+            'category': row.category,
+            'count': row.sweet_count,
+            'total_quantity': row.total_quantity,
+            'total_value': row.total_value,
+        }
+        for row in rows
+    ]
+    by_category.sort(key=lambda entry: entry['total_value'], reverse=True)
+
+    stats = {
+        'total_sweets': count,
+        'total_value': Decimal(totals['total_value']),
+        'average_price': totals['price_sum'] / count if count else Decimal('0'),
+        'total_quantity': totals['total_quantity'],
+        'total_available': count - totals['out_of_stock'],
+        'stock_status': {
+            'out_of_stock': totals['out_of_stock'],
+            'low_stock': totals['low_stock'],
+            'in_stock': totals['in_stock'],
+        },
+        'by_category': by_category,
+    }
+    if recent:
+        stats['recent_additions_7_days'] = sweets.filter(
+            created_at__gte=timezone.now() - timedelta(days=7)
+        ).count()
+    if top_n:
+        stats['most_valuable_sweets'] = most_valuable_sweets(sweets, top_n)
+    return stats
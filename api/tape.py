@@ -0,0 +1,158 @@
+"""
+Live sales tape for admin dashboards (the ``sales_tape`` group).
+
+Every purchase recorded in the ledger is queued here, and a background
+thread publishes what is queued once per PURCHASE_TAPE_INTERVAL seconds:
+
+    {"type": "sales", "purchases": [{...}, ...], "count": 412,
+     "units": 530, "revenue": "10412.50", "dropped": 212}
+
+``count``, ``units`` and ``revenue`` cover every purchase since the last
+message. ``purchases`` lists the most recent of them, at most
+PURCHASE_TAPE_MAX_EVENTS, and ``dropped`` (present when not 0) counts the
+ones left out. Memory stays bounded at both ends: the queue here keeps only
+that many purchases besides the totals, and PurchaseConsumer collapses the
+batches a slow socket has not taken yet into one (see merge()).
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .broadcast import dumps
+
+logger = logging.getLogger(__name__)
+
+GROUP = 'sales_tape'
+
+
+def max_events():
+    return getattr(settings, 'PURCHASE_TAPE_MAX_EVENTS', 200)
+
+
+def purchase_event(record, sweet):
+    """What dashboards see of a ledger PurchaseRecord."""
+    return {
+        'sweet_id': record.sweet_id,
+        'sweet': sweet.name,
+        'quantity': record.quantity,
+        'unit_price': str(record.unit_price),
+        'total_price': str(record.total_price),
+        'user_id': record.user_id,
+        'purchased_at': record.created_at.isoformat(),
+    }
+
+
+def merge(older, newer):
+    """One batch covering two consecutive ones, trimmed to max_events()."""
+    purchases = older['purchases'] + newer['purchases']
+    trimmed = max(0, len(purchases) - max_events())
+    batch = {
+        'type': 'sales',
+        'purchases': purchases[trimmed:],
+        'count': older['count'] + newer['count'],
+        'units': older['units'] + newer['units'],
+        'revenue': str(Decimal(older['revenue']) + Decimal(newer['revenue'])),
+    }
+    dropped = older.get('dropped', 0) + newer.get('dropped', 0) + trimmed
+    if dropped:
+        batch['dropped'] = dropped
+    return batch
+
+
+class SalesTape:
+    """
+    Thread-safe buffer of purchase events with running totals.
+    """
+
+    def __init__(self, group=GROUP):
+        self.group = group
+        self._events = deque()
+        self._count = self._units = self._dropped = 0
+        self._revenue = Decimal('0')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._loop = None
+        self.published = 0  # group messages sent
+
+    def __len__(self):
+        return self._count
+
+    def queue(self, record, sweet):
+        event = purchase_event(record, sweet)
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) > max_events():
+                self._events.popleft()
+                self._dropped += 1
+            self._count += 1
+            self._units += record.quantity
+            self._revenue += record.total_price
+        interval = getattr(settings, 'PURCHASE_TAPE_INTERVAL', 0.2)
+        if interval <= 0:
+            self.flush()
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='sales-tape', daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        while True:
+            self._wakeup.wait()
+            time.sleep(getattr(settings, 'PURCHASE_TAPE_INTERVAL', 0.2))
+            self._wakeup.clear()
+            self.flush()
+
+    def take(self):
+        """The batch of everything queued, or None; empties the queue."""
+        with self._lock:
+            if not self._count:
+                return None
+            batch = {
+                'type': 'sales',
+                'purchases': list(self._events),
+                'count': self._count,
+                'units': self._units,
+                'revenue': str(self._revenue),
+            }
+            if self._dropped:
+                batch['dropped'] = self._dropped
+            self._events.clear()
+            self._count = self._units = self._dropped = 0
+            self._revenue = Decimal('0')
+        return batch
+
+    def flush(self):
+        """Publish everything queued as one message. Returns the number of purchases sent."""
+        batch = self.take()
+        if batch is None:
+            return 0
+
+        layer = get_channel_layer()
+        if layer is None:
+            return 0
+        message = {'type': 'sales.batch', 'batch': batch, 'text': dumps(batch)}
+        try:
+            if threading.current_thread() is self._thread:
+                self._loop.run_until_complete(layer.group_send(self.group, message))
+            else:
+                async_to_sync(layer.group_send)(self.group, message)
+        except Exception as e:
+            logger.error(f"Failed to publish {batch['count']} purchases to the sales tape: {str(e)}")
+            return 0
+        self.published += 1
+        return batch['count']
+
+
+tape = SalesTape()
@@ -1,12 +1,53 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+import asyncio
+import shutil
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import OperationalError, connection
+from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
+from rest_framework.renderers import JSONRenderer
 from django.urls import reverse
+from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Sweet
+from .models import Sweet, PurchaseRecord, AdminAlert, InventorySummary, InventoryVersion
+from .notifications import send_admin_alerts
+from .stats import inventory_stats
+from . import ledger, summary
+from .autocomplete import TrigramIndex, index as autocomplete_index, preload
+from .response_cache import VERSION_KEY, bump_version
+from .importer import clean_row
+from .serializers import FastSweetListSerializer
+from .admin import SweetAdmin
+from .bulk import BulkOperation
+from .broadcast import InventoryPublisher
+from .channel_layer import Broker, BrokerChannelLayer
+from .consumers import InventoryConsumer, PurchaseConsumer, ResyncBudget
+from .tape import SalesTape
 
 User = get_user_model()
 
+@override_settings(LEDGER_FLUSH_INTERVAL=0)
 class SweetTests(APITestCase):
     def setUp(self):
         # Create admin user
@@ -94,6 +135,1011 @@ class SweetTests(APITestCase):
         self.sweet.refresh_from_db()
         self.assertEqual(self.sweet.quantity, 45)
     
+    def test_purchase_insufficient_stock(self):
+        """Test purchase beyond stock is rejected and stock is unchanged"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.post(
+            reverse('purchase', kwargs={'pk': self.sweet.id}),
+            {'quantity': 51}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', response.data)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 50)
+    
+    def test_take_stock_single_guarded_update(self):
+        """Test atomic purchase is one guarded query and never oversells"""
+        with self.assertNumQueries(2):  # guarded UPDATE + summary delta
+            purchased = Sweet.objects.take_stock(self.sweet.id, 30)
+        self.assertEqual(purchased.quantity, 20)
+        self.assertEqual(purchased.name, 'Chocolate Bar')
+        
+        self.assertIsNone(Sweet.objects.take_stock(self.sweet.id, 21))
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 20)
+    
+    def test_checkout_multiple_sweets(self):
+        """Test checkout buys every line in one request"""
+        toffee = Sweet.objects.create(
+            name='Toffee', category='candy', price=10.00, quantity=5
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.post(reverse('checkout'), {'items': [
+            {'sweet_id': self.sweet.id, 'quantity': 2},
+            {'sweet_id': toffee.id, 'quantity': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['checkout_details']['total_price'], 250.0)
+        toffee.refresh_from_db()
+        self.sweet.refresh_from_db()
+        self.assertEqual(toffee.quantity, 0)
+        self.assertEqual(self.sweet.quantity, 48)
+    
+    def test_checkout_all_or_nothing(self):
+        """Test one short line rolls back the whole checkout"""
+        toffee = Sweet.objects.create(
+            name='Toffee', category='candy', price=10.00, quantity=5
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.post(reverse('checkout'), {'items': [
+            {'sweet_id': self.sweet.id, 'quantity': 2},
+            {'sweet_id': toffee.id, 'quantity': 6},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['lines'][1]['available'], 5)
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 50)
+        
+        # Query count does not grow with the number of lines, only with the
+        # number of categories whose summary row changes
+        with self.assertNumQueries(5):
+            Sweet.objects.take_stock_many({self.sweet.id: 1, toffee.id: 1})
+    
+    def test_purchase_recorded_in_ledger(self):
+        """Test purchases reach the ledger and the dashboard"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        # Failed writes (lock timeout, lost connection) keep the rows for a retry
+        with patch.object(PurchaseRecord.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            for _ in range(3):
+                self.client.post(
+                    reverse('purchase', kwargs={'pk': self.sweet.id}),
+                    {'quantity': 2}
+                )
+        self.assertEqual(len(ledger.purchases), 3)
+        ledger.flush()
+        self.assertEqual(
+            PurchaseRecord.objects.filter(user=self.regular_user).count(), 3
+        )
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['today_purchases'], 3)
+        self.assertEqual(response.data['top_selling'][0]['total_sold'], 6)
+        
+        # A batch that keeps failing is dropped rather than retried forever,
+        # and at most LEDGER_MAX_PENDING rows wait for a retry
+        buffer = ledger.LedgerBuffer(PurchaseRecord)
+        row = PurchaseRecord(sweet_id=self.sweet.id, quantity=1, unit_price=1, total_price=1)
+        with patch.object(PurchaseRecord.objects, 'bulk_create', side_effect=OperationalError('bad row')), \
+                self.settings(LEDGER_MAX_RETRIES=2, LEDGER_MAX_PENDING=2), self.assertLogs('api.ledger'):
+            buffer.add(row)
+            self.assertEqual(buffer.flush_if_due(), 0)  # waiting for the retry delay
+            buffer._pending += [row, row]
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(len(buffer), 0)
+            buffer._pending += [row] * 3
+            buffer.flush()
+            self.assertEqual(len(buffer), 2)
+        # Emptied by another thread between the checks: not due
+        buffer._oldest = None
+        self.assertEqual(buffer.flush_if_due(), 0)
+    
+    def test_stock_changes_do_not_refetch(self):
+        """Test purchase/restock don't re-read the row in pre_save"""
+        sweet = Sweet.objects.get(pk=self.sweet.id)
+        
+        with self.assertNumQueries(2):  # guarded UPDATE + summary delta
+            sweet.purchase(5)
+        
+        with self.assertNumQueries(2):  # single UPDATE + summary delta, no validation queries
+            sweet.restock(10)
+        
+        self.assertEqual(sweet.get_dirty_fields(), {})
+        sweet.price = 120
+        self.assertEqual(sweet.get_dirty_fields()['price']['old'], 100)
+    
+    def test_duplicate_name_rejected_by_index(self):
+        """Test case-insensitive name uniqueness within a category"""
+        with self.assertRaises(ValidationError):
+            Sweet.objects.create(
+                name='CHOCOLATE BAR', category='chocolate', price=10.00, quantity=1
+            )
+        
+        # Same name in another category is fine
+        Sweet.objects.create(
+            name='Chocolate Bar', category='cake', price=10.00, quantity=1
+        )
+    
+    def test_stock_alerts_are_queued_and_coalesced(self):
+        """Test threshold alerts go to the outbox and out as one digest"""
+        Sweet.objects.take_stock(self.sweet.id, 50)  # low stock + out of stock
+        self.assertEqual(AdminAlert.objects.filter(sweet_id=self.sweet.id).count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+        
+        self.assertEqual(send_admin_alerts(flush=True), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Out of Stock', mail.outbox[0].subject)
+        self.assertFalse(AdminAlert.objects.filter(sent_at__isnull=True).exists())
+
+    def test_stock_alerts_kept_without_admins(self):
+        """Test alerts stay queued until ADMINS is configured"""
+        Sweet.objects.take_stock(self.sweet.id, 50)
+        with override_settings(ADMINS=[]):
+            self.assertEqual(send_admin_alerts(flush=True), 0)
+        self.assertEqual(AdminAlert.objects.filter(sent_at__isnull=True).count(), 2)
+
+        call_command('send_admin_alerts', '--flush')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(AdminAlert.objects.filter(sent_at__isnull=True).exists())
+
+    def test_inventory_stats_single_pass(self):
+        """Test stats come from one aggregate query plus the top-N"""
+        Sweet.objects.create(name='Toffee', category='candy', price=10.00, quantity=0)
+        with self.assertNumQueries(2):
+            stats = inventory_stats()
+        self.assertEqual(stats['total_sweets'], 2)
+        self.assertEqual(stats['stock_status']['out_of_stock'], 1)
+        self.assertEqual(stats['by_category'][0]['category'], 'chocolate')
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.get(reverse('sweet-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_value'], 5000.0)
+        self.assertEqual(response.data['total_available'], 1)
+    
+    def test_inventory_summary_tracks_changes(self):
+        """Test the summary table follows every stock path without rescans"""
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10.00, quantity=5)
+        Sweet.objects.take_stock(self.sweet.id, 40)
+        toffee.restock(20)
+        toffee.category = 'chocolate'
+        toffee.save()
+        summary.tracked_update(Sweet.objects.filter(id=self.sweet.id), quantity=0)
+        self.assertEqual(summary.find_discrepancies(), [])
+        
+        with self.assertNumQueries(1):
+            stats = summary.summary_stats(top_n=0, recent=False)
+        self.assertEqual(stats['total_sweets'], 2)
+        self.assertEqual(stats['total_quantity'], 25)
+        self.assertEqual(stats['stock_status']['out_of_stock'], 1)
+        
+        toffee.delete()
+        InventorySummary.objects.filter(category='chocolate').update(sweet_count=7)
+        self.assertEqual(len(summary.find_discrepancies()), 1)
+        summary.rebuild()
+        self.assertEqual(summary.find_discrepancies(), [])
+    
+    def test_list_and_stats_are_cached_until_inventory_changes(self):
+        """Test cached responses are served until a write bumps the version"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        url = reverse('sweet-list') + '?ordering=name&category=chocolate'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):  # authentication only
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        
+        # Same parameters in another order share the entry
+        response = self.client.get(reverse('sweet-list') + '?category=chocolate&ordering=name')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        
+        # Bodies carry absolute links: another host or scheme has its own entry and ETag
+        other = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(other['X-Cache'], 'MISS')
+        self.assertNotEqual(other['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(url, secure=True)['X-Cache'], 'MISS')
+        
+        self.client.get(reverse('sweet-stats'))
+        Sweet.objects.take_stock(self.sweet.id, 10)
+        response = self.client.get(reverse('sweet-stats'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['total_quantity'], 40)
+        
+        summary.tracked_update(Sweet.objects.filter(id=self.sweet.id), quantity=0)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['quantity'], 0)
+        
+        # A write in another worker process moves the version seen here
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        other_worker = FileBasedCache(settings.CACHES['response_versions']['LOCATION'], {})
+        other_worker.incr(VERSION_KEY)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+        response = self.client.get(reverse('cache-stats'))
+        self.assertGreaterEqual(response.data['endpoints']['sweet-list']['hits'], 2)
+    
+    def test_conditional_get_returns_304_until_inventory_changes(self):
+        """Test ETag / If-None-Match answers 304 without touching sweets"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        for url in (
+            reverse('sweet-list'),
+            reverse('sweet-detail', kwargs={'pk': self.sweet.id}),
+            reverse('sweet-low-stock'),
+            reverse('sweet-stats'),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('Last-Modified', response)
+            etag = response['ETag']
+            with self.assertNumQueries(1):  # authentication only
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.content, b'')
+        
+        self.sweet.restock(5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Errors carry no validators to revalidate against
+        response = self.client.get(reverse('sweet-detail', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+    
+    def test_cursor_pagination_walks_every_sweet_once(self):
+        """Test keyset pagination forwards and back over a tied ordering field"""
+        for i in range(24):
+            Sweet.objects.create(
+                name=f'Candy {i:02d}', category='candy', price=5 + i % 3, quantity=i
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        url = reverse('sweet-list') + '?pagination=cursor&ordering=price&page_size=10&count=true'
+        
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 25)
+            pages.append(response.data)
+            url = response.data['next']
+        
+        seen = [sweet['id'] for page in pages for sweet in page['results']]
+        expected = list(Sweet.objects.order_by('price', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertIsNone(pages[0]['previous'])
+        
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        
+        response = self.client.get(reverse('sweet-list') + '?cursor=bogus')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        
+        # Well-formed cursors whose value does not suit the ordering field,
+        # e.g. reused after the sort changed
+        for ordering, value in (('price', 'abc'), ('created_at', 'nope'),
+                                ('quantity', {'a': 1}), ('quantity', 'x'), ('price', 'NaN')):
+            cursor = base64.urlsafe_b64encode(json.dumps([value, 1, 0]).encode()).decode()
+            response = self.client.get(reverse('sweet-list') + f'?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, (ordering, value))
+
+    def test_cursor_pagination_rejects_ranked_search(self):
+        """Test a cursor cannot silently replace relevance ordering"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        for url in (reverse('sweet-list') + '?search=choc&pagination=cursor',
+                    reverse('advanced-search') + '?name=choc&pagination=cursor'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+            self.assertIn('cursor', response.data)
+            self.assertNotIn('ETag', response)
+        
+        response = self.client.get(reverse('sweet-list') + '?search=choc&pagination=cursor&ordering=name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.sweet.id])
+    
+    def test_full_text_search_ranks_prefix_matches(self):
+        """Test ?search= uses the full-text index: prefixes, ranking, sync on update"""
+        Sweet.objects.create(
+            name='Toffee Crunch', category='candy', price=10, quantity=5,
+            description='Buttery caramel toffee'
+        )
+        Sweet.objects.create(
+            name='Caramel Fudge', category='dessert', price=12, quantity=5,
+            description='Soft fudge with toffee pieces'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        
+        response = self.client.get(reverse('sweet-list') + '?search=toff')
+        names = [sweet['name'] for sweet in response.data['results']]
+        self.assertEqual(names, ['Toffee Crunch', 'Caramel Fudge'])  # name beats description
+        
+        response = self.client.get(reverse('sweet-list') + '?search=choc bar')
+        self.assertEqual([s['id'] for s in response.data['results']], [self.sweet.id])
+        
+        self.sweet.name = 'Cocoa Slab'
+        self.sweet.save()
+        response = self.client.get(reverse('sweet-list') + '?search=choc bar')
+        self.assertEqual(response.data['results'], [])
+        
+        response = self.client.get(reverse('advanced-search') + '?name=cocoa')
+        self.assertEqual([s['id'] for s in response.data['results']], [self.sweet.id])
+    
+    def test_autocomplete_is_typo_tolerant_and_follows_signals(self):
+        """Test autocomplete answers from memory and tracks saves/deletes"""
+        Sweet.objects.create(name='Pistachio Barfi', category='indian', price=20, quantity=5)
+        preload()
+        self.assertTrue(autocomplete_index.ready)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        url = reverse('sweet-autocomplete')
+        
+        with self.assertNumQueries(1):  # authentication only
+            response = self.client.get(url, {'q': 'pistachoi'})
+        self.assertEqual(response.data['sweets'][0]['name'], 'Pistachio Barfi')
+        
+        response = self.client.get(url, {'q': 'choc'})
+        self.assertEqual(response.data['sweets'][0]['id'], self.sweet.id)
+        self.assertEqual(response.data['categories'][0]['value'], 'chocolate')
+        
+        self.sweet.name = 'Cocoa Slab'
+        self.sweet.save()
+        response = self.client.get(url, {'q': 'cocoa'})
+        self.assertEqual(response.data['sweets'][0]['name'], 'Cocoa Slab')
+        
+        self.sweet.quantity = 0
+        self.sweet.save()
+        self.sweet.delete()
+        response = self.client.get(url, {'q': 'cocoa'})
+        self.assertEqual(response.data['sweets'], [])
+        
+        # Batches (bulk operations) are applied in one pass over the index
+        index = TrigramIndex()
+        index.load((pk, f'Laddu {pk}', 'indian') for pk in range(1, 21))
+        index.upsert_many([(pk, f'Laddu {pk}', 'candy') for pk in range(1, 11)] + [(5, 'Peda', 'indian')])
+        index.remove_many(list(range(11, 21)) + [999])
+        self.assertEqual(len(index), 10)
+        self.assertEqual({row[3] for row in index.suggest('laddu', limit=20)}, {'candy'})
+        self.assertEqual(index.suggest('peda')[0][1:], (5, 'Peda', 'indian'))
+        
+        # The best matches win however many names share their trigrams and
+        # however late they were added
+        index.load((pk, f'Chocolate Mint {pk}' if pk % 2 else f'Pistachio Mint {pk}', 'chocolate') for pk in range(1, 501))
+        index.upsert_many([(501, 'Choc', 'chocolate'), (502, 'Pistachio', 'indian')])
+        self.assertEqual(index.suggest('choc')[0][2], 'Choc')
+        self.assertEqual(index.suggest('pistachoi')[0][2], 'Pistachio')
+    
+    def test_search_facets_exclude_their_own_filter(self):
+        """Test facets come from one cached query and honour the other filters"""
+        Sweet.objects.create(name='Milk Toffee', category='candy', price=30, quantity=0)
+        Sweet.objects.create(name='Dark Chocolate', category='chocolate', price=300,
+                             quantity=5, is_featured=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        url = reverse('advanced-search') + '?category=chocolate&max_price=200&facets=true'
+
+        with self.assertNumQueries(4):  # user, count, page, facets
+            response = self.client.get(url)
+        facets = {
+            name: {entry['value']: entry['count'] for entry in entries}
+            for name, entries in response.data['facets'].items()
+        }
+        self.assertEqual([s['id'] for s in response.data['results']], [self.sweet.id])
+        # Categories under max_price only; prices within chocolate only
+        self.assertEqual(facets['category']['chocolate'], 1)
+        self.assertEqual(facets['category']['candy'], 1)
+        self.assertEqual(facets['price']['100_250'], 1)
+        self.assertEqual(facets['price']['250_500'], 1)
+        self.assertEqual(facets['price']['under_50'], 0)
+        self.assertEqual(facets['stock_status'], {'out_of_stock': 0, 'low_stock': 0, 'in_stock': 1})
+        self.assertEqual(facets['is_featured'], {True: 0, False: 1})
+
+        with self.assertNumQueries(3):  # facets cached for the same filters
+            self.client.get(url + '&page=1')
+
+    def test_sparse_fields_prune_response_and_columns(self):
+        """Test ?fields= / ?exclude= shape responses and narrow the SELECT"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('sweet-list') + '?fields=id,quantity,is_available')
+        self.assertEqual(response.data['results'], [
+            {'id': self.sweet.id, 'quantity': 50, 'is_available': True}
+        ])
+        select = next(q['sql'] for q in ctx.captured_queries if 'ORDER BY' in q['sql'])
+        self.assertNotIn('"description"', select)
+        self.assertNotIn('"price"', select)
+        
+        response = self.client.get(
+            reverse('sweet-detail', kwargs={'pk': self.sweet.id}) + '?exclude=description,image,image_url'
+        )
+        self.assertNotIn('description', response.data)
+        self.assertEqual(response.data['total_value'], '5000.00')
+        
+        # Cursors still read the ordering field when it was not selected
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=5)
+        with self.assertNumQueries(2):  # user, page
+            response = self.client.get(
+                reverse('sweet-list') + '?fields=id&pagination=cursor&page_size=1&ordering=price'
+            )
+        self.assertEqual(response.data['results'], [{'id': toffee.id}])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'id': self.sweet.id}])
+    
+    def test_fast_list_matches_serializer_bytes(self):
+        """Test the values_list listing path renders exactly like SweetListSerializer"""
+        Sweet.objects.create(name='Crème "Brûlée" \u2028', category='dessert', price=12.5, quantity=0)
+        Sweet.objects.create(name='Kaju Katli', category='indian', price=30, quantity=3, is_featured=True)
+        images = ['sweet_images/crème brûlée.jpg', 'sweet_images/./a?b#c.png', 'sweet_images/x;y.jpg']
+        for sweet, image in zip(Sweet.objects.order_by('id'), images):
+            Sweet.objects.filter(pk=sweet.pk).update(image=image)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        
+        for query in ('', '?page_size=2&page=2', '?ordering=-price', '?search=kaju',
+                      '?category=dessert', '?fields=id,image_url,category_display'):
+            url = reverse('sweet-list') + query
+            bump_version()
+            fast = self.client.get(url)
+            bump_version()
+            with patch.object(FastSweetListSerializer, 'supports', return_value=False), \
+                    patch('api.views.FastJSONRenderer', JSONRenderer):
+                slow = self.client.get(url)
+            self.assertEqual(fast.content, slow.content, query)
+        self.assertIn(b'"http://testserver/media/sweet_images/cr%C3%A8me%20br%C3%BBl%C3%A9e.jpg"', fast.content)
+    
+    @override_settings(EXPORT_CHUNK_SIZE=200, EXPORT_BUFFER_SIZE=16 * 1024)
+    def test_export_streams_in_constant_memory(self):
+        """Test the catalogue export streams every row with bounded memory"""
+        Sweet.objects.bulk_create(
+            Sweet(name=f'Bulk Sweet {i}', description='x' * 200, category='candy',
+                  price=i % 500 + 1, quantity=i % 20)
+            for i in range(20000)
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        url = reverse('sweet-export')
+        
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        tracemalloc.start()
+        size = lines = 0
+        for chunk in response.streaming_content:
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertEqual(lines, 20001)
+        self.assertGreater(size, 5_000_000)
+        self.assertLess(peak, 1_000_000)
+        
+        response = self.client.get(url, {'format': 'csv', 'category': 'chocolate', 'fields': 'name,price'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows, [['id', 'name', 'price'], [str(self.sweet.id), 'Chocolate Bar', '100.00']])
+        
+        response = self.client.get(url, {'format': 'json', 'search': 'chocolate'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content))[0]['name'], 'Chocolate Bar')
+        
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_bulk_import_reports_rows_and_updates_derived_state(self):
+        """Test CSV/NDJSON import: per-row errors, duplicates, summary, search, autocomplete"""
+        autocomplete_index.build()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+        url = reverse('sweet-import')
+        self.client.get(reverse('sweet-list'))  # warm the list cache
+        
+        upload = SimpleUploadedFile('sweets.csv', (
+            'name,category,price,quantity,description,is_featured\n'
+            'Kaju Katli,indian,450.00,200,Cashew fudge,\n'
+            'Rasmalai,indian,60,20,,yes\n'
+            'chocolate bar,chocolate,10,1,,\n'      # exists already
+            'KAJU KATLI,indian,450,1,,\n'           # duplicate within the file
+            'X,candy,-1,five,,\n'
+        ).encode(), content_type='text/csv')
+        # user, duplicate check, then in one savepoint: insert, alert, summary
+        # delta (plus creating the first 'indian' summary row)
+        with self.assertNumQueries(10):
+            response = self.client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 5, 6])
+        self.assertEqual(set(response.data['errors'][2]['errors']), {'name', 'price', 'quantity'})
+        
+        body = '{"name": "Peda", "category": "indian", "price": "25.5", "quantity": 3}\n[1]\n'
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [{'row': 2, 'errors': {'row': 'Each line must be a JSON object.'}}])
+        
+        # Rows get SweetSerializer's messages and its inventory value limit
+        row = {'name': 'Laddu', 'category': 'indian', 'price': '1.005', 'quantity': '5'}
+        self.assertEqual(clean_row(row)[1], {'price': 'Ensure that there are no more than 2 decimal places.'})
+        row.update(price='1000', quantity='101')
+        self.assertEqual(list(clean_row(row)[1]), ['quantity'])
+        
+        self.assertEqual(summary.find_discrepancies(), [])
+        self.assertTrue(Sweet.objects.get(name='Kaju Katli').is_featured)  # value > 50,000
+        self.assertEqual(AdminAlert.objects.filter(kind='high_value').count(), 1)
+        listing = self.client.get(reverse('sweet-list') + '?search=kaju')
+        self.assertEqual([s['name'] for s in listing.data['results']], ['Kaju Katli'])
+        self.assertEqual(autocomplete_index.suggest('rasmali')[0][2], 'Rasmalai')
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.generic('POST', url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_import_sweets_command(self):
+        """Test manage.py import_sweets reads NDJSON files"""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as handle:
+            for i in range(250):
+                handle.write(json.dumps({'name': f'Imported {i}', 'category': 'candy',
+                                         'price': '1.50', 'quantity': i % 12}) + '\n')
+        out = io.StringIO()
+        try:
+            call_command('import_sweets', handle.name, '--batch-size', '100', stdout=out)
+        finally:
+            os.unlink(handle.name)
+        self.assertIn('Imported 250 sweet(s), rejected 0', out.getvalue())
+        self.assertEqual(Sweet.objects.filter(name__startswith='Imported').count(), 250)
+        self.assertEqual(summary.find_discrepancies(), [])
+    
+    def test_bulk_operations_are_set_based_with_per_id_results(self):
+        """Test bulk operations: one statement per batch, per-id results, batch events"""
+        autocomplete_index.build()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+        url = reverse('bulk-operations')
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=12)
+        empty = Sweet.objects.create(name='Mint', category='candy', price=5, quantity=0)
+        Sweet.objects.create(name='toffee', category='chocolate', price=10, quantity=1)
+        
+        # user, then in one savepoint: locked read, one UPDATE, one alert
+        # INSERT and a summary delta per category
+        with self.assertNumQueries(8):
+            response = self.client.post(url, {
+                'operation': 'adjust_quantity',
+                'quantities': {str(self.sweet.id): -45, str(toffee.id): -20, str(empty.id): 3, '999999': 1},
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated_count'], 2)
+        results = {result['id']: result for result in response.data['results']}
+        self.assertEqual(results[self.sweet.id]['changes']['quantity'], {'old': 50, 'new': 5})
+        self.assertEqual(results[toffee.id]['reason'], 'insufficient_stock')
+        self.assertEqual(results[999999]['reason'], 'not_found')
+        self.assertEqual(
+            sorted(AdminAlert.objects.values_list('kind', flat=True)), ['low_stock', 'restocked']
+        )
+        
+        response = self.client.post(url, {
+            'operation': 'percent_price_change', 'sweet_ids': [self.sweet.id, toffee.id], 'percent': '-12.5',
+        }, format='json')
+        self.assertEqual(response.data['updated_count'], 2)
+        toffee.refresh_from_db()
+        self.assertEqual(toffee.price, Decimal('8.75'))
+        
+        response = self.client.post(url, {
+            'operation': 'set_price', 'sweet_ids': [toffee.id], 'price': '8.75',
+        }, format='json')
+        self.assertEqual(response.data['results'][0]['reason'], 'unchanged')
+        
+        # 'toffee' already exists in chocolate; Mint can move
+        response = self.client.post(url, {
+            'operation': 'move_category', 'sweet_ids': [toffee.id, empty.id], 'category': 'chocolate',
+        }, format='json')
+        self.assertEqual(
+            [result.get('reason', result['status']) for result in response.data['results']],
+            ['name_conflict', 'updated']
+        )
+        self.assertEqual(autocomplete_index.suggest('mint')[0][3], 'chocolate')
+        
+        # A name taken after the pre-check (a concurrent insert) fails only its own row
+        caramel = Sweet.objects.create(name='Caramel', category='candy', price=5, quantity=1)
+        with patch.object(BulkOperation, 'taken_names', return_value=set()):
+            response = self.client.post(url, {
+                'operation': 'move_category', 'sweet_ids': [toffee.id, caramel.id], 'category': 'chocolate',
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result.get('reason', result['status']) for result in response.data['results']],
+            ['name_conflict', 'updated']
+        )
+        
+        # 1,000 units at 87.50 crosses the auto-feature value
+        response = self.client.post(url, {
+            'operation': 'restock', 'sweet_ids': [self.sweet.id], 'quantity': 995,
+        }, format='json')
+        self.sweet.refresh_from_db()
+        self.assertEqual(self.sweet.quantity, 1000)
+        self.assertTrue(self.sweet.is_featured)
+        
+        response = self.client.post(url, {
+            'operation': 'set_price', 'sweet_ids': [toffee.id], 'price': '0',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(url, {'operation': 'clear_stock', 'sweet_ids': [empty.id]}, format='json')
+        self.assertEqual(response.data['updated_count'], 1)
+        
+        # One DELETE, one digest alert however many rows go
+        mail.outbox = []
+        with self.assertNumQueries(7):
+            response = self.client.post(url, {
+                'operation': 'delete', 'sweet_ids': [self.sweet.id, empty.id],
+            }, format='json')
+        self.assertEqual(response.data['deleted_count'], 1)
+        self.assertEqual(response.data['results'][0]['reason'], 'has_stock')
+        self.assertFalse(Sweet.objects.filter(id=empty.id).exists())
+        self.assertEqual(AdminAlert.objects.filter(kind='deleted').count(), 1)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(summary.find_discrepancies(), [])
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+        response = self.client.post(url, {'operation': 'clear_stock', 'sweet_ids': [toffee.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_admin_adjustment_actions_use_an_intermediate_form(self):
+        """Test admin price/stock actions: form first, then one UPDATE and batch events"""
+        self.admin_user.is_staff = self.admin_user.is_superuser = True
+        self.admin_user.save()
+        self.client.force_login(self.admin_user)
+        url = reverse('admin:api_sweet_changelist')
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=12)
+        selection = {ACTION_CHECKBOX_NAME: [self.sweet.id, toffee.id]}
+        
+        response = self.client.post(url, {'action': 'adjust_price', **selection})
+        self.assertContains(response, '<strong>2</strong> selected')
+        response = self.client.post(url, {'action': 'adjust_price', **selection, 'mode': 'percent',
+                                          'value': '0', 'apply': 'Apply'})
+        self.assertContains(response, 'The change cannot be zero.')
+        
+        response = self.client.post(url, {'action': 'adjust_price', **selection, 'mode': 'percent',
+                                          'value': '12.5', 'apply': 'Apply'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(
+            list(Sweet.objects.order_by('id').values_list('price', flat=True)),
+            [Decimal('112.50'), Decimal('11.25')]
+        )
+        
+        # "Select all" applies to every row whatever was ticked
+        response = self.client.post(url, {'action': 'adjust_stock', 'select_across': '1',
+                                          ACTION_CHECKBOX_NAME: [toffee.id], 'mode': 'remove',
+                                          'quantity': '45', 'apply': 'Apply'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(
+            list(Sweet.objects.order_by('id').values_list('quantity', flat=True)), [5, 0]
+        )
+        self.assertEqual(
+            sorted(AdminAlert.objects.values_list('kind', flat=True)),
+            ['low_stock', 'low_stock', 'out_of_stock']  # toffee 12 -> 0 crosses both thresholds
+        )
+        self.assertEqual(summary.find_discrepancies(), [])
+    
+    def test_admin_price_action_on_50k_rows(self):
+        """Test the 10% price action is one UPDATE and fast on 50,000 selected rows"""
+        categories = Sweet.Category.values
+        Sweet.objects.bulk_create([
+            Sweet(name=f'Bulk {i}', category=categories[i % len(categories)],
+                  price=Decimal('9.99'), quantity=i % 40)
+            for i in range(50000)
+        ], batch_size=5000)
+        summary.rebuild()
+        
+        model_admin = SweetAdmin(Sweet, admin.site)
+        request = RequestFactory().post(reverse('admin:api_sweet_changelist'))
+        request.user = self.admin_user
+        with patch.object(model_admin, 'message_user') as message_user, \
+                CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            model_admin.increase_price_10_percent(request, model_admin.get_queryset(request))
+            elapsed = time.perf_counter() - started
+        
+        self.assertLess(elapsed, 20)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "api_sweet"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('50001 item(s)', message_user.call_args[0][1])
+        self.assertEqual(Sweet.objects.filter(price=Decimal('10.99')).count(), 50000)
+        self.assertEqual(summary.find_discrepancies(), [])
+
+    def test_admin_changelist_counts_and_value_column(self):
+        """Test the change list reads counts from the summary and sorts by the annotated value"""
+        self.admin_user.is_staff = self.admin_user.is_superuser = True
+        self.admin_user.save()
+        self.client.force_login(self.admin_user)
+        url = reverse('admin:api_sweet_changelist')
+        Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=5)
+        Sweet.objects.create(name='Fudge', category='candy', price=3, quantity=0)
+
+        self.client.get(url)  # warm session/content type caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+        self.assertContains(response, 'Candy (2)')
+        self.assertContains(response, 'Chocolate (1)')
+        self.assertContains(response, 'Out of Stock (1)')
+        self.assertEqual(response.context_data['cl'].result_count, 3)
+        self.assertEqual(response.context_data['inventory_stats']['total_sweets'], 3)
+
+        # Stock counts follow the selected category, and the other way round
+        response = self.client.get(url, {'category': 'candy'})
+        self.assertContains(response, 'In Stock (0)')
+        self.assertContains(response, 'Low Stock (&lt;=10) (1)')
+        self.assertEqual(response.context_data['cl'].result_count, 2)
+        self.assertEqual(response.context_data['inventory_stats']['total_value'], Decimal('50'))
+        response = self.client.get(url, {'stock': 'in_stock'})
+        self.assertContains(response, 'Chocolate (1)')
+        self.assertContains(response, 'Candy (0)')
+
+        # Sorting by the Total Value column orders by price * quantity
+        columns = ['action_checkbox', *SweetAdmin.list_display]
+        response = self.client.get(url, {'o': f"-{columns.index('total_value')}"})
+        self.assertEqual(
+            [sweet.name for sweet in response.context_data['cl'].result_list],
+            ['Chocolate Bar', 'Toffee', 'Fudge']
+        )
+        self.assertContains(response, '₹5000.00')
+
+    def test_channel_layer_links_processes_through_broker(self):
+        """Test groups and specific channels reach another process's layer via the broker"""
+        path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        broker = Broker(path)
+
+        async def scenario():
+            started = asyncio.Event()
+            server = asyncio.ensure_future(broker.serve(started))
+            await started.wait()
+            web, worker = BrokerChannelLayer(path=path), BrokerChannelLayer(path=path)
+            channel = await worker.new_channel()
+            await worker.group_add('inventory_updates', channel)
+            while 'inventory_updates' not in broker.groups:
+                await asyncio.sleep(0.01)
+
+            await web.group_send('inventory_updates', {'type': 'inventory.update', 'text': 'tick'})
+            grouped = await asyncio.wait_for(worker.receive(channel), 5)
+            await web.send(channel, {'type': 'direct', 'payload': b'\x00\x01'})
+            direct = await asyncio.wait_for(worker.receive(channel), 5)
+
+            await worker.group_discard('inventory_updates', channel)
+            while 'inventory_updates' in broker.groups:
+                await asyncio.sleep(0.01)
+            await web.close()
+            await worker.close()
+            server.cancel()
+            return grouped, direct
+
+        grouped, direct = async_to_sync(scenario)()
+        self.assertEqual(grouped, {'type': 'inventory.update', 'text': 'tick'})
+        self.assertEqual(direct, {'type': 'direct', 'payload': b'\x00\x01'})
+
+        # Neither end uses a socket in a directory other users can enter
+        shared = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared)
+        os.chmod(shared, 0o777)
+        path = os.path.join(shared, 'broker.sock')
+        with self.assertRaises(PermissionError):
+            async_to_sync(Broker(path).serve)()
+        self.assertFalse(async_to_sync(BrokerChannelLayer(path=path).broker_reachable)())
+
+    @override_settings(INVENTORY_PUBLISH_INTERVAL=60)
+    def test_inventory_updates_coalesced_per_tick(self):
+        """Test a burst of stock changes goes out as one message with one entry per sweet"""
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=5)
+        publisher = InventoryPublisher()
+
+        def flash_sale():
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(3):
+                    Sweet.objects.take_stock(self.sweet.id, 2)
+                Sweet.objects.take_stock_many({self.sweet.id: 1, toffee.id: 5})
+                toffee.refresh_from_db()
+                toffee.restock(7)
+            self.assertEqual(len(publisher), 2)
+            publisher.flush()  # the tick
+
+        async def scenario():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add('inventory_updates', channel)
+            await sync_to_async(flash_sale)()
+            message = await asyncio.wait_for(layer.receive(channel), 5)
+            await layer.group_discard('inventory_updates', channel)
+            return message
+
+        # The ticker thread is replaced by the explicit flush() above
+        with patch('api.signals.publisher', publisher), patch.object(InventoryPublisher, '_run'):
+            message = async_to_sync(scenario)()
+
+        self.assertEqual(publisher.published, 1)
+        update = json.loads(message['text'])
+        self.assertEqual(update['version'], InventoryVersion.objects.get().version)
+        self.assertEqual(dict(update['changes']), {self.sweet.id: 43, toffee.id: 7})
+        self.assertNotIn('sweets', update)  # stock moves only
+
+    @override_settings(INVENTORY_PUBLISH_INTERVAL=60, INVENTORY_RESYNC_RATE=2)
+    def test_inventory_ticks_missed_by_the_broker_are_resent(self):
+        """Test versions only go to waste when the broker is down, and are then marked skipped"""
+        path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=5)
+        publisher = InventoryPublisher()
+        version = lambda: InventoryVersion.objects.get().version
+
+        # No broker and no local socket: nothing to tell, no version spent
+        before = version()
+        with patch('api.broadcast.get_channel_layer', return_value=BrokerChannelLayer(path=path)):
+            publisher.queue([self.sweet.id])
+            self.assertEqual(publisher.flush(), 0)
+        self.assertEqual(version(), before)
+
+        async def scenario():
+            layer = BrokerChannelLayer(path=path)
+            channel = await layer.new_channel()
+            await layer.group_add('inventory_updates', channel)
+            with patch('api.broadcast.get_channel_layer', return_value=layer):
+                # Broker down: the local socket gets the tick, the others cannot
+                publisher.queue([toffee.id])
+                await sync_to_async(publisher.flush)()
+                local = await asyncio.wait_for(layer.receive(channel), 5)
+
+                started = asyncio.Event()
+                server = asyncio.ensure_future(Broker(path).serve(started))
+                await started.wait()
+                while not await layer.broker_reachable():  # retried once a second
+                    await asyncio.sleep(0.1)
+                publisher.queue([toffee.id])
+                await sync_to_async(publisher.flush)()
+                resent = await asyncio.wait_for(layer.receive(channel), 5)
+            await layer.close()
+            server.cancel()
+            return local, resent
+
+        with patch.object(InventoryPublisher, '_run'):
+            local, resent = async_to_sync(scenario)()
+        self.assertNotIn('skipped', local)
+        self.assertEqual(resent['skipped'], [local['version']])
+        self.assertEqual({row[0] for row in resent['rows']}, {self.sweet.id, toffee.id})
+
+        # Consumers take skipped versions as received, and resync within a budget
+        consumer = InventoryConsumer()
+        consumer.latest, consumer.missing = 5, {}
+        consumer.dropped(7)
+        self.assertEqual(list(consumer.missing), [6])
+        consumer.dropped(8, covered=[6])
+        self.assertEqual(consumer.missing, {})
+        budget = ResyncBudget()
+        self.assertEqual([budget.take() for _ in range(3)], [True, True, False])
+
+    @override_settings(INVENTORY_PUBLISH_INTERVAL=60)
+    def test_inventory_stream_snapshot_and_filtered_deltas(self):
+        """Test subscribers get a versioned snapshot, then only the deltas that match"""
+        toffee = Sweet.objects.create(name='Toffee', category='candy', price=10, quantity=5)
+        fudge = Sweet.objects.create(name='Fudge', category='candy', price=20, quantity=40)
+        publisher = InventoryPublisher()
+        app = InventoryConsumer.as_asgi()
+
+        def tick(changes):
+            with self.captureOnCommitCallbacks(execute=True):
+                changes()
+            publisher.flush()
+
+        async def connect():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+            scope = {'type': 'websocket', 'path': '/ws/inventory/', 'headers': [],
+                     'query_string': b'', 'subprotocols': []}
+            task = asyncio.ensure_future(app(scope, inbox.get, outbox.put))
+            self.assertEqual((await outbox.get())['type'], 'websocket.accept')
+            return inbox, outbox, task
+
+        async def request(client, **data):
+            client[0].put_nowait({'type': 'websocket.receive', 'text': json.dumps(data)})
+            return await frame(client)
+
+        async def frame(client):
+            return json.loads((await asyncio.wait_for(client[1].get(), 5))['text'])
+
+        async def scenario():
+            watcher, everything = await connect(), await connect()
+            snapshot = await request(watcher, action='subscribe', categories=['candy'], low_stock=True)
+            self.assertEqual([sweet['name'] for sweet in snapshot['sweets']], ['Toffee'])
+
+            await sync_to_async(tick)(lambda: (
+                Sweet.objects.take_stock(toffee.id, 1),
+                Sweet.objects.take_stock(fudge.id, 1),
+                Sweet.objects.take_stock(self.sweet.id, 1),
+            ))
+            low, every = await frame(watcher), await frame(everything)
+            self.assertEqual(low['version'], snapshot['version'] + 1)
+            self.assertEqual(low['changes'], [[toffee.id, 4]])
+            self.assertEqual(dict(every['changes']), {toffee.id: 4, fudge.id: 39, self.sweet.id: 49})
+
+            # Restocked out of the low-stock view: one last update, then silence
+            await sync_to_async(tick)(lambda: Sweet.objects.get(pk=toffee.id).restock(20))
+            self.assertEqual((await frame(watcher))['changes'], [[toffee.id, 24]])
+            await frame(everything)
+            await sync_to_async(tick)(lambda: Sweet.objects.take_stock(toffee.id, 1))
+            self.assertEqual((await frame(everything))['changes'], [[toffee.id, 23]])
+            self.assertTrue(watcher[1].empty())
+
+            # A reconnecting client that is current gets no snapshot
+            current = await sync_to_async(lambda: InventoryVersion.objects.get().version)()
+            self.assertEqual(
+                await request(watcher, action='resync', version=current),
+                {'type': 'up_to_date', 'version': current}
+            )
+            error = await request(watcher, action='subscribe', categories=['bricks'])
+            self.assertEqual(error['type'], 'error')
+            for client in (watcher, everything):
+                client[0].put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+                await asyncio.wait_for(client[2], 5)
+
+        with patch('api.signals.publisher', publisher), patch.object(InventoryPublisher, '_run'):
+            async_to_sync(scenario)()
+
+    @override_settings(PURCHASE_TAPE_INTERVAL=60, PURCHASE_TAPE_MAX_EVENTS=3)
+    def test_sales_tape_batches_and_collapses_for_slow_clients(self):
+        """Test admins get purchases in batches, collapsed while their socket is behind"""
+        tape = SalesTape()
+        app = PurchaseConsumer.as_asgi()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
+
+        def buy(times):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(times):
+                    self.client.post(reverse('purchase', kwargs={'pk': self.sweet.id}), {'quantity': 2})
+            tape.flush()  # the tick
+
+        async def connect(user, stalled=None):
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+            scope = {'type': 'websocket', 'path': '/ws/purchases/', 'headers': [],
+                     'query_string': b'', 'subprotocols': [], 'user': user}
+
+            async def send(event):
+                if stalled and event['type'] == 'websocket.send':
+                    await stalled.wait()
+                await outbox.put(event)
+
+            task = asyncio.ensure_future(app(scope, inbox.get, send))
+            return inbox, outbox, task
+
+        async def frame(client):
+            return json.loads((await asyncio.wait_for(client[1].get(), 5))['text'])
+
+        async def scenario():
+            rejected = await connect(self.regular_user)
+            self.assertEqual((await rejected[1].get())['type'], 'websocket.close')
+
+            stalled = asyncio.Event()
+            admin, slow = await connect(self.admin_user), await connect(self.admin_user, stalled)
+            for client in (admin, slow):
+                self.assertEqual((await client[1].get())['type'], 'websocket.accept')
+
+            await sync_to_async(buy)(5)
+            first = await frame(admin)
+            self.assertEqual((first['count'], first['units'], first['revenue']), (5, 10, '1000.00'))
+            self.assertEqual((len(first['purchases']), first['dropped']), (3, 2))
+            self.assertEqual(first['purchases'][-1]['sweet'], 'Chocolate Bar')
+
+            # The slow socket is still on the first batch: the next two wait as one
+            await sync_to_async(buy)(1)
+            await sync_to_async(buy)(2)
+            self.assertEqual((await frame(admin))['count'], 1)
+            self.assertEqual((await frame(admin))['count'], 2)
+            stalled.set()
+            self.assertEqual(await frame(slow), first)
+            collapsed = await frame(slow)
+            self.assertEqual((collapsed['count'], collapsed['revenue']), (3, '600.00'))
+            self.assertEqual(len(collapsed['purchases']), 3)
+            self.assertTrue(slow[1].empty())
+
+            for client in (admin, slow):
+                client[0].put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+                await asyncio.wait_for(client[2], 5)
+
+        with patch('api.signals.tape', tape), patch.object(SalesTape, '_run'):
+            async_to_sync(scenario)()
+        self.assertEqual(tape.published, 3)
+
     def test_search_sweets(self):
         """Test search functionality"""
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.user_token}')
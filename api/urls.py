@@ -1,9 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    SweetViewSet, PurchaseView, RestockView,
+    SweetViewSet, PurchaseView, CheckoutView, RestockView,
     search_sweets, SweetStatsView, BulkOperationsView,
-    sweet_categories, DashboardView
+    sweet_categories, DashboardView, CacheStatsView
 )
 
 router = DefaultRouter()
@@ -15,6 +15,7 @@ urlpatterns = [
     # Specific operations
     path('sweets/<int:pk>/purchase/', PurchaseView.as_view(), name='purchase'),
     path('sweets/<int:pk>/restock/', RestockView.as_view(), name='restock'),
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
     
     # Search and categories
     path('sweets/search/advanced/', search_sweets, name='advanced-search'),
@@ -23,6 +24,7 @@ urlpatterns = [
     # Statistics and dashboard
     path('stats/', SweetStatsView.as_view(), name='sweet-stats'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
     
     # Bulk operations (admin)
     path('bulk-operations/', BulkOperationsView.as_view(), name='bulk-operations'),
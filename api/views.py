@@ -1,21 +1,36 @@
-from rest_framework import generics, permissions, filters, status
+from rest_framework import generics, permissions, filters, status, serializers
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum, Avg, Count, F
+from django.db.models import Sum
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from datetime import timedelta
 import math
 
-from .models import Sweet
+from .models import Sweet, PurchaseRecord, RestockRecord
+from . import ledger, summary
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .export import CSVRenderer, NDJSONRenderer, export_response
+from .importer import FORMATS as IMPORT_FORMATS, detect_format, import_sweets
+from .bulk import BulkOperation
+from .search import FullTextSearchFilter, search
+from .facets import search_facets, search_filters
+from .autocomplete import index as autocomplete_index, suggest_categories
+from .response_cache import (
+    cached_response, conditional_get, current_version, metrics as cache_metrics
+)
 from .serializers import (
-    SweetSerializer, SweetListSerializer, 
-    PurchaseSerializer, RestockSerializer,
-    SweetSearchSerializer, SweetStatsSerializer
+    SweetSerializer, SweetListSerializer, FastSweetListSerializer,
+    PurchaseSerializer, CheckoutSerializer, RestockSerializer,
+    SweetSearchSerializer, SweetStatsSerializer, BulkOperationSerializer
 )
 
 from .permissions import (
@@ -70,12 +85,24 @@ class SweetViewSet(ModelViewSet):
     queryset = Sweet.objects.all()
     permission_classes = [permissions.IsAuthenticated, ActionBasedPermission]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Full-text search ranks results, so it runs after OrderingFilter
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_fields = ['category', 'is_featured']
-    search_fields = ['name', 'description']
     ordering_fields = ['name', 'price', 'quantity', 'created_at', 'updated_at']
     ordering = ['-created_at']
     
+    @property
+    def paginator(self):
+        """
+        Page numbers by default; keyset pagination when a cursor is asked for.
+        """
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.requested(self.request):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
     def get_serializer_class(self):
         """
         Use different serializers for different actions.
@@ -88,7 +115,7 @@ class SweetViewSet(ModelViewSet):
         """
         Special permissions for specific actions.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_sweets']:
             return [permissions.IsAuthenticated(), IsAdminUser()]
         return [permissions.IsAuthenticated()]
     
@@ -102,7 +129,6 @@ class SweetViewSet(ModelViewSet):
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         available_only = self.request.query_params.get('available_only')
-        search_query = self.request.query_params.get('search', '')
         
         if min_price:
             queryset = queryset.filter(price__gte=float(min_price))
@@ -111,21 +137,63 @@ class SweetViewSet(ModelViewSet):
         if available_only and available_only.lower() == 'true':
             queryset = queryset.filter(quantity__gt=0)
         
-        # Advanced search
-        if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(category__icontains=search_query)
-            )
+        # ?search= is handled by FullTextSearchFilter
         
+        # ?fields= / ?exclude= also narrow the columns fetched
+        columns = self.get_serializer_class().sparse_columns(self.request)
+        if columns:
+            queryset = queryset.only(*columns)
         return queryset
     
+    def get_renderers(self):
+        """
+        Listings are float-free plain data, so they can be encoded by orjson.
+        """
+        renderers = super().get_renderers()
+        if self.action == 'list':
+            renderers = [
+                FastJSONRenderer() if type(renderer) is JSONRenderer else renderer
+                for renderer in renderers
+            ]
+        return renderers
+    
+    @method_decorator(conditional_get)
+    def list(self, request, *args, **kwargs):
+        """
+        List sweets, cached per query string and inventory version.
+        """
+        if isinstance(self.paginator, KeysetPagination) or not FastSweetListSerializer.supports():
+            build = super().list
+        else:
+            build = self.fast_list
+        return cached_response('sweet-list', request, lambda: build(request, *args, **kwargs))
+    
+    def fast_list(self, request, *args, **kwargs):
+        """
+        list() through FastSweetListSerializer: same response, built from
+        values_list() rows.
+        """
+        fast = FastSweetListSerializer(request)
+        queryset = fast.prepare(self.filter_queryset(self.get_queryset()))
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.to_representation(page))
+        return Response(fast.to_representation(queryset))
+    
+    @method_decorator(conditional_get)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional_get)
     def featured(self, request):
         """
         Get featured sweets.
         """
+        return cached_response('sweet-featured', request, self._featured)
+    
+    def _featured(self):
         featured_sweets = self.get_queryset().filter(is_featured=True, quantity__gt=0)
         page = self.paginate_queryset(featured_sweets)
         
@@ -136,7 +204,97 @@ class SweetViewSet(ModelViewSet):
         serializer = self.get_serializer(featured_sweets, many=True)
         return Response(serializer.data)
     
+    @action(
+        detail=False, methods=['get'],
+        renderer_classes=[JSONRenderer, NDJSONRenderer, CSVRenderer]
+    )
+    @method_decorator(conditional_get)
+    def export(self, request):
+        """
+        Stream every sweet matching the list filters as ?format=ndjson
+        (default), csv or json. Other formats fail content negotiation (404).
+        """
+        export_format = request.query_params.get('format', 'ndjson')
+        return export_response(self.filter_queryset(self.get_queryset()), request, export_format)
+    
+    @action(
+        detail=False, methods=['post'], url_path='import', url_name='import',
+        parser_classes=[MultiPartParser]
+    )
+    def import_sweets(self, request):
+        """
+        Bulk-create sweets from CSV or NDJSON (admin only), sent either as a
+        multipart `file` (optional `format` field) or as a raw text/csv or
+        application/x-ndjson body. Bad rows are reported and skipped.
+        """
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'Upload a file in the "file" field'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            stream = upload
+            file_format = request.data.get('format') or detect_format(upload.name, upload.content_type)
+        else:
+            # Read straight from the request body without buffering it
+            stream = request._request
+            file_format = detect_format(content_type=request.content_type)
+        
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {'error': f'Unsupported format. Use one of: {", ".join(IMPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            report = import_sweets(stream, file_format)
+        except UnicodeDecodeError:
+            return Response({'error': 'File must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if report['created']:
+            response_status = status.HTTP_201_CREATED
+        elif report['failed']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response(report, status=response_status)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Typo-tolerant name and category suggestions for ?q=, served from
+        the in-memory trigram index.
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        
+        autocomplete_index.warm()
+        if autocomplete_index.ready:
+            sweets = [
+                {'id': pk, 'name': name, 'category': category, 'score': score}
+                for score, pk, name, category in autocomplete_index.suggest(query, limit)
+            ]
+        else:
+            # Plain prefix lookup while the index is still loading
+            sweets = [
+                {**row, 'score': None}
+                for row in Sweet.objects.filter(name__istartswith=query.strip())
+                .order_by('name').values('id', 'name', 'category')[:limit]
+            ] if query.strip() else []
+        
+        return Response({
+            'query': query,
+            'sweets': sweets,
+            'categories': [
+                {'value': value, 'label': label, 'score': score}
+                for score, value, label in suggest_categories(query)
+            ],
+        })
+    
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional_get)
     def low_stock(self, request):
         """
         Get sweets with low stock (quantity <= 10).
@@ -146,6 +304,7 @@ class SweetViewSet(ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @method_decorator(conditional_get)
     def out_of_stock(self, request):
         """
         Get out of stock sweets.
@@ -183,52 +342,91 @@ class PurchaseView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request, pk):
-        sweet = get_object_or_404(Sweet, pk=pk)
-        
-        # Check if sweet is available
-        if not sweet.is_available:
-            return Response(
-                {'error': 'This sweet is out of stock'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        # No pre-read of the sweet: stock is checked and decremented by a
+        # single guarded UPDATE inside the serializer.
         serializer = PurchaseSerializer(
             data=request.data,
-            context={'sweet': sweet, 'request': request}
+            context={'sweet_id': pk, 'request': request}
         )
         
         if serializer.is_valid():
             try:
                 result = serializer.save()
-                
-                # Create purchase record (optional)
-                # PurchaseRecord.objects.create(
-                #     user=request.user,
-                #     sweet=sweet,
-                #     quantity=result['quantity'],
-                #     total_price=result['total_price']
-                # )
-                
-                return Response({
-                    'message': 'Purchase successful',
-                    'purchase_details': {
-                        'sweet': sweet.name,
-                        'quantity': result['quantity'],
-                        'total_price': float(result['total_price']),
-                        'remaining_stock': result['remaining_stock'],
-                        'purchased_at': timezone.now().isoformat(),
-                    }
-                }, status=status.HTTP_200_OK)
-                
-            except Exception as e:
-                return Response(
-                    {'error': str(e)},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            except serializers.ValidationError as e:
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Create purchase record (written in batches)
+            ledger.record_purchase(
+                user=request.user,
+                sweet=result['sweet'],
+                quantity=result['quantity'],
+                total_price=result['total_price']
+            )
+            
+            return Response({
+                'message': 'Purchase successful',
+                'purchase_details': {
+                    'sweet': result['sweet'].name,
+                    'quantity': result['quantity'],
+                    'total_price': float(result['total_price']),
+                    'remaining_stock': result['remaining_stock'],
+                    'purchased_at': timezone.now().isoformat(),
+                }
+            }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CheckoutView(APIView):
+    """
+    Purchase several sweets at once (all-or-nothing).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        serializer = CheckoutSerializer(
+            data=request.data,
+            context={'request': request}
+        )
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        result = serializer.save()
+        
+        if not result['success']:
+            return Response({
+                'error': 'Checkout failed, nothing was purchased',
+                'lines': result['lines'],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        for line in result['lines']:
+            ledger.record_purchase(
+                user=request.user,
+                sweet=line['sweet'],
+                quantity=line['quantity'],
+                total_price=line['total_price']
+            )
+        
+        return Response({
+            'message': 'Checkout successful',
+            'checkout_details': {
+                'lines': [
+                    {
+                        'sweet_id': line['sweet'].pk,
+                        'sweet': line['sweet'].name,
+                        'quantity': line['quantity'],
+                        'total_price': float(line['total_price']),
+                        'remaining_stock': line['remaining_stock'],
+                    }
+                    for line in result['lines']
+                ],
+                'total_price': float(result['total_price']),
+                'purchased_at': timezone.now().isoformat(),
+            }
+        }, status=status.HTTP_200_OK)
+
+
 class RestockView(APIView):
     """
     Restock a sweet (increase quantity).
@@ -247,13 +445,13 @@ class RestockView(APIView):
             try:
                 result = serializer.save()
                 
-                # Create restock record (optional)
-                # RestockRecord.objects.create(
-                #     user=request.user,
-                #     sweet=sweet,
-                #     quantity=result['quantity'],
-                #     reason=result.get('reason', '')
-                # )
+                # Create restock record (written in batches)
+                ledger.record_restock(
+                    user=request.user,
+                    sweet=sweet,
+                    quantity=result['quantity'],
+                    reason=result.get('reason', '')
+                )
                 
                 return Response({
                     'message': 'Restock successful',
@@ -277,6 +475,7 @@ class RestockView(APIView):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional_get
 def search_sweets(request):
     """
     Advanced search for sweets.
@@ -292,36 +491,39 @@ def search_sweets(request):
     queryset = Sweet.objects.all()
     
     # Apply filters
+    # Name search ranks by relevance unless sort_by is given
+    ranked = bool(data.get('name')) and 'sort_by' not in request.query_params
     if data.get('name'):
-        queryset = queryset.filter(name__icontains=data['name'])
-    
-    if data.get('category'):
-        queryset = queryset.filter(category=data['category'])
-    
-    if data.get('min_price'):
-        queryset = queryset.filter(price__gte=data['min_price'])
-    
-    if data.get('max_price'):
-        queryset = queryset.filter(price__lte=data['max_price'])
+        queryset = search(queryset, data['name'], name_only=True, rank=ranked)
     
-    if data.get('available_only'):
-        queryset = queryset.filter(quantity__gt=0)
+    # Category, price, stock and featured filters (shared with the facets)
+    queryset = queryset.filter(*search_filters(data).values())
     
-    if data.get('is_featured'):
-        queryset = queryset.filter(is_featured=True)
+    columns = SweetListSerializer.sparse_columns(request)
+    if columns:
+        queryset = queryset.only(*columns)
     
     # Apply sorting
     sort_by = data.get('sort_by', '-created_at')
-    queryset = queryset.order_by(sort_by)
+    if not ranked:
+        queryset = queryset.order_by(sort_by)
     
-    # Pagination
-    paginator = PageNumberPagination()
-    paginator.page_size = 20
+    # Pagination (keyset on request, see KeysetPagination)
+    if KeysetPagination.requested(request):
+        paginator = KeysetPagination()
+        paginator.ordering_param = 'sort_by'
+        paginator.default_ordering = sort_by
+    else:
+        paginator = PageNumberPagination()
+        paginator.page_size = 20
     page = paginator.paginate_queryset(queryset, request)
     
     if page is not None:
         serializer = SweetListSerializer(page, many=True, context={'request': request})
-        return paginator.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if data.get('facets'):
+            response.data['facets'] = search_facets(data)
+        return response
     
     serializer = SweetListSerializer(queryset, many=True, context={'request': request})
     return Response(serializer.data)
@@ -333,66 +535,13 @@ class SweetStatsView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    @method_decorator(conditional_get)
     def get(self, request):
-        # Basic stats
-        total_sweets = Sweet.objects.count()
-        total_value = Sweet.objects.aggregate(
-            total=Sum(F('price') * F('quantity'))
-        )['total'] or 0
-        
-        average_price = Sweet.objects.aggregate(
-            avg=Avg('price')
-        )['avg'] or 0
-        
-        total_quantity = Sweet.objects.aggregate(
-            total=Sum('quantity')
-        )['total'] or 0
-        
-        # Stock status
-        out_of_stock = Sweet.objects.filter(quantity=0).count()
-        low_stock = Sweet.objects.filter(quantity__range=(1, 10)).count()
-        in_stock = Sweet.objects.filter(quantity__gt=10).count()
-        
-        # By category
-        by_category = Sweet.objects.values('category').annotate(
-            count=Count('id'),
-            total_quantity=Sum('quantity'),
-            total_value=Sum(F('price') * F('quantity'))
-        ).order_by('-total_value')
-        
-        # Recent additions (last 7 days)
-        week_ago = timezone.now() - timedelta(days=7)
-        recent_additions = Sweet.objects.filter(created_at__gte=week_ago).count()
-        
-        # Most valuable sweets
-        most_valuable = Sweet.objects.annotate(
-            item_value=F('price') * F('quantity')
-        ).order_by('-item_value')[:5]
-        
-        most_valuable_data = [
-            {
-                'id': sweet.id,
-                'name': sweet.name,
-                'category': sweet.category,
-                'value': float(sweet.price * sweet.quantity)
-            }
-            for sweet in most_valuable
-        ]
-        
-        stats = {
-            'total_sweets': total_sweets,
-            'total_value': float(total_value),
-            'average_price': float(average_price),
-            'total_quantity': total_quantity,
-            'stock_status': {
-                'out_of_stock': out_of_stock,
-                'low_stock': low_stock,
-                'in_stock': in_stock,
-            },
-            'by_category': list(by_category),
-            'recent_additions_7_days': recent_additions,
-            'most_valuable_sweets': most_valuable_data,
-        }
+        return cached_response('sweet-stats', request, self.build)
+    
+    def build(self):
+        # Maintained totals from InventorySummary, plus top 5
+        stats = summary.summary_stats(top_n=5)
         
         serializer = SweetStatsSerializer(stats)
         return Response(serializer.data)
@@ -401,59 +550,20 @@ class SweetStatsView(APIView):
 class BulkOperationsView(APIView):
     """
     Perform bulk operations on sweets (admin only).
+    
+    Set-based and transactional per batch, with a result for every
+    requested id (see api.bulk).
     """
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
     
     def post(self, request):
-        operation = request.data.get('operation')
-        sweet_ids = request.data.get('sweet_ids', [])
-        quantity = request.data.get('quantity', 0)
-        
-        if not operation or not sweet_ids:
-            return Response(
-                {'error': 'Operation and sweet_ids are required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        serializer = BulkOperationSerializer(data=request.data)
         
-        sweets = Sweet.objects.filter(id__in=sweet_ids)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        if operation == 'restock':
-            if quantity <= 0:
-                return Response(
-                    {'error': 'Quantity must be positive for restock'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            updated = sweets.update(quantity=F('quantity') + quantity)
-            
-            return Response({
-                'message': f'Restocked {updated} sweet(s) by {quantity} units each',
-                'updated_count': updated
-            })
-        
-        elif operation == 'clear_stock':
-            updated = sweets.update(quantity=0)
-            
-            return Response({
-                'message': f'Cleared stock for {updated} sweet(s)',
-                'updated_count': updated
-            })
-        
-        elif operation == 'delete':
-            # Only delete sweets with zero stock
-            deletable = sweets.filter(quantity=0)
-            deleted_count = deletable.count()
-            deletable.delete()
-            
-            return Response({
-                'message': f'Deleted {deleted_count} sweet(s) with zero stock',
-                'deleted_count': deleted_count
-            })
-        
-        return Response(
-            {'error': 'Invalid operation'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        report = BulkOperation(**serializer.validated_data).run()
+        return Response(report)
 
 
 @api_view(['GET'])
@@ -463,10 +573,23 @@ def sweet_categories(request):
     Get all available sweet categories.
     """
     categories = Sweet.Category.choices
-    return Response([
+    return cached_response('sweet-categories', request, lambda: Response([
         {'value': value, 'label': label}
         for value, label in categories
-    ])
+    ]))
+
+
+class CacheStatsView(APIView):
+    """
+    Response cache hit/miss counters for this process (admin only).
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    
+    def get(self, request):
+        return Response({
+            'inventory_version': current_version(),
+            'endpoints': cache_metrics.snapshot(),
+        })
 
 
 class DashboardView(APIView):
@@ -486,41 +609,55 @@ class DashboardView(APIView):
         
         # Today's date
         today = timezone.now().date()
+        start_of_today = timezone.localtime().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
         
-        # Recent purchases (if you have PurchaseRecord model)
-        # recent_purchases = PurchaseRecord.objects.filter(
-        #     purchased_at__date=today
-        # ).count()
-        
-        # Recent restocks (if you have RestockRecord model)
-        # recent_restocks = RestockRecord.objects.filter(
-        #     restocked_at__date=today
-        # ).count()
-        
-        # Low stock alert
-        low_stock_count = Sweet.objects.filter(quantity__range=(1, 10)).count()
-        out_of_stock_count = Sweet.objects.filter(quantity=0).count()
-        
-        # Total inventory value
-        total_value = Sweet.objects.aggregate(
-            total=Sum(F('price') * F('quantity'))
-        )['total'] or 0
-        
-        # Top selling sweets (if you have sales data)
-        # top_selling = Sweet.objects.annotate(
-        #     total_sold=Sum('purchaserecord__quantity')
-        # ).order_by('-total_sold')[:5]
+        # Make this process's buffered ledger rows visible
+        ledger.flush()
+        
+        # Today's purchases and restocks (range scans on the created_at index)
+        recent_purchases = PurchaseRecord.objects.filter(
+            created_at__gte=start_of_today
+        ).count()
+        
+        recent_restocks = RestockRecord.objects.filter(
+            created_at__gte=start_of_today
+        ).count()
+        
+        # Stock alerts and inventory totals from InventorySummary
+        stats = summary.summary_stats(top_n=0, recent=False)
+        
+        # Top selling sweets over the last 30 days
+        top_selling = list(
+            PurchaseRecord.objects.filter(
+                created_at__gte=start_of_today - timedelta(days=30)
+            ).values('sweet_id').annotate(
+                total_sold=Sum('quantity'),
+                revenue=Sum('total_price')
+            ).order_by('-total_sold')[:5]
+        )
+        names = Sweet.objects.only('name').in_bulk([row['sweet_id'] for row in top_selling])
+        top_selling_data = [
+            {
+                'id': row['sweet_id'],
+                'name': names[row['sweet_id']].name if row['sweet_id'] in names else None,
+                'total_sold': row['total_sold'],
+                'revenue': float(row['revenue']),
+            }
+            for row in top_selling
+        ]
         
         return Response({
             'today': today.isoformat(),
             'alerts': {
-                'low_stock': low_stock_count,
-                'out_of_stock': out_of_stock_count,
+                'low_stock': stats['stock_status']['low_stock'],
+                'out_of_stock': stats['stock_status']['out_of_stock'],
             },
-            'inventory_value': float(total_value),
-            'total_sweets': Sweet.objects.count(),
-            'total_available': Sweet.objects.filter(quantity__gt=0).count(),
-            # 'today_purchases': recent_purchases,
-            # 'today_restocks': recent_restocks,
-            # 'top_selling': top_selling_data,
-        })
\ No newline at end of file
+            'inventory_value': float(stats['total_value']),
+            'total_sweets': stats['total_sweets'],
+            'total_available': stats['total_available'],
+            'today_purchases': recent_purchases,
+            'today_restocks': recent_restocks,
+            'top_selling': top_selling_data,
+        })
@@ -25,6 +25,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sweet_shop.settings')
 # Initialize Django ASGI application early for Django models to work
 django_asgi_app = get_asgi_application()
 
+# Load the in-memory autocomplete index before serving requests
+from api.autocomplete import preload
+preload()
+
 # Import WebSocket routing (optional - for real-time features)
 try:
     from api.routing import websocket_urlpatterns
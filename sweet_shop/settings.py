@@ -73,7 +73,7 @@ ROOT_URLCONF = 'sweet_shop.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -281,18 +281,42 @@ LOGGING = {
 # ASGI/WebSocket Configuration
 ASGI_APPLICATION = 'sweet_shop.asgi.application'
 
-# Channels configuration (if using WebSockets)
+# Channels configuration (if using WebSockets). Channels live in each
+# worker process; `manage.py channel_broker` links the processes of one
+# host over a Unix socket (see api.channel_layer) and must run whenever
+# there is more than one worker process. For several hosts, use Redis:
+#     'BACKEND': 'channels_redis.core.RedisChannelLayer',
+#     'CONFIG': {"hosts": [('127.0.0.1', 6379)]},
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        # For production, use Redis:
-        # 'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        # 'CONFIG': {
-        #     "hosts": [('127.0.0.1', 6379)],
-        # },
+        'BACKEND': 'api.channel_layer.BrokerChannelLayer',
+        'CONFIG': {
+            # In a private (0700) directory, never a shared one like /tmp
+            'path': os.getenv('CHANNEL_BROKER_SOCKET', os.path.join(
+                os.getenv('XDG_RUNTIME_DIR') or str(BASE_DIR / '.run'), 'sweet-shop', 'channels.sock'
+            )),
+        },
     },
 }
 
+# Inventory updates for WebSocket clients are coalesced per sweet and sent
+# once per interval (seconds, 0 = send every change immediately)
+INVENTORY_PUBLISH_INTERVAL = float(os.getenv('INVENTORY_PUBLISH_INTERVAL', '0.25'))
+
+# Most sweets in one inventory stream snapshot (a subscription to more gets
+# the first ones, flagged as truncated, and deltas for the rest)
+INVENTORY_SNAPSHOT_LIMIT = int(os.getenv('INVENTORY_SNAPSHOT_LIMIT', '1000'))
+
+# Snapshots per second the inventory sockets of one process may take to
+# recover from dropped updates
+INVENTORY_RESYNC_RATE = float(os.getenv('INVENTORY_RESYNC_RATE', '20'))
+
+# Admin sales tape (ws/purchases/): purchases are sent in one batch per
+# interval (seconds, 0 = every purchase immediately), listing at most
+# PURCHASE_TAPE_MAX_EVENTS of them besides the totals
+PURCHASE_TAPE_INTERVAL = float(os.getenv('PURCHASE_TAPE_INTERVAL', '0.2'))
+PURCHASE_TAPE_MAX_EVENTS = int(os.getenv('PURCHASE_TAPE_MAX_EVENTS', '200'))
+
 # Daphne/ASGI server settings
 DAPHNE = {
     'ENDPOINT': 'tcp:port=8001:interface=0.0.0.0',
@@ -319,6 +343,68 @@ ADMINS = [
 # Frontend URL for email links
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
 
+# Purchase/restock ledger: rows are buffered and written with bulk_create
+LEDGER_BATCH_SIZE = int(os.getenv('LEDGER_BATCH_SIZE', '200'))
+LEDGER_FLUSH_INTERVAL = float(os.getenv('LEDGER_FLUSH_INTERVAL', '1.0'))  # seconds, 0 = write-through
+# Failed writes are retried with a growing delay; after LEDGER_MAX_RETRIES
+# the batch is logged and dropped, and at most LEDGER_MAX_PENDING rows wait
+LEDGER_MAX_RETRIES = int(os.getenv('LEDGER_MAX_RETRIES', '10'))
+LEDGER_MAX_PENDING = int(os.getenv('LEDGER_MAX_PENDING', '10000'))
+
+# Catalogue export: rows fetched per database round trip and bytes per
+# streamed chunk; together they bound the export's memory use
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_BUFFER_SIZE = int(os.getenv('EXPORT_BUFFER_SIZE', str(64 * 1024)))
+
+# Bulk import: rows validated, duplicate-checked and inserted per batch
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '2000'))
+
+# Bulk operations: ids changed per statement (and per transaction)
+BULK_OPERATION_BATCH_SIZE = int(os.getenv('BULK_OPERATION_BATCH_SIZE', '500'))
+
+# Admin change list: filtered lists on larger tables show PostgreSQL's
+# row estimate instead of running COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', '100000'))
+
+# In-memory autocomplete index: reloaded in the background after this many
+# seconds so writes made by other worker processes show up (0 = never)
+AUTOCOMPLETE_MAX_AGE = int(os.getenv('AUTOCOMPLETE_MAX_AGE', '300'))
+# Load it while the server starts (wsgi.py / asgi.py) rather than on the
+# first autocomplete request
+AUTOCOMPLETE_PRELOAD = os.getenv('AUTOCOMPLETE_PRELOAD', 'True') == 'True'
+
+# Response cache for read-heavy endpoints (api.response_cache). 'locmem'
+# keeps entries per process; use 'file' to share them between several
+# worker processes on one host. The inventory version that invalidates them
+# is always kept in files (RESPONSE_CACHE_VERSION_DIR), so a write in one
+# worker reaches every other.
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': (
+            'django.core.cache.backends.filebased.FileBasedCache'
+            if RESPONSE_CACHE_BACKEND == 'file'
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_DIR', str(BASE_DIR / '.cache' / 'responses'))
+        if RESPONSE_CACHE_BACKEND == 'file' else 'responses',
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TTL', '300')),  # seconds
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    'response_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('RESPONSE_CACHE_VERSION_DIR',
+                              str(BASE_DIR / '.cache' / 'response-versions')),
+        'TIMEOUT': None,
+    },
+}
+
 # Security settings for production
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
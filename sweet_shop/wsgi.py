@@ -22,6 +22,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sweet_shop.settings')
 # Initialize Django application
 application = get_wsgi_application()
 
+# Load the in-memory autocomplete index before serving requests
+from api.autocomplete import preload
+preload()
+
 # Optional: Import and initialize Sentry for error tracking (if installed)
 try:
     import sentry_sdk
@@ -0,0 +1,154 @@
+"""
+Runner for queued user side effects (UserJob).
+
+Jobs are claimed in batches and executed on a thread pool. Each worker
+thread keeps one SMTP connection open for the whole batch; registration
+log entries are written together with bulk_create afterwards.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.admin.models import LogEntry
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import UserJob
+from .signals import send_welcome_email, send_deactivation_email, log_user_activity
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+# Wait before retrying a failed job, doubled after every further failure
+RETRY_DELAY = timedelta(seconds=30)
+
+# Jobs left 'running' this long (crashed worker) are picked up again
+STALE_AFTER = timedelta(minutes=10)
+
+
+class MailConnectionPool:
+    """
+    One open e-mail connection per worker thread, closed together.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._opened.append(connection)
+        return connection
+
+    def discard(self):
+        """Drop this thread's connection (e.g. after the server hung up)."""
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for connection in opened:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+HANDLERS = {
+    UserJob.Kind.WELCOME: send_welcome_email,
+    UserJob.Kind.DEACTIVATION: send_deactivation_email,
+}
+
+
+def claim_jobs(batch_size):
+    """Mark up to `batch_size` open jobs that are due as running and return them."""
+    now = timezone.now()
+    open_jobs = UserJob.objects.filter(
+        Q(status=UserJob.Status.PENDING, run_after__lte=now) |
+        Q(status=UserJob.Status.RUNNING, started_at__lt=now - STALE_AFTER)
+    )
+    with transaction.atomic():
+        jobs = list(
+            open_jobs.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user').order_by('created_at')[:batch_size]
+        )
+        UserJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=UserJob.Status.RUNNING,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def retry_delay(attempts):
+    """How long a job that has failed `attempts` times waits before the next try."""
+    return RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def run_pending_jobs(workers=4, batch_size=100):
+    """
+    Run one batch of jobs. Returns (succeeded, failed) counts.
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return 0, 0
+
+    pool = MailConnectionPool()
+
+    def run(job):
+        try:
+            HANDLERS[job.kind](job.user, connection=pool.get())
+            return None
+        except Exception as e:
+            pool.discard()
+            return str(e) or e.__class__.__name__
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(run, jobs))
+    finally:
+        pool.close_all()
+
+    now = timezone.now()
+    done = [job for job, error in zip(jobs, errors) if error is None]
+
+    LogEntry.objects.bulk_create([
+        log_user_activity(job.user) for job in done if job.kind == UserJob.Kind.WELCOME
+    ])
+    UserJob.objects.filter(pk__in=[job.pk for job in done]).update(
+        status=UserJob.Status.DONE, finished_at=now, last_error=''
+    )
+
+    failed = 0
+    for job, error in zip(jobs, errors):
+        if error is None:
+            continue
+        failed += 1
+        give_up = job.attempts >= MAX_ATTEMPTS
+        UserJob.objects.filter(pk=job.pk).update(
+            status=UserJob.Status.FAILED if give_up else UserJob.Status.PENDING,
+            finished_at=now if give_up else None,
+            run_after=now + retry_delay(job.attempts),
+            last_error=error,
+        )
+        logger.error(f"User job {job.pk} ({job.kind}) failed: {error}")
+
+    return len(done), failed
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued user jobs (welcome / deactivation e-mails)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker threads (each keeps one SMTP connection)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Jobs claimed per batch')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, polling every --interval seconds '
+                                 '(failed jobs are retried with a growing delay)')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Polling interval with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            succeeded, failed = run_pending_jobs(
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+            if succeeded or failed:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Ran {succeeded} job(s), {failed} failed'
+                ))
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
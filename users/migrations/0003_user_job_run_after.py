@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 04:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userjob',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='run after'),
+        ),
+    ]
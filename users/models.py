@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class CustomUser(AbstractUser):
@@ -100,4 +101,66 @@ class CustomUser(AbstractUser):
         
         # Ensure email is unique (handled by unique constraint, but explicit check)
         if CustomUser.objects.filter(email=self.email).exclude(pk=self.pk).exists():
-            raise ValidationError({'email': 'A user with this email already exists.'})
\ No newline at end of file
+            raise ValidationError({'email': 'A user with this email already exists.'})
+
+class UserJob(models.Model):
+    """
+    Queued side effect of a user change (e.g. welcome e-mail).
+    
+    Signal handlers only INSERT a row; `manage.py run_user_jobs` runs the
+    jobs on a thread pool so request latency never depends on SMTP.
+    """
+    
+    class Kind(models.TextChoices):
+        WELCOME = 'welcome', _('Welcome e-mail and registration log')
+        DEACTIVATION = 'deactivation', _('Deactivation e-mail')
+    
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+    
+    kind = models.CharField(_('kind'), max_length=20, choices=Kind.choices)
+    
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name=_('user')
+    )
+    
+    status = models.CharField(
+        _('status'),
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    
+    last_error = models.TextField(_('last error'), blank=True)
+    
+    created_at = models.DateTimeField(_('created at'), default=timezone.now)
+    
+    # Not claimed before this time (set after a failed attempt)
+    run_after = models.DateTimeField(_('run after'), default=timezone.now)
+    
+    started_at = models.DateTimeField(_('started at'), null=True, blank=True)
+    
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('user job')
+        verbose_name_plural = _('user jobs')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='users_userjob_open_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} for user {self.user_id} ({self.status})"
@@ -2,11 +2,14 @@ from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.conf import settings
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.utils.html import strip_tags
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import logging
+from functools import lru_cache
+
+from .models import UserJob
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -41,8 +44,8 @@ def user_post_save(sender, instance, created, **kwargs):
     Signal triggered after a User is saved.
     """
     if created:
-        # Send welcome email to new user
-        send_welcome_email(instance)
+        # Queue welcome email and registration log (run by manage.py run_user_jobs)
+        UserJob.objects.create(kind=UserJob.Kind.WELCOME, user=instance)
         
         # Log user creation
         logger.info(f"New user created: {instance.email} (ID: {instance.id})")
@@ -59,72 +62,72 @@ def user_post_save(sender, instance, created, **kwargs):
             # Log deactivation
             logger.warning(f"User deactivated: {instance.email}")
             
-            # Send deactivation email
-            send_deactivation_email(instance)
+            # Queue deactivation email
+            UserJob.objects.create(kind=UserJob.Kind.DEACTIVATION, user=instance)
+
 
+@lru_cache(maxsize=None)
+def get_email_template(name):
+    """Load and compile an e-mail template once per process."""
+    return get_template(name)
 
-def send_welcome_email(user):
+
+def send_welcome_email(user, connection=None):
     """
     Send welcome email to new user.
+    Raises on failure so the job runner can retry.
     """
-    try:
-        subject = 'Welcome to Sweet Shop Management System! 🍬'
-        
-        # HTML content
-        html_message = render_to_string('emails/welcome_email.html', {
-            'user': user,
-            'site_name': 'Sweet Shop',
-            'current_year': timezone.now().year,
-            'login_url': f"{settings.FRONTEND_URL}/login" if hasattr(settings, 'FRONTEND_URL') else '#',
-        })
-        
-        # Plain text version
-        plain_message = strip_tags(html_message)
-        
-        # Send email
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        
-        logger.info(f"Welcome email sent to {user.email}")
-        
-    except Exception as e:
-        logger.error(f"Failed to send welcome email to {user.email}: {str(e)}")
+    subject = 'Welcome to Sweet Shop Management System! 🍬'
+    
+    # HTML content
+    html_message = get_email_template('emails/welcome_email.html').render({
+        'user': user,
+        'site_name': 'Sweet Shop',
+        'current_year': timezone.now().year,
+        'login_url': f"{settings.FRONTEND_URL}/login" if hasattr(settings, 'FRONTEND_URL') else '#',
+    })
+    
+    # Plain text version
+    plain_message = strip_tags(html_message)
+    
+    # Send email
+    send_mail(
+        subject=subject,
+        message=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+        html_message=html_message,
+        connection=connection,
+    )
+    
+    logger.info(f"Welcome email sent to {user.email}")
 
 
-def send_deactivation_email(user):
+def send_deactivation_email(user, connection=None):
     """
     Send email when user is deactivated.
+    Raises on failure so the job runner can retry.
     """
-    try:
-        subject = 'Your Sweet Shop Account Has Been Deactivated'
-        
-        html_message = render_to_string('emails/deactivation_email.html', {
-            'user': user,
-            'site_name': 'Sweet Shop',
-            'contact_email': settings.CONTACT_EMAIL if hasattr(settings, 'CONTACT_EMAIL') else 'support@sweetshop.com',
-        })
-        
-        plain_message = strip_tags(html_message)
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        
-        logger.info(f"Deactivation email sent to {user.email}")
-        
-    except Exception as e:
-        logger.error(f"Failed to send deactivation email to {user.email}: {str(e)}")
+    subject = 'Your Sweet Shop Account Has Been Deactivated'
+    
+    html_message = get_email_template('emails/deactivation_email.html').render({
+        'user': user,
+        'site_name': 'Sweet Shop',
+        'contact_email': settings.CONTACT_EMAIL if hasattr(settings, 'CONTACT_EMAIL') else 'support@sweetshop.com',
+    })
+    
+    plain_message = strip_tags(html_message)
+    
+    send_mail(
+        subject=subject,
+        message=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+        html_message=html_message,
+        connection=connection,
+    )
+    
+    logger.info(f"Deactivation email sent to {user.email}")
 
 
 def create_user_profile(user):
@@ -140,26 +143,23 @@ def create_user_profile(user):
         logger.error(f"Failed to create profile for user {user.email}: {str(e)}")
 
 
-@receiver(post_save, sender=User)
-def log_user_activity(sender, instance, created, **kwargs):
+def log_user_activity(user):
     """
-    Log user activity for audit trail.
+    Build the admin log entry for a registration (audit trail).
+    Returned unsaved so the job runner can bulk_create a batch of them.
     """
-    from django.contrib.admin.models import LogEntry, ADDITION, CHANGE
+    from django.contrib.admin.models import LogEntry, ADDITION
     from django.contrib.contenttypes.models import ContentType
     
-    if created:
-        # Log user creation in admin log
-        LogEntry.objects.log_action(
-            user_id=instance.pk if instance.pk else 1,
-            content_type_id=ContentType.objects.get_for_model(User).pk,
-            object_id=instance.pk,
-            object_repr=str(instance),
-            action_flag=ADDITION,
-            change_message='User created via registration'
-        )
-    
     # Note: For updates, Django admin already logs changes
+    return LogEntry(
+        user_id=user.pk,
+        content_type_id=ContentType.objects.get_for_model(User).pk,  # cached
+        object_id=str(user.pk),
+        object_repr=str(user)[:200],
+        action_flag=ADDITION,
+        change_message='User created via registration'
+    )
 
 
 # Email templates directory (create this)
@@ -3,6 +3,12 @@ from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.contrib.admin.models import LogEntry
+from django.core import mail
+from django.utils import timezone
+from unittest.mock import Mock, patch
+from .models import UserJob
+from .jobs import HANDLERS, RETRY_DELAY, run_pending_jobs
 
 User = get_user_model()
 
@@ -99,4 +105,48 @@ class UserTests(APITestCase):
         }
         response = self.client.post(self.register_url, data)
         
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_registration_side_effects_are_queued(self):
+        """Test welcome email is queued, then sent by the job runner"""
+        user = User.objects.create_user(
+            email='queued@example.com',
+            username='queued',
+            password='testpass123'
+        )
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            UserJob.objects.get(user=user).status, UserJob.Status.PENDING
+        )
+        
+        self.assertEqual(run_pending_jobs(workers=2), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['queued@example.com'])
+        self.assertTrue(LogEntry.objects.filter(object_id=str(user.pk)).exists())
+        self.assertEqual(UserJob.objects.get(user=user).status, UserJob.Status.DONE)
+    
+    def test_failed_jobs_are_retried_after_a_growing_delay(self):
+        """Test a failed job waits before it is claimed again, then gives up"""
+        user = User.objects.create_user(
+            email='retry@example.com',
+            username='retry',
+            password='testpass123'
+        )
+        job = UserJob.objects.get(user=user)
+        
+        with patch.dict(HANDLERS, {UserJob.Kind.WELCOME: Mock(side_effect=OSError('SMTP down'))}):
+            self.assertEqual(run_pending_jobs(), (0, 1))
+            job.refresh_from_db()
+            self.assertEqual(job.status, UserJob.Status.PENDING)
+            self.assertGreater(job.run_after, timezone.now() + RETRY_DELAY / 2)
+            # Not due yet: the next batch does not take it
+            self.assertEqual(run_pending_jobs(), (0, 0))
+            
+            UserJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(run_pending_jobs(), (0, 1))
+            job.refresh_from_db()
+            self.assertGreater(job.run_after, timezone.now() + RETRY_DELAY * 3 / 2)
+            
+            UserJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(run_pending_jobs(), (0, 1))
+        self.assertEqual(UserJob.objects.get(pk=job.pk).status, UserJob.Status.FAILED)